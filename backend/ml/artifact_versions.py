@@ -0,0 +1,297 @@
+# backend/ml/artifact_versions.py
+# Immutable version directories for the run_model.py artifacts, published by
+# switching one pointer file.
+#
+#   models/versions/.staging-<pid>-<n>/   being written by `train` / `update`
+#   models/versions/<version>/            published; never written again
+#   models/CURRENT                        {"version", "action", "at"} of the served directory
+#
+# A version directory holds every <model>.joblib, metrics.json,
+# serving_manifest.json, the `update` reservoir (reservoir.npz), the mmap/
+# copies when ML_MMAP_MODELS=1, and a manifest.json with the SHA-256 of each
+# file. Publishing renames the
+# finished staging directory to its version number and then replaces CURRENT
+# with os.replace, so a reader sees the old set of models or the new one,
+# never a mix or a half-written pickle. `update` hard-links the unchanged
+# files of the current version into its staging directory. Every file is
+# written as tmp + rename, so the linked inodes are never modified.
+#
+# Everything that reads the current version to build the next one, and every
+# move of CURRENT, runs inside publishing(): a lock shared by the threads of
+# a process and, through models/versions/.lock, by other processes. Two
+# updates therefore never start from the same base.
+#
+# Rollback only moves CURRENT, so it also restores that version's reservoir.
+# The newest ML_KEEP_VERSIONS directories (default 3) are kept, plus the
+# current one.
+# Before the first publish there is no CURRENT and the flat models/*.joblib
+# layout is served as before.
+#
+#   python artifact_versions.py list
+#   python artifact_versions.py rollback [--to 12]
+import os
+import sys
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows): only the threads of one process are serialized
+    fcntl = None
+
+MODELS_DIR = Path(__file__).parent / "models"
+VERSIONS_DIR = MODELS_DIR / "versions"
+CURRENT_PATH = MODELS_DIR / "CURRENT"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_KEEP_VERSIONS = 3
+DEFAULT_RELOAD_INTERVAL_S = 1.0
+LOCK_PATH = VERSIONS_DIR / ".lock"
+
+_LOCK = threading.RLock()
+_lock_depth = 0
+_lock_file = None
+
+
+def keep_versions():
+    return int(os.environ.get("ML_KEEP_VERSIONS", DEFAULT_KEEP_VERSIONS))
+
+
+@contextmanager
+def publishing():
+    """Serializes train, update, export and rollback across threads and processes; reentrant"""
+    global _lock_depth, _lock_file
+    with _LOCK:
+        if _lock_depth == 0 and fcntl is not None:
+            VERSIONS_DIR.mkdir(parents=True, exist_ok=True)
+            _lock_file = open(LOCK_PATH, "a")
+            fcntl.flock(_lock_file, fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if _lock_depth == 0 and _lock_file is not None:
+                fcntl.flock(_lock_file, fcntl.LOCK_UN)
+                _lock_file.close()
+                _lock_file = None
+
+
+def _write_json(path, data):
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, indent=2))
+    os.replace(tmp, path)
+
+
+def current():
+    """The CURRENT pointer, or None before the first publish"""
+    try:
+        pointer = json.loads(CURRENT_PATH.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    return pointer if version_dir(pointer["version"]).is_dir() else None
+
+
+def version_dir(version):
+    return VERSIONS_DIR / str(int(version))
+
+
+def current_dir():
+    """Directory the served artifacts are read from"""
+    pointer = current()
+    return version_dir(pointer["version"]) if pointer else MODELS_DIR
+
+
+def published():
+    """Published version numbers, oldest first"""
+    if not VERSIONS_DIR.is_dir():
+        return []
+    return sorted(int(p.name) for p in VERSIONS_DIR.iterdir() if p.is_dir() and p.name.isdigit())
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _versioned(path):
+    return path.is_file() and (path.suffix == ".joblib" or
+                               path.name in ("metrics.json", "serving_manifest.json", "reservoir.npz"))
+
+
+def stage(base=None):
+    """A new staging directory; with base, pre-filled with links to base's artifacts"""
+    VERSIONS_DIR.mkdir(parents=True, exist_ok=True)
+    for n in range(1000):
+        path = VERSIONS_DIR / f".staging-{os.getpid()}-{n}"
+        try:
+            path.mkdir()
+        except FileExistsError:
+            continue
+        if base is None:
+            return path
+        for src in Path(base).iterdir():
+            if _versioned(src):
+                _link_or_copy(src, path / src.name)
+        # mmap copies of the carried-over artifacts only (the flat models/mmap
+        # also holds the copies of the train_models.py pickles)
+        for src in sorted((Path(base) / "mmap").glob("*.joblib")):
+            if (path / src.name).exists():
+                (path / "mmap").mkdir(exist_ok=True)
+                _link_or_copy(src, path / "mmap" / src.name)
+        return path
+    raise RuntimeError(f"Could not create a staging directory in {VERSIONS_DIR}")
+
+
+def discard(staging):
+    shutil.rmtree(staging, ignore_errors=True)
+
+
+def publish(staging, version, action):
+    """Seal staging as version `version` and point CURRENT at it; call inside publishing()"""
+    from model_registry import file_sha256
+    staging = Path(staging)
+    files = {p.relative_to(staging).as_posix(): file_sha256(p)
+             for p in sorted(staging.rglob("*")) if p.is_file()}
+    _write_json(staging / MANIFEST_NAME, {"version": int(version), "action": action,
+                                           "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": files})
+    target = version_dir(version)
+    # fails rather than overwriting a published directory
+    os.rename(staging, target)
+    _point(version, action)
+    prune()
+    return target
+
+
+def _point(version, action):
+    pointer = {"version": int(version), "action": action, "at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    _write_json(CURRENT_PATH, pointer)
+    return pointer
+
+
+def rollback(to=None):
+    """Point CURRENT at version `to`, by default the newest published version before the current one"""
+    with publishing():
+        return _rollback(to)
+
+
+def _rollback(to):
+    pointer = current()
+    versions = published()
+    if to is None:
+        if not pointer:
+            raise ValueError("Nothing to roll back: no version has been published")
+        older = [v for v in versions if v < pointer["version"]]
+        if not older:
+            raise ValueError(f"No version older than {pointer['version']} is kept (ML_KEEP_VERSIONS)")
+        to = older[-1]
+    if int(to) not in versions:
+        raise ValueError(f"Unknown version {to}; kept versions: {versions}")
+    previous = pointer["version"] if pointer else None
+    return {**_point(to, "rollback"), "from": previous}
+
+
+def prune(keep=None):
+    keep = keep_versions() if keep is None else keep
+    pointer = current()
+    versions = published()
+    stale = versions[:-keep] if keep > 0 else versions
+    for version in stale:
+        if not pointer or version != pointer["version"]:
+            shutil.rmtree(version_dir(version), ignore_errors=True)
+
+
+def describe():
+    pointer = current()
+    out = []
+    for version in published():
+        try:
+            manifest = json.loads((version_dir(version) / MANIFEST_NAME).read_text())
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+        out.append({"version": version, "action": manifest.get("action"), "created": manifest.get("created"),
+                    "current": bool(pointer) and version == pointer["version"]})
+    return {"current": pointer, "versions": out}
+
+
+class VersionWatcher:
+    """Polls CURRENT and hands each newly published directory to switch() on a background thread
+
+    switch(path) loads the version and makes it the one served; requests keep
+    using the previous one until it returns. If it raises, the old version stays
+    active and the same version is retried when CURRENT changes again.
+    """
+
+    def __init__(self, switch, active=None, interval_s=None):
+        if interval_s is None:
+            interval_s = float(os.environ.get("ML_RELOAD_INTERVAL_S", "") or DEFAULT_RELOAD_INTERVAL_S)
+        self.switch = switch
+        self.interval_s = interval_s
+        self.active = active
+        self.switches = 0
+        self.failures = 0
+        self.last_error = None
+        self._seen = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="version-watcher", daemon=True)
+
+    def start(self):
+        if self.interval_s > 0:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_s):
+            self.poll()
+
+    def poll(self):
+        try:
+            st = os.stat(CURRENT_PATH)
+        except FileNotFoundError:
+            return False
+        stamp = (st.st_ino, st.st_mtime_ns)
+        if stamp == self._seen:
+            return False
+        self._seen = stamp
+        pointer = current()
+        if not pointer or pointer["version"] == self.active:
+            return False
+        try:
+            self.switch(version_dir(pointer["version"]))
+        except Exception as e:
+            self.failures += 1
+            self.last_error = f"version {pointer['version']}: {e}"
+            print(f"reload: keeping version {self.active}: {self.last_error}", file=sys.stderr)
+            return False
+        self.active = pointer["version"]
+        self.switches += 1
+        return True
+
+    def stats(self):
+        return {"active_version": self.active, "switches": self.switches, "failures": self.failures,
+                "last_error": self.last_error, "interval_s": self.interval_s}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Published model versions")
+    parser.add_argument("command", choices=["list", "rollback"])
+    parser.add_argument("--to", type=int, default=None, help="version to roll back to (default: the one before the current)")
+    args = parser.parse_args()
+    try:
+        out = describe() if args.command == "list" else {"success": True, **rollback(args.to)}
+    except ValueError as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    print(json.dumps(out, indent=2))
+    sys.exit(0)
@@ -0,0 +1,146 @@
+# backend/ml/batch_io.py
+# Reading and validating batches of feature rows for the prediction scripts.
+#
+# Rows may be JSON objects keyed by feature name or plain lists in feature
+# order. Invalid rows are reported by index and left out of the feature
+# matrix, so one bad row never fails the rest of the batch.
+import io
+import csv
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+
+from instrumentation import stage
+
+FEATURE_NAMES = ["quiz1", "quiz2", "quiz3", "time_spent", "confidence"]
+# defaults used by predict_knn.py for missing fields
+FEATURE_DEFAULTS = {"quiz1": 0, "quiz2": 0, "quiz3": 0, "time_spent": 1200, "confidence": 3}
+
+
+def infer_format(path):
+    suffix = Path(path).suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if suffix == ".csv":
+        return "csv"
+    return "json"
+
+
+def parse_text(text, fmt):
+    fmt = (fmt or "json").lower()
+    if fmt == "json":
+        rows = json.loads(text)
+        if isinstance(rows, dict) and "rows" in rows:
+            rows = rows["rows"]
+        if not isinstance(rows, list):
+            raise ValueError("JSON batch input must be an array of rows")
+        return rows
+    if fmt == "jsonl":
+        rows = []
+        for line in text.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError as e:
+                # keep the slot so indices still match input lines
+                rows.append({"__error__": f"Invalid JSON: {e}"})
+        return rows
+    if fmt == "csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    raise ValueError(f"Unsupported batch format: {fmt} (use json, jsonl or csv)")
+
+
+def read_rows(path, fmt=None):
+    p = Path(path)
+    if not p.exists():
+        raise FileNotFoundError(f"Batch input not found: {path}")
+    return parse_text(p.read_text(encoding="utf-8"), fmt or infer_format(p))
+
+
+def _row_values(row, feature_names, defaults):
+    if isinstance(row, dict):
+        if "__error__" in row:
+            raise ValueError(row["__error__"])
+        values = []
+        for name in feature_names:
+            value = row.get(name)
+            if value is None or value == "":
+                if defaults is None or name not in defaults:
+                    raise ValueError(f"Missing feature '{name}'")
+                value = defaults[name]
+            values.append(value)
+    elif isinstance(row, (list, tuple)):
+        values = list(row)
+    else:
+        raise ValueError("Row must be an object or a list of numbers")
+
+    out = []
+    for v in values:
+        try:
+            f = float(v)
+        except (TypeError, ValueError):
+            raise ValueError(f"Non-numeric feature value: {v!r}")
+        if not math.isfinite(f):
+            raise ValueError(f"Non-finite feature value: {v!r}")
+        out.append(f)
+    return out
+
+
+def parse_rows(rows, feature_names=None, defaults=None, n_features=None):
+    """Returns (X, valid_indices, errors) where errors maps row index -> message."""
+    feature_names = feature_names or FEATURE_NAMES
+    if n_features is None:
+        n_features = len(feature_names)
+    valid, errors, matrix = [], {}, []
+    for i, row in enumerate(rows):
+        try:
+            values = _row_values(row, feature_names, defaults)
+            if len(values) != n_features:
+                raise ValueError(f"Expected {n_features} features, got {len(values)}")
+        except ValueError as e:
+            errors[i] = str(e)
+            continue
+        valid.append(i)
+        matrix.append(values)
+    X = np.array(matrix, dtype=float).reshape(len(matrix), n_features)
+    return X, valid, errors
+
+
+def predict_rows(model, X):
+    """One predict/predict_proba call over the stacked matrix."""
+    if len(X) == 0:
+        return [], None
+    with stage("predict"):
+        preds = model.predict(X)
+    proba = None
+    if hasattr(model, "predict_proba"):
+        try:
+            with stage("predict_proba"):
+                proba = model.predict_proba(X)
+        except Exception:
+            proba = None
+    return preds, proba
+
+
+def assemble_results(n_rows, valid, errors, preds, proba, classes=None):
+    """Per-row results in input order; invalid rows carry only an error."""
+    results = [None] * n_rows
+    for i, msg in errors.items():
+        results[i] = {"index": i, "error": msg}
+    for j, i in enumerate(valid):
+        item = {"index": i, "prediction": _to_builtin(preds[j])}
+        if proba is not None:
+            if classes is not None:
+                item["probabilities"] = {str(c): round(float(p), 4) for c, p in zip(classes, proba[j])}
+            else:
+                item["probabilities"] = [float(p) for p in proba[j]]
+        results[i] = item
+    return results
+
+
+def _to_builtin(value):
+    return value.item() if hasattr(value, "item") else value
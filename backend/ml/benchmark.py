@@ -0,0 +1,306 @@
+# backend/ml/benchmark.py
+# Reproducible performance numbers for the ML layer.
+#
+#   python benchmark.py run [--sizes 1000 10000] [--batch-sizes 1 32 256 1024]
+#                           [--suite run_model|train_models] [--models knn svm ...]
+#                           [--output results.json] [--baseline baseline.json]
+#   python benchmark.py compare baseline.json results.json [--threshold 0.2]
+#
+# Datasets are generated with data_generator.py (same feature distributions,
+# fixed seed) and cached under .cache/benchmark/. Every (size, model) pair is
+# measured in a fresh interpreter, so peak RSS and artifact load time belong
+# to that estimator alone:
+#   train_s         fit time on an 80% split
+#   load_ms         joblib.load of the saved artifact (median of 3)
+#   single          one-row predict latency p50/p95/p99 (ms)
+#   batch[<size>]   per-batch latency p50/p95/p99 (ms) and rows/s
+#   peak_rss_mb     peak resident memory of the worker process
+# `compare` exits 1 when any metric is worse than the baseline by more than
+# the threshold (relative) and a small absolute noise floor.
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+BENCH_DIR = ML_DIR / ".cache" / "benchmark"
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_BATCH_SIZES = [1, 32, 256, 1024]
+SEED = 42
+
+# metric -> (direction, absolute noise floor); "lower" means lower is better
+METRICS = {
+    "train_s": ("lower", 0.01),
+    "load_ms": ("lower", 0.5),
+    "p50_ms": ("lower", 0.05),
+    "p95_ms": ("lower", 0.05),
+    "p99_ms": ("lower", 0.1),
+    "rows_per_s": ("higher", 0.0),
+    "peak_rss_mb": ("lower", 2.0),
+    "artifact_bytes": ("lower", 1024),
+}
+
+
+def dataset_dir(rows, seed=SEED):
+    """npy dataset for `rows`, generated on first use (opens as a feature store)"""
+    from data_generator import generate
+    target = BENCH_DIR / f"students-{rows}-{seed}"
+    if not (target / "meta.json").exists():
+        generate(rows=rows, seed=seed, output=target, fmt="npy")
+    return target
+
+
+def suite_models(suite):
+    if suite == "train_models":
+        from train_models import MODELS
+        return [name for _, name, _ in MODELS]
+    if suite == "run_model":
+        from run_model import MODEL_NAMES
+        return list(MODEL_NAMES)
+    raise ValueError(f"Unknown suite: {suite} (use run_model or train_models)")
+
+
+def _percentiles(samples_s):
+    import numpy as np
+    ms = np.asarray(samples_s) * 1000
+    return {f"p{q}_ms": round(float(np.percentile(ms, q)), 4) for q in (50, 95, 99)}
+
+
+def _max_rss_mb():
+    import resource
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+# ---------------------------------------------------------------
+# worker: one estimator on one dataset, in its own interpreter
+# ---------------------------------------------------------------
+
+def measure(spec):
+    import tempfile
+    import warnings
+    import numpy as np
+    from joblib import dump, load
+    from sklearn.model_selection import train_test_split
+    from feature_store import open_store
+    warnings.filterwarnings("ignore")
+
+    if spec["suite"] == "train_models":
+        from train_models import build_model
+    else:
+        from run_model import build_estimator as build_model
+    baseline_rss = _max_rss_mb()
+
+    store = open_store(spec["dataset"])
+    X, y = np.asarray(store.X), store.labels()
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=SEED, stratify=y)
+    X_train, y_train, X_test = X[train_idx], y[train_idx], X[test_idx]
+
+    model = build_model(spec["model"], SEED)
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    train_s = time.perf_counter() - started
+    accuracy = float(np.mean(model.predict(X_test) == y[test_idx]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "model.joblib"
+        dump(model, path)
+        artifact_bytes = path.stat().st_size
+        loads = []
+        for _ in range(3):
+            started = time.perf_counter()
+            model = load(path)
+            loads.append(time.perf_counter() - started)
+
+    # query rows cycle through the test split so small datasets still give enough samples
+    def queries(n):
+        return X_test[np.arange(n) % len(X_test)]
+
+    singles = []
+    for row in queries(spec["single_rows"]):
+        row = row.reshape(1, -1)
+        started = time.perf_counter()
+        model.predict(row)
+        singles.append(time.perf_counter() - started)
+
+    batches = {}
+    for size in spec["batch_sizes"]:
+        n_batches = max(5, min(spec["single_rows"], spec["batch_rows"] // size))
+        Q = queries(size * n_batches).reshape(n_batches, size, -1)
+        samples = []
+        for batch in Q:
+            started = time.perf_counter()
+            model.predict(batch)
+            samples.append(time.perf_counter() - started)
+        batches[str(size)] = {**_percentiles(samples), "rows_per_s": round(size * n_batches / sum(samples), 1)}
+
+    return {
+        "rows": spec["rows"],
+        "model": spec["model"],
+        "train_rows": int(len(train_idx)),
+        "accuracy": round(accuracy, 4),
+        "train_s": round(train_s, 4),
+        "load_ms": round(sorted(loads)[1] * 1000, 3),
+        "artifact_bytes": artifact_bytes,
+        "single": _percentiles(singles),
+        "batch": batches,
+        "peak_rss_mb": _max_rss_mb(),
+        "baseline_rss_mb": baseline_rss,
+    }
+
+
+def _run_worker(spec):
+    proc = subprocess.run([sys.executable, "-W", "ignore", __file__, "_measure", json.dumps(spec)],
+                          capture_output=True, text=True, cwd=ML_DIR)
+    if proc.returncode != 0:
+        return {"rows": spec["rows"], "model": spec["model"], "error": proc.stderr.strip()[-1000:]}
+    return json.loads(proc.stdout)
+
+
+def environment():
+    import numpy
+    import sklearn
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": numpy.__version__,
+        "scikit_learn": sklearn.__version__,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    try:
+        info["git_commit"] = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ML_DIR,
+                                            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return info
+
+
+def run(sizes=None, batch_sizes=None, suite="run_model", models=None, single_rows=200, batch_rows=4096, progress=None):
+    config = {
+        "sizes": sizes or DEFAULT_SIZES,
+        "batch_sizes": batch_sizes or DEFAULT_BATCH_SIZES,
+        "suite": suite,
+        "models": models or suite_models(suite),
+        "single_rows": single_rows,
+        "batch_rows": batch_rows,
+        "seed": SEED,
+    }
+    results = []
+    for rows in config["sizes"]:
+        dataset = str(dataset_dir(rows))
+        for model in config["models"]:
+            spec = {"suite": suite, "model": model, "rows": rows, "dataset": dataset,
+                    "single_rows": single_rows, "batch_rows": batch_rows, "batch_sizes": config["batch_sizes"]}
+            result = _run_worker(spec)
+            results.append(result)
+            if progress:
+                progress(result)
+    return {"environment": environment(), "config": config, "results": results}
+
+
+# ---------------------------------------------------------------
+# compare
+# ---------------------------------------------------------------
+
+def _flatten(result):
+    """{"single.p50_ms": ..., "batch.32.rows_per_s": ..., "train_s": ...}"""
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            for sub, inner in _flatten(value).items():
+                flat[f"{key}.{sub}"] = inner
+        elif isinstance(value, (int, float)) and value.__class__ is not bool:
+            flat[key] = value
+    return flat
+
+
+def compare(baseline, current, threshold=0.2):
+    base = {(r["rows"], r["model"]): _flatten(r) for r in baseline["results"] if "error" not in r}
+    regressions, improvements, missing = [], [], []
+    for result in current["results"]:
+        key = (result["rows"], result["model"])
+        if "error" in result:
+            regressions.append({"rows": key[0], "model": key[1], "metric": "error", "detail": result["error"][-200:]})
+            continue
+        if key not in base:
+            missing.append({"rows": key[0], "model": key[1]})
+            continue
+        for metric, value in _flatten(result).items():
+            rule = METRICS.get(metric.rsplit(".", 1)[-1])
+            old = base[key].get(metric)
+            if rule is None or old is None:
+                continue
+            direction, floor = rule
+            delta = value - old if direction == "lower" else old - value
+            change = delta / old if old else 0.0
+            entry = {"rows": key[0], "model": key[1], "metric": metric,
+                     "baseline": old, "current": value, "change": round(change, 4)}
+            if abs(delta) <= floor:
+                continue
+            if change > threshold:
+                regressions.append(entry)
+            elif change < -threshold:
+                improvements.append(entry)
+    return {
+        "threshold": threshold,
+        "regressed": bool(regressions),
+        "regressions": regressions,
+        "improvements": improvements,
+        "not_in_baseline": missing,
+    }
+
+
+def _print_progress(result):
+    if "error" in result:
+        print(f"  {result['rows']:>9} {result['model']:<16} ERROR", file=sys.stderr)
+        return
+    print(f"  {result['rows']:>9} {result['model']:<16} train {result['train_s']:.3f}s  "
+          f"load {result['load_ms']:.1f}ms  p50 {result['single']['p50_ms']:.3f}ms  "
+          f"rss {result['peak_rss_mb']:.0f}MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "_measure":
+        print(json.dumps(measure(json.loads(sys.argv[2]))))
+        sys.exit(0)
+
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the ML layer")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_p = sub.add_parser("run")
+    run_p.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    run_p.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    run_p.add_argument("--suite", choices=["run_model", "train_models"], default="run_model")
+    run_p.add_argument("--models", nargs="+", default=None)
+    run_p.add_argument("--single-rows", type=int, default=200)
+    run_p.add_argument("--batch-rows", type=int, default=4096)
+    run_p.add_argument("--output", default=str(BENCH_DIR / "latest.json"))
+    run_p.add_argument("--baseline", default=None, help="compare against this file after the run")
+    run_p.add_argument("--threshold", type=float, default=0.2)
+    cmp_p = sub.add_parser("compare")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run(args.sizes, args.batch_sizes, args.suite, args.models,
+                     args.single_rows, args.batch_rows, progress=_print_progress)
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2))
+        summary = {"success": True, "output": str(output), "results": len(report["results"])}
+        if args.baseline:
+            summary["comparison"] = compare(json.loads(Path(args.baseline).read_text()), report, args.threshold)
+        print(json.dumps(summary, indent=2))
+        sys.exit(1 if summary.get("comparison", {}).get("regressed") else 0)
+    else:
+        result = compare(json.loads(Path(args.baseline).read_text()),
+                         json.loads(Path(args.current).read_text()), args.threshold)
+        print(json.dumps(result, indent=2))
+        sys.exit(1 if result["regressed"] else 0)
@@ -1,46 +1,160 @@
-import pandas as pd
+import os
+import sys
+import json
+import argparse
+from pathlib import Path
+
 import numpy as np
+import pandas as pd
 
 # Generate synthetic student performance data
-np.random.seed(42)
-
-# Create 500 student records with quiz scores and performance labels
-n_samples = 500
-
-# Features: quiz scores (0-100), time spent (seconds), confidence level (1-5)
-quiz1_scores = np.random.normal(75, 15, n_samples).clip(0, 100)
-quiz2_scores = np.random.normal(72, 18, n_samples).clip(0, 100)
-quiz3_scores = np.random.normal(70, 16, n_samples).clip(0, 100)
-time_spent = np.random.normal(1200, 300, n_samples).clip(300, 2400)  # 5-40 minutes
-confidence = np.random.randint(1, 6, n_samples)
-
-# Calculate average score
-avg_score = (quiz1_scores + quiz2_scores + quiz3_scores) / 3
-
-# Categorize performance: weak (0-60), average (60-80), strong (80-100)
-performance_labels = []
-for score in avg_score:
-    if score < 60:
-        performance_labels.append('weak')
-    elif score < 80:
-        performance_labels.append('average')
+#
+#   python data_generator.py                                   # 500 rows -> student_scores.csv
+#   python data_generator.py --rows 10000000 --format npy --output bench_10m --jobs 8
+#
+# Rows are produced in chunks; chunk i is drawn from its own RandomState(seed + i),
+# so the output only depends on (rows, seed, chunk size) and chunks can be generated
+# in any order by any number of worker processes. With the defaults the single
+# chunk reproduces the historical student_scores.csv exactly.
+
+FEATURE_NAMES = ['quiz1', 'quiz2', 'quiz3', 'time_spent', 'confidence']
+LABEL_NAME = 'performance'
+# sorted, as sklearn's classes_; label codes index into this list
+CLASSES = ['average', 'strong', 'weak']
+# np.digitize(avg_score, [60, 80]) -> 0 weak, 1 average, 2 strong
+_BIN_TO_CODE = np.array([CLASSES.index('weak'), CLASSES.index('average'), CLASSES.index('strong')], dtype=np.int8)
+
+
+def generate_chunk(n_samples, seed):
+    """Features (n x 5 float64, rounded as in the CSV) and int8 label codes"""
+    rng = np.random.RandomState(seed)
+
+    # Features: quiz scores (0-100), time spent (seconds), confidence level (1-5)
+    quiz1_scores = rng.normal(75, 15, n_samples).clip(0, 100)
+    quiz2_scores = rng.normal(72, 18, n_samples).clip(0, 100)
+    quiz3_scores = rng.normal(70, 16, n_samples).clip(0, 100)
+    time_spent = rng.normal(1200, 300, n_samples).clip(300, 2400)  # 5-40 minutes
+    confidence = rng.randint(1, 6, n_samples)
+
+    # Categorize performance on the average score: weak (0-60), average (60-80), strong (80-100)
+    avg_score = (quiz1_scores + quiz2_scores + quiz3_scores) / 3
+    codes = _BIN_TO_CODE[np.digitize(avg_score, [60, 80])]
+
+    X = np.column_stack([
+        quiz1_scores.round(2),
+        quiz2_scores.round(2),
+        quiz3_scores.round(2),
+        time_spent.round(0),
+        confidence,
+    ])
+    return X, codes
+
+
+def to_frame(X, codes):
+    data = pd.DataFrame(X[:, :4], columns=FEATURE_NAMES[:4])
+    data['confidence'] = X[:, 4].astype(np.int64)
+    data[LABEL_NAME] = np.asarray(CLASSES, dtype=object)[codes]
+    return data
+
+
+def chunk_bounds(rows, chunk_size):
+    return [(start, min(start + chunk_size, rows)) for start in range(0, rows, chunk_size)]
+
+
+def _write_csv_chunk(path, index, start, stop, seed):
+    X, codes = generate_chunk(stop - start, seed + index)
+    to_frame(X, codes).to_csv(path, index=False, header=(index == 0))
+    return np.bincount(codes, minlength=len(CLASSES))
+
+
+def _write_npy_chunk(out_dir, index, start, stop, seed):
+    X, codes = generate_chunk(stop - start, seed + index)
+    features = np.load(out_dir / 'features.npy', mmap_mode='r+')
+    labels = np.load(out_dir / 'labels.npy', mmap_mode='r+')
+    features[start:stop] = X
+    labels[start:stop] = codes
+    features.flush()
+    labels.flush()
+    del features, labels
+    return np.bincount(codes, minlength=len(CLASSES))
+
+
+def _run(tasks, jobs):
+    if jobs == 1:
+        return [fn(*args) for fn, args in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(fn, *args) for fn, args in tasks]
+        return [f.result() for f in futures]
+
+
+def generate(rows=500, seed=42, output='student_scores.csv', fmt='csv', chunk_size=1_000_000, jobs=1):
+    """Writes the dataset and returns per-class row counts"""
+    bounds = chunk_bounds(rows, chunk_size)
+    output = Path(output)
+
+    if fmt == 'csv':
+        parts = [output.with_name(f"{output.name}.part-{i:05d}") for i in range(len(bounds))]
+        tasks = [(_write_csv_chunk, (parts[i], i, start, stop, seed)) for i, (start, stop) in enumerate(bounds)]
+        counts = _run(tasks, jobs)
+        # stitch the parts together in chunk order
+        import shutil
+        with open(output, 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    shutil.copyfileobj(f, out, 1 << 20)
+                part.unlink()
+    elif fmt == 'npy':
+        # columnar layout: features.npy, labels.npy and meta.json in one directory
+        output.mkdir(parents=True, exist_ok=True)
+        np.lib.format.open_memmap(output / 'features.npy', mode='w+', dtype=np.float64, shape=(rows, len(FEATURE_NAMES)))
+        np.lib.format.open_memmap(output / 'labels.npy', mode='w+', dtype=np.int8, shape=(rows,))
+        tasks = [(_write_npy_chunk, (output, i, start, stop, seed)) for i, (start, stop) in enumerate(bounds)]
+        counts = _run(tasks, jobs)
+        meta = {
+            'rows': rows,
+            'feature_names': FEATURE_NAMES,
+            'label_name': LABEL_NAME,
+            'classes': CLASSES,
+            'seed': seed,
+            'chunk_size': chunk_size,
+        }
+        (output / 'meta.json').write_text(json.dumps(meta, indent=2))
     else:
-        performance_labels.append('strong')
-
-# Create DataFrame
-data = pd.DataFrame({
-    'quiz1': quiz1_scores.round(2),
-    'quiz2': quiz2_scores.round(2),
-    'quiz3': quiz3_scores.round(2),
-    'time_spent': time_spent.round(0),
-    'confidence': confidence,
-    'performance': performance_labels
-})
-
-# Save to CSV
-data.to_csv('student_scores.csv', index=False)
-print("SUCCESS: Generated student_scores.csv with", len(data), "samples")
-print("\nData distribution:")
-print(data['performance'].value_counts())
-print("\nSample data:")
-print(data.head(10))
+        raise ValueError(f"Unsupported format: {fmt} (use csv or npy)")
+
+    total = np.sum(counts, axis=0) if counts else np.zeros(len(CLASSES), dtype=np.int64)
+    return dict(zip(CLASSES, total.tolist()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic student performance data")
+    parser.add_argument('--rows', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--format', choices=['csv', 'npy'], default='csv')
+    parser.add_argument('--output', default=None, help="CSV file, or directory for --format npy")
+    parser.add_argument('--chunk-size', type=int, default=1_000_000)
+    parser.add_argument('--jobs', type=int, default=0, help="worker processes (0 = one per core)")
+    args = parser.parse_args(argv)
+
+    output = args.output or ('student_scores.csv' if args.format == 'csv' else 'student_scores_npy')
+    n_chunks = len(chunk_bounds(args.rows, args.chunk_size))
+    jobs = max(1, min(args.jobs or os.cpu_count() or 1, n_chunks))
+
+    counts = generate(args.rows, args.seed, output, args.format, args.chunk_size, jobs)
+
+    print("SUCCESS: Generated", output, "with", args.rows, "samples")
+    print("\nData distribution:")
+    for label, count in sorted(counts.items(), key=lambda kv: -kv[1]):
+        print(f"{label:<10} {count}")
+    print("\nSample data:")
+    if args.format == 'csv':
+        print(pd.read_csv(output, nrows=10))
+    else:
+        X = np.load(Path(output) / 'features.npy', mmap_mode='r')[:10]
+        codes = np.load(Path(output) / 'labels.npy', mmap_mode='r')[:10]
+        print(to_frame(np.asarray(X), np.asarray(codes)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,223 @@
+# backend/ml/ensemble.py
+# Fused predict_all: the five models answer one request as an ensemble.
+#
+#   echo '{"action": "predict_all", "ensemble": true, "features": [75, 72, 70, 1200, 3],
+#          "budget_ms": 50}' | python run_model.py
+#
+# - Shared preprocessing. run_model.py's pipelines each carry their own
+#   StandardScaler, but after `train` they are fitted on the same split and
+#   hold identical statistics. Members are grouped by their scaler's
+#   parameters, each distinct scaler transforms the input once, and the final
+#   estimators receive the scaled matrix.
+# - Concurrency. The final estimators run in a thread pool (ML_ENSEMBLE_THREADS,
+#   default one per model or core); the numpy/libsvm kernels release the GIL.
+#   Members are submitted fastest first, by their recent latency.
+# - Budget. With "budget_ms" (or ML_ENSEMBLE_BUDGET_MS) members that have
+#   not finished when it runs out are left out of the vote and reported as
+#   skipped; members not yet started are cancelled. If no member with a
+#   positive weight has succeeded by then, the first one to succeed is waited
+#   for, so there is an answer unless they all fail.
+#   A member still running past the budget keeps its pool thread; until it
+#   finishes, later requests report it as "busy" instead of queueing another
+#   run of it, so at most one over-budget run per member holds the pool.
+# - Soft vote. Probabilities are aligned on the union of classes and averaged
+#   with per-model weights: the "weights" in the request, else the validation
+#   accuracy `train` stored in the version's metrics.json, else equal weights. A
+#   member without predict_proba votes with its one-hot prediction.
+import os
+import json
+import time
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+# exponentially weighted mean latency per member, ms; orders submission
+_LATENCY_MS = {}
+# member -> runs still going after their request stopped waiting (budget)
+_OVERRUNNING = Counter()
+
+
+def pool():
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            threads = int(os.environ.get("ML_ENSEMBLE_THREADS", "0") or 0) or min(5, os.cpu_count() or 1)
+            _POOL = ThreadPoolExecutor(max_workers=max(1, threads), thread_name_prefix="ensemble")
+        return _POOL
+
+
+def default_budget_ms():
+    value = os.environ.get("ML_ENSEMBLE_BUDGET_MS", "")
+    return float(value) if value else None
+
+
+def load_weights(metrics_path, names):
+    """Validation accuracy per model from metrics.json; 1.0 where missing"""
+    try:
+        metrics = json.loads(metrics_path.read_text())
+    except (FileNotFoundError, ValueError):
+        metrics = {}
+    return {name: float(metrics.get(name, {}).get("accuracy", 1.0)) for name in names}
+
+
+def split_pipeline(est):
+    """(scaler or None, final estimator) for a fitted model"""
+    steps = getattr(est, "steps", None)
+    if not steps:
+        return None, est
+    if len(steps) != 2:
+        # not the scaler + estimator layout; run it whole
+        return None, est
+    return steps[0][1], steps[1][1]
+
+
+def _scaler_key(scaler):
+    # identical statistics give identical output, so one transform serves all of them
+    return (type(scaler).__name__,
+            getattr(scaler, "with_mean", None), getattr(scaler, "with_std", None),
+            np.asarray(getattr(scaler, "mean_", 0.0)).tobytes(),
+            np.asarray(getattr(scaler, "scale_", 1.0)).tobytes())
+
+
+def shared_inputs(members, X):
+    """{name: (final estimator, its input matrix)} with each distinct scaler applied once"""
+    scaled, out = {}, {}
+    for name, est in members.items():
+        scaler, final = split_pipeline(est)
+        if scaler is None:
+            out[name] = (final, X)
+            continue
+        key = _scaler_key(scaler)
+        if key not in scaled:
+            scaled[key] = scaler.transform(X)
+        out[name] = (final, scaled[key])
+    return out, len(scaled)
+
+
+def _abandon(name, future):
+    # the thread cannot be stopped; mark the member until its run returns
+    with _POOL_LOCK:
+        _OVERRUNNING[name] += 1
+    future.add_done_callback(lambda _: _release(name))
+
+
+def _release(name):
+    with _POOL_LOCK:
+        _OVERRUNNING[name] -= 1
+        if _OVERRUNNING[name] <= 0:
+            del _OVERRUNNING[name]
+
+
+def _succeeded(future, weight):
+    return weight > 0 and not future.cancelled() and future.exception() is None
+
+
+def _run_member(name, est, X):
+    started = time.perf_counter()
+    preds = est.predict(X)
+    proba = None
+    if hasattr(est, "predict_proba"):
+        try:
+            proba = est.predict_proba(X)
+        except Exception:
+            proba = None
+    ms = (time.perf_counter() - started) * 1000
+    previous = _LATENCY_MS.get(name)
+    _LATENCY_MS[name] = ms if previous is None else 0.8 * previous + 0.2 * ms
+    return preds, proba, ms
+
+
+def soft_vote(outputs, weights):
+    """(classes, probabilities, predictions) of the weighted average of the members' probabilities"""
+    classes = sorted({c for out in outputs.values() for c in out["classes"]}, key=str)
+    index = {c: i for i, c in enumerate(classes)}
+    total = None
+    weight_sum = 0.0
+    for name, out in outputs.items():
+        w = weights.get(name, 1.0)
+        if w <= 0:
+            continue
+        n = len(out["predictions"])
+        aligned = np.zeros((n, len(classes)))
+        cols = [index[c] for c in out["classes"]]
+        if out["proba"] is not None:
+            aligned[:, cols] = out["proba"]
+        else:
+            aligned[np.arange(n), [index[p] for p in out["predictions"]]] = 1.0
+        total = aligned * w if total is None else total + aligned * w
+        weight_sum += w
+    if total is None:
+        raise ValueError("No ensemble member with a positive weight finished")
+    proba = total / weight_sum
+    return classes, proba, [classes[i] for i in proba.argmax(axis=1)]
+
+
+def run(members, X, weights, budget_ms=None):
+    """Evaluate members ({name: (estimator, served_by)}) on X concurrently and soft-vote"""
+    started = time.perf_counter()
+    estimators = {name: est for name, (est, _) in members.items()}
+    inputs, n_scalers = shared_inputs(estimators, X)
+    preprocess_ms = (time.perf_counter() - started) * 1000
+
+    # fastest first, so with fewer threads than members the slow ones queue last
+    order = sorted(inputs, key=lambda name: _LATENCY_MS.get(name, 0.0))
+    with _POOL_LOCK:
+        busy = [name for name in order if _OVERRUNNING[name] > 0]
+    if len(busy) == len(order):
+        raise ValueError("Every ensemble member is still running for an earlier request over its budget")
+    futures = {pool().submit(_run_member, name, *inputs[name]): name for name in order if name not in busy}
+    if budget_ms is None:
+        done, pending = wait(futures)
+    else:
+        remaining = budget_ms / 1000 - (time.perf_counter() - started)
+        done, pending = wait(futures, timeout=max(0.0, remaining))
+        while pending and not any(_succeeded(f, weights.get(futures[f], 1.0)) for f in done):
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            done |= finished
+    for f in pending:
+        if not f.cancel():
+            _abandon(futures[f], f)
+
+    outputs, report = {}, {}
+    for name in busy:
+        report[name] = {"skipped": "busy", "served_by": members[name][1]}
+    for f, name in futures.items():
+        est, served_by = members[name]
+        if f not in done:
+            report[name] = {"skipped": "budget", "served_by": served_by}
+            continue
+        try:
+            preds, proba, ms = f.result()
+        except Exception as e:
+            report[name] = {"error": str(e), "served_by": served_by}
+            continue
+        classes = list(getattr(est, "classes_", np.unique(preds)))
+        outputs[name] = {"predictions": list(preds), "proba": proba, "classes": classes}
+        report[name] = {
+            "predictions": np.asarray(preds).tolist(),
+            "probabilities": None if proba is None else proba.tolist(),
+            "ms": round(ms, 3),
+            "served_by": served_by,
+        }
+
+    # a zero weight leaves the member out of the vote
+    used = {name: weights.get(name, 1.0) for name in outputs if weights.get(name, 1.0) > 0}
+    classes, proba, preds = soft_vote(outputs, used)
+    return {
+        "members": report,
+        "ensemble": {
+            "predictions": [c.item() if hasattr(c, "item") else c for c in preds],
+            "probabilities": proba.round(6).tolist(),
+            "classes": [c.item() if hasattr(c, "item") else c for c in classes],
+            "weights": used,
+            "members_used": sorted(used, key=order.index),
+        },
+        "shared_scalers": n_scalers,
+        "preprocess_ms": round(preprocess_ms, 3),
+        "total_ms": round((time.perf_counter() - started) * 1000, 3),
+        "budget_ms": budget_ms,
+    }
@@ -0,0 +1,197 @@
+# backend/ml/evaluation.py
+# Classification metrics derived from a single confusion matrix, and bootstrap
+# confidence intervals for them.
+#
+# The labels are encoded once and the confusion matrix is one np.bincount over
+# true * k + predicted; accuracy, per-class and macro/weighted
+# precision/recall/F1 and the classification report all come from it,
+# instead of accuracy_score, precision_recall_fscore_support,
+# classification_report and confusion_matrix each re-scanning the
+# predictions. Results match sklearn's (zero_division=0).
+#
+# Bootstrap: every resample is a row of random test-set indices. A chunk of
+# resamples becomes a stack of cell counts in one bincount (offsetting each
+# resample's codes by resample * cells), and the metrics are computed on the
+# whole stack at once. With few classes the cell is the joint
+# (true, pred_1, ..., pred_m) code, so all models are counted in one pass and
+# split afterwards. All models are scored on the same resamples, so their
+# differences are paired:
+#
+#   compare(y_test, {"KNN": pred_knn, "SVM": pred_svm, ...}, n_resamples=2000)
+#
+# gives each model's interval, every pairwise difference with its interval,
+# and how often each model came out on top.
+import numpy as np
+
+# resample indices drawn per chunk
+CHUNK_ELEMENTS = 1 << 24
+# largest joint (true, pred_1, ..., pred_m) code space resampled in one pass
+JOINT_CELLS = 1 << 12
+METRICS = ("accuracy", "precision_weighted", "recall_weighted", "f1_weighted",
+           "precision_macro", "recall_macro", "f1_macro")
+
+
+def encode(y_true, *y_preds, labels=None):
+    """(labels, true codes, [pred codes]); labels default to the sorted union, as in sklearn"""
+    y_true = np.asarray(y_true)
+    y_preds = [np.asarray(p) for p in y_preds]
+    if labels is None:
+        labels = np.unique(np.concatenate([y_true.ravel()] + [p.ravel() for p in y_preds]))
+    labels = np.asarray(labels)
+    codes = []
+    for y in [y_true] + y_preds:
+        c = np.searchsorted(labels, y)
+        c[c >= len(labels)] = 0
+        if not np.array_equal(labels[c], y):
+            raise ValueError(f"Labels not in {labels.tolist()}: {sorted(set(np.unique(y).tolist()) - set(labels.tolist()))}")
+        codes.append(c)
+    return labels, codes[0], codes[1:]
+
+
+def confusion(t, p, k):
+    return np.bincount(t * k + p, minlength=k * k).reshape(k, k)
+
+
+def _divide(num, den):
+    # zero_division=0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(den > 0, num / np.where(den > 0, den, 1), 0.0)
+
+
+def metrics_from_confusion(cm):
+    """Metrics for a (k, k) matrix or a (..., k, k) stack; arrays keep the leading axes"""
+    cm = np.asarray(cm, dtype=np.float64)
+    tp = np.diagonal(cm, axis1=-2, axis2=-1)
+    support = cm.sum(axis=-1)
+    predicted = cm.sum(axis=-2)
+    total = support.sum(axis=-1)
+    precision = _divide(tp, predicted)
+    recall = _divide(tp, support)
+    f1 = _divide(2 * precision * recall, precision + recall)
+    weights = _divide(support, total[..., None])
+    return {
+        "accuracy": _divide(tp.sum(axis=-1), total),
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "support": support,
+        "precision_macro": precision.mean(axis=-1),
+        "recall_macro": recall.mean(axis=-1),
+        "f1_macro": f1.mean(axis=-1),
+        "precision_weighted": (precision * weights).sum(axis=-1),
+        "recall_weighted": (recall * weights).sum(axis=-1),
+        "f1_weighted": (f1 * weights).sum(axis=-1),
+    }
+
+
+def classification_report(cm, labels):
+    """sklearn.metrics.classification_report(..., output_dict=True) from the confusion matrix"""
+    m = metrics_from_confusion(cm)
+    report = {}
+    for i, label in enumerate(labels):
+        report[str(label)] = {"precision": float(m["precision"][i]), "recall": float(m["recall"][i]),
+                              "f1-score": float(m["f1"][i]), "support": float(m["support"][i])}
+    report["accuracy"] = float(m["accuracy"])
+    total = float(m["support"].sum())
+    for avg in ("macro", "weighted"):
+        report[f"{avg} avg"] = {"precision": float(m[f"precision_{avg}"]), "recall": float(m[f"recall_{avg}"]),
+                                "f1-score": float(m[f"f1_{avg}"]), "support": total}
+    return report
+
+
+def evaluate(y_true, y_pred, labels=None):
+    """Confusion matrix, labels and every metric for one model, from one pass over the predictions"""
+    labels, t, (p,) = encode(y_true, y_pred, labels=labels)
+    cm = confusion(t, p, len(labels))
+    m = metrics_from_confusion(cm)
+    return {
+        "labels": labels.tolist(),
+        "confusion_matrix": cm.tolist(),
+        **{name: float(m[name]) for name in METRICS},
+        "classification_report": classification_report(cm, labels),
+    }
+
+
+# ---------------------------------------------------------------
+# bootstrap
+# ---------------------------------------------------------------
+
+def bootstrap_confusions(t, preds, k, n_resamples=1000, seed=42, chunk_elements=CHUNK_ELEMENTS):
+    """(n_resamples, k, k) confusion matrices per prediction array, all on the same resamples"""
+    n = len(t)
+    rng = np.random.default_rng(seed)
+    # one joint cell per row (true, pred_1, ..., pred_m) when that space is small,
+    # so each resample is gathered and counted once for all models
+    n_cells = k ** (len(preds) + 1)
+    joint_pass = n_cells <= JOINT_CELLS
+    if joint_pass:
+        joint = t.astype(np.int64)
+        for p in preds:
+            joint = joint * k + p
+        cells, width = [joint], n_cells
+    else:
+        cells, width = [t * k + p for p in preds], k * k
+    counts = [np.empty((n_resamples, width), dtype=np.int64) for _ in cells]
+    chunk = max(1, chunk_elements // max(1, n))
+    index_dtype = np.int32 if n < 2 ** 31 else np.int64
+    for start in range(0, n_resamples, chunk):
+        b = min(chunk, n_resamples - start)
+        idx = rng.integers(0, n, size=(b, n), dtype=index_dtype)
+        # resample r's cells land in bins [r*width, (r+1)*width)
+        offsets = (np.arange(b) * width)[:, None]
+        for c, target in zip(cells, counts):
+            target[start:start + b] = np.bincount((c[idx] + offsets).ravel(), minlength=b * width).reshape(b, width)
+
+    if not joint_pass:
+        return [c.reshape(n_resamples, k, k) for c in counts]
+    # marginalise the joint counts down to (true, pred_i) per model
+    joint = counts[0].reshape((n_resamples,) + (k,) * (len(preds) + 1))
+    out = []
+    for i in range(len(preds)):
+        others = tuple(2 + j for j in range(len(preds)) if j != i)
+        out.append(joint.sum(axis=others))
+    return out
+
+
+def _interval(samples, alpha):
+    low, high = np.quantile(samples, [alpha / 2, 1 - alpha / 2], axis=0)
+    return low, high
+
+
+def compare(y_true, preds_by_model, n_resamples=1000, alpha=0.05, seed=42, metrics=("accuracy", "f1_weighted"),
+            labels=None):
+    """Point estimates with percentile intervals per model, paired differences and P(best)"""
+    names = list(preds_by_model)
+    labels, t, codes = encode(y_true, *preds_by_model.values(), labels=labels)
+    k = len(labels)
+    point = [metrics_from_confusion(confusion(t, p, k)) for p in codes]
+    boot = [metrics_from_confusion(cms) for cms in bootstrap_confusions(t, codes, k, n_resamples, seed)]
+
+    models = {}
+    for i, name in enumerate(names):
+        models[name] = {}
+        for metric in metrics:
+            low, high = _interval(boot[i][metric], alpha)
+            models[name][metric] = {"value": float(point[i][metric]), "low": float(low), "high": float(high)}
+
+    pairwise, best = [], {}
+    for metric in metrics:
+        stack = np.stack([b[metric] for b in boot])              # (models, resamples)
+        wins = stack == stack.max(axis=0)
+        # ties share the win
+        best[metric] = dict(zip(names, (wins / wins.sum(axis=0)).mean(axis=1).round(4).tolist()))
+        for i in range(len(names)):
+            for j in range(i + 1, len(names)):
+                diff = stack[i] - stack[j]
+                low, high = _interval(diff, alpha)
+                pairwise.append({
+                    "metric": metric,
+                    "a": names[i],
+                    "b": names[j],
+                    "difference": float(point[i][metric] - point[j][metric]),
+                    "low": float(low),
+                    "high": float(high),
+                    "significant": bool(low > 0 or high < 0),
+                })
+    return {"n_test": len(t), "n_resamples": n_resamples, "alpha": alpha, "seed": seed,
+            "models": models, "pairwise": pairwise, "p_best": best}
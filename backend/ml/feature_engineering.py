@@ -0,0 +1,293 @@
+# backend/ml/feature_engineering.py
+# The /api/ml/my-prediction features for every student at once, from a bulk
+# quiz-attempt export (mongoexport JSONL or CSV of the QuizAttempt collection).
+#
+# Usage:
+#   python feature_engineering.py attempts.jsonl features.csv [--chunk-size 200000]
+#   python feature_engineering.py delta.jsonl changed.csv --incremental [--all]
+#   python stream_score.py features.csv scores.csv --id-column student
+#
+# Per student the route takes the last three attempts (createdAt descending)
+# and builds
+#   quiz1..quiz3  their scores; quiz1 falls back to the mean score when the
+#                 newest is 0, quiz2/quiz3 when there are fewer attempts
+#   time_spent    mean timeSpent (missing counts as 0), 1200 when the mean is 0
+#   confidence    mean confidenceLevel (missing or 0 counts as 3)
+# and this module reproduces those rules exactly, including the JS `||` quirks.
+#
+# The export is read in chunks. Each chunk is concatenated with the attempts
+# kept so far, sorted by (student, createdAt desc, _id desc) and cut to a
+# window of three per student with a group-wise cumcount, so memory depends on
+# the number of students, not attempts. The features are then computed on the
+# (students x 3) window with numpy.
+#
+# The window is saved to .cache/features/attempts.npz. With --incremental the
+# input is a delta export (attempts created or changed since the last run,
+# e.g. mongoexport --query on updatedAt): it is merged into the saved window,
+# later copies of the same _id win, and only the students in the delta are
+# recomputed and written (--all writes everyone). Deleted attempts are not seen
+# by a delta; run a full export to drop them.
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from batch_io import infer_format
+
+ML_DIR = Path(__file__).parent
+STATE_PATH = ML_DIR / ".cache" / "features" / "attempts.npz"
+WINDOW = 3
+# the route's fallbacks
+DEFAULT_TIME_SPENT = 1200
+DEFAULT_CONFIDENCE = 3
+_WINDOW_COLUMNS = ["student", "attempt_id", "created", "score", "time_spent", "confidence"]
+
+
+def _unwrap(value):
+    # mongoexport extended JSON: {"$oid": ...}, {"$date": ...}, {"$date": {"$numberLong": ...}}
+    while isinstance(value, dict):
+        value = next((value[k] for k in ("$oid", "$date", "$numberLong", "$numberInt", "$numberDouble")
+                      if k in value), None)
+    return value
+
+
+def _column(chunk, name):
+    import pandas as pd
+    if name not in chunk.columns:
+        return pd.Series([None] * len(chunk), index=chunk.index, dtype=object)
+    col = chunk[name]
+    if col.dtype == object:
+        col = col.map(_unwrap)
+    return col
+
+
+def _timestamps(col):
+    # ns since the epoch; ISO strings or epoch milliseconds, missing sorts oldest
+    import pandas as pd
+    if pd.api.types.is_numeric_dtype(col):
+        ts = pd.to_datetime(col, unit="ms", utc=True)
+    else:
+        ts = pd.to_datetime(col, utc=True, errors="coerce", format="ISO8601")
+        # (to_numpy() may return a read-only view, so no in-place &=)
+        retry = ts.isna().to_numpy() & col.notna().to_numpy()
+        if retry.any():
+            # {"$date": {"$numberLong": "..."}} and other epoch-ms values
+            ts[retry] = pd.to_datetime(pd.to_numeric(col[retry], errors="coerce"), unit="ms", utc=True)
+    missing = ts.isna().to_numpy()
+    out = ts.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    out[missing] = np.iinfo(np.int64).min
+    return out
+
+
+def normalize(chunk, offset=0):
+    """Attempt rows as the window's columns; score/timeSpent/confidenceLevel stay raw (NaN if missing)"""
+    import pandas as pd
+    students = _column(chunk, "student")
+    known = students.notna().to_numpy()
+    if not known.any():
+        raise ValueError("Attempt export has no 'student' column")
+    created = _column(chunk, "createdAt" if "createdAt" in chunk.columns else "completedAt")
+    ids = _column(chunk, "_id")
+    missing_id = ids.isna().to_numpy()
+    ids = ids.to_numpy(dtype=object)
+    if missing_id.any():
+        # without _id rows cannot be matched across runs; number them by position
+        ids[missing_id] = [f"#{offset + i}" for i in np.flatnonzero(missing_id)]
+    frame = pd.DataFrame({
+        "student": students.to_numpy(dtype=object),
+        "attempt_id": ids,
+        "created": _timestamps(created),
+        "score": pd.to_numeric(_column(chunk, "score"), errors="coerce").to_numpy(dtype=float),
+        "time_spent": pd.to_numeric(_column(chunk, "timeSpent"), errors="coerce").to_numpy(dtype=float),
+        "confidence": pd.to_numeric(_column(chunk, "confidenceLevel"), errors="coerce").to_numpy(dtype=float),
+    })
+    frame["student"] = frame["student"].astype(str)
+    frame["attempt_id"] = frame["attempt_id"].astype(str)
+    return frame[known]
+
+
+def _group_rank(codes):
+    """Position of each row within its run of equal codes (rows of a group are contiguous)"""
+    n = len(codes)
+    starts = np.ones(n, dtype=bool)
+    starts[1:] = codes[1:] != codes[:-1]
+    idx = np.arange(n)
+    return idx - np.maximum.accumulate(np.where(starts, idx, 0))
+
+
+def latest_attempts(frame, window=WINDOW):
+    """The newest `window` attempts per student; a student's rows are contiguous, newest first"""
+    import pandas as pd
+    # a later copy of an attempt (delta export, re-export) replaces the earlier one
+    frame = frame[~frame["attempt_id"].duplicated(keep="last").to_numpy()]
+    codes = pd.factorize(frame["student"])[0]
+    created = frame["created"].to_numpy()
+    # ascending (student code, createdAt) reversed: each student newest first
+    order = np.lexsort((created, codes))[::-1]
+    same = (codes[order][1:] == codes[order][:-1]) & (created[order][1:] == created[order][:-1])
+    if same.any():
+        # equal createdAt within a student: break the tie by _id, descending (string keys are slower to sort)
+        order = np.lexsort((frame["attempt_id"].to_numpy(dtype=str), created, codes))[::-1]
+    keep = order[_group_rank(codes[order]) < window]
+    return frame.iloc[keep].reset_index(drop=True)
+
+
+def compute_features(window_frame, window=WINDOW):
+    """One row of route features per student of a latest_attempts() frame"""
+    import pandas as pd
+    codes, students = pd.factorize(window_frame["student"], sort=False)
+    n = len(students)
+    rank = _group_rank(codes)
+    count = np.bincount(codes, minlength=n)
+
+    # JS: a null score adds 0 to the sum
+    score = np.nan_to_num(window_frame["score"].to_numpy(dtype=float), nan=0.0)
+    scores = np.zeros((n, window))
+    scores[codes, rank] = score
+    mean = scores.sum(axis=1) / count
+    # quiz1: scores[0] || avg;  quizN: scores[N-1] || (length > N-1 ? scores[N-1] : avg)
+    quiz = np.empty((n, window))
+    quiz[:, 0] = np.where(scores[:, 0] != 0, scores[:, 0], mean)
+    for k in range(1, window):
+        quiz[:, k] = np.where(count > k, scores[:, k], mean)
+
+    # (b.timeSpent || 0) ... / n || 1200
+    time_spent = np.bincount(codes, np.nan_to_num(window_frame["time_spent"].to_numpy(dtype=float), nan=0.0),
+                             minlength=n) / count
+    time_spent = np.where(time_spent != 0, time_spent, DEFAULT_TIME_SPENT)
+    # (b.confidenceLevel || 3) ... / n || 3
+    conf = window_frame["confidence"].to_numpy(dtype=float)
+    conf = np.where(np.isnan(conf) | (conf == 0), DEFAULT_CONFIDENCE, conf)
+    confidence = np.bincount(codes, conf, minlength=n) / count
+    confidence = np.where(confidence != 0, confidence, DEFAULT_CONFIDENCE)
+
+    newest = window_frame["created"].to_numpy()[rank == 0]
+    last = np.char.add(np.datetime_as_string(newest.astype("datetime64[ns]"), unit="ms"), "Z").astype(object)
+    last[newest == np.iinfo(np.int64).min] = None
+    out = pd.DataFrame({"student": np.asarray(students, dtype=object)})
+    for k in range(window):
+        out[f"quiz{k + 1}"] = quiz[:, k]
+    out["time_spent"] = time_spent
+    out["confidence"] = confidence
+    out["attempts"] = count
+    out["last_attempt"] = last
+    return out
+
+
+def iter_export(path, fmt, chunk_size):
+    # ids stay strings: an all-digit ObjectId must not turn into a number
+    import pandas as pd
+    if fmt == "csv":
+        return pd.read_csv(path, chunksize=chunk_size, dtype={"student": str, "_id": str})
+    if fmt == "jsonl":
+        return pd.read_json(path, lines=True, chunksize=chunk_size, dtype=False, convert_dates=False)
+    raise ValueError("Attempt export must be CSV or JSONL")
+
+
+def read_window(path, chunk_size=200_000, fmt=None, carry=None):
+    """Fold an export into the per-student window, chunk by chunk; (window frame, rows read, students in the input)"""
+    import pandas as pd
+    fmt = fmt or infer_format(path)
+    rows, touched = 0, []
+    for chunk in iter_export(path, fmt, chunk_size):
+        frame = normalize(chunk, offset=rows)
+        rows += len(chunk)
+        touched.append(frame["student"].unique())
+        carry = latest_attempts(frame if carry is None else pd.concat([carry, frame], ignore_index=True))
+    if carry is None:
+        carry = pd.DataFrame({c: pd.Series(dtype=float if c in ("score", "time_spent", "confidence") else object)
+                              for c in _WINDOW_COLUMNS}).astype({"created": np.int64})
+    touched = pd.unique(np.concatenate(touched)) if touched else np.array([], dtype=object)
+    return carry, rows, touched
+
+
+def load_state(path=STATE_PATH):
+    import pandas as pd
+    with np.load(path, allow_pickle=False) as data:
+        return pd.DataFrame({c: data[c] for c in _WINDOW_COLUMNS}).astype({"student": object, "attempt_id": object})
+
+
+def save_state(window_frame, path=STATE_PATH):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    arrays = {c: window_frame[c].to_numpy() for c in _WINDOW_COLUMNS}
+    arrays["student"] = arrays["student"].astype(str)
+    arrays["attempt_id"] = arrays["attempt_id"].astype(str)
+    tmp = path.with_name(f".{path.stem}.tmp.npz")
+    np.savez(tmp, **arrays)
+    tmp.replace(path)
+
+
+def write_features(features, output_path, fmt=None):
+    output_path = Path(output_path)
+    fmt = fmt or infer_format(output_path)
+    tmp = output_path.with_name(output_path.name + ".part")
+    try:
+        if fmt == "csv":
+            features.to_csv(tmp, index=False)
+        elif fmt == "jsonl":
+            features.to_json(tmp, orient="records", lines=True)
+        else:
+            features.to_json(tmp, orient="records")
+        tmp.replace(output_path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def build_features(input_path, output_path, incremental=False, write_all=False, state_path=STATE_PATH,
+                   chunk_size=200_000, fmt=None):
+    started = time.perf_counter()
+    state_path = Path(state_path)
+    carry = None
+    if incremental:
+        if not state_path.exists():
+            raise FileNotFoundError(f"No saved attempt window at {state_path}; run once without --incremental")
+        carry = load_state(state_path)
+    window_frame, rows, touched = read_window(input_path, chunk_size, fmt, carry)
+    if incremental and not write_all:
+        selected = window_frame[window_frame["student"].isin(touched)]
+    else:
+        selected = window_frame
+    features = compute_features(selected)
+    write_features(features, output_path)
+    save_state(window_frame, state_path)
+
+    created = window_frame["created"].to_numpy()
+    created = created[created != np.iinfo(np.int64).min]
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": "incremental" if incremental else "full",
+        "attempts_read": rows,
+        "students": int(window_frame["student"].nunique()),
+        "changed": int(len(touched)),
+        "written": len(features),
+        # newest createdAt kept; the next delta export can start here
+        "watermark": np.datetime_as_string(np.datetime64(int(created.max()), "ns"), unit="ms") + "Z" if len(created) else None,
+        "seconds": round(elapsed, 3),
+        "output_path": str(output_path),
+        "state_path": str(state_path),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build my-prediction features for every student from an attempts export")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--incremental", action="store_true", help="input is a delta; merge it into the saved window")
+    parser.add_argument("--all", action="store_true", dest="write_all", help="with --incremental, write every student")
+    parser.add_argument("--state", default=str(STATE_PATH))
+    parser.add_argument("--chunk-size", type=int, default=200_000)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None, help="input format (default: from the suffix)")
+    args = parser.parse_args()
+
+    try:
+        summary = build_features(args.input_path, args.output_path, args.incremental, args.write_all,
+                                 args.state, args.chunk_size, args.format)
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        sys.exit(1)
+    print(json.dumps({"success": True, **summary}))
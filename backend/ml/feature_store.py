@@ -0,0 +1,159 @@
+# backend/ml/feature_store.py
+# Binary feature store shared by the trainers and evaluators.
+#
+# A CSV dataset is converted once into a directory holding
+#   features.npy  float64 matrix (rows x features)
+#   labels.npy    integer label codes, indexes into meta["classes"]
+#   meta.json     feature names, label column, classes, source hash
+# keyed by the SHA-256 of the source file. Later runs (and every worker
+# process) open the arrays with mmap_mode="r", so they share the page cache
+# instead of parsing the CSV again. Directories written by
+# `data_generator.py --format npy` use the same layout and open directly.
+#
+#   python feature_store.py student_scores.csv     # convert (or reuse) and print the store path
+import sys
+import json
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import file_sha256
+
+STORE_DIR = Path(__file__).parent / ".cache" / "feature_store"
+CHUNK_ROWS = 200_000
+
+
+class FeatureStore:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        self.X = np.load(self.path / "features.npy", mmap_mode="r")
+        self.codes = np.load(self.path / "labels.npy", mmap_mode="r")
+        self.feature_names = self.meta["feature_names"]
+        self.classes = np.asarray(self.meta["classes"])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def labels(self, index=None):
+        codes = self.codes if index is None else self.codes[index]
+        return self.classes[codes]
+
+    def columns(self, names):
+        idx = [self.feature_names.index(n) for n in names]
+        return self.X[:, idx]
+
+
+def is_store(path):
+    p = Path(path)
+    return p.is_dir() and (p / "meta.json").exists() and (p / "features.npy").exists()
+
+
+def _convert(source, target, label_column, chunk_rows):
+    import pandas as pd
+
+    # pass 1: row count, columns and the label vocabulary
+    rows, classes, columns = 0, set(), None
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        if columns is None:
+            columns = list(chunk.columns)
+            if len(columns) < 2:
+                raise ValueError("Dataset must contain features + label (label as last column)")
+            label_column = label_column or columns[-1]
+            if label_column not in columns:
+                raise ValueError(f"Label column not found: {label_column}")
+        rows += len(chunk)
+        classes.update(chunk[label_column].unique().tolist())
+    if columns is None:
+        raise ValueError(f"Dataset is empty: {source}")
+
+    feature_names = [c for c in columns if c != label_column]
+    classes = sorted(classes)
+    lookup = {c: i for i, c in enumerate(classes)}
+    code_dtype = np.int8 if len(classes) < 128 else np.int32
+
+    # pass 2: fill the memory-mapped arrays chunk by chunk
+    target.mkdir(parents=True, exist_ok=True)
+    X = np.lib.format.open_memmap(target / "features.npy", mode="w+", dtype=np.float64, shape=(rows, len(feature_names)))
+    y = np.lib.format.open_memmap(target / "labels.npy", mode="w+", dtype=code_dtype, shape=(rows,))
+    start = 0
+    for chunk in pd.read_csv(source, chunksize=chunk_rows):
+        stop = start + len(chunk)
+        try:
+            X[start:stop] = chunk[feature_names].to_numpy(dtype=np.float64)
+        except ValueError as e:
+            raise ValueError(f"Feature columns must be numeric: {e}")
+        y[start:stop] = chunk[label_column].map(lookup).to_numpy()
+        start = stop
+    X.flush()
+    y.flush()
+    del X, y
+
+    return {
+        "rows": rows,
+        "feature_names": feature_names,
+        "label_name": label_column,
+        "classes": [c.item() if hasattr(c, "item") else c for c in classes],
+    }
+
+
+def build_store(source, label_column=None, store_dir=None, chunk_rows=CHUNK_ROWS):
+    """Path of the store for `source`, converting the CSV on first use"""
+    source = Path(source)
+    if is_store(source):
+        return source
+    if not source.exists():
+        raise FileNotFoundError(f"Dataset not found: {source}")
+
+    digest = file_sha256(source)
+    store_dir = Path(store_dir or STORE_DIR)
+    target = store_dir / f"{source.stem}-{digest[:16]}"
+    if label_column:
+        import pandas as pd
+        # the default store already uses the last column as the label
+        if label_column != list(pd.read_csv(source, nrows=0).columns)[-1]:
+            target = target.with_name(f"{target.name}-{label_column}")
+    if is_store(target):
+        return target
+
+    # convert into a private scratch directory and rename, so readers never see
+    # a partial store and concurrent conversions never touch each other's files
+    store_dir.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f".{target.name}.", suffix=".tmp", dir=store_dir))
+    # mkdtemp creates it 0700; a store is shared like the rest of .cache
+    tmp.chmod(0o755)
+    try:
+        meta = _convert(source, tmp, label_column, chunk_rows)
+        meta.update({"source": str(source.resolve()), "source_sha256": digest})
+        (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+        try:
+            tmp.rename(target)
+        except OSError:
+            # another process finished the same conversion first: use its store
+            if not is_store(target):
+                raise
+            shutil.rmtree(tmp, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return target
+
+
+def open_store(source, label_column=None):
+    return FeatureStore(build_store(source, label_column))
+
+
+def load_xy(source, columns=None, label_column=None):
+    """(X, y) for a CSV or store directory; X is a read-only memmap when no columns are selected"""
+    store = open_store(source, label_column)
+    X = store.X if columns is None else store.columns(columns)
+    return X, store.labels()
+
+
+if __name__ == "__main__":
+    for arg in sys.argv[1:]:
+        store = open_store(arg)
+        print(json.dumps({"source": arg, "store": str(store.path), "rows": len(store),
+                          "features": store.feature_names, "classes": store.classes.tolist()}))
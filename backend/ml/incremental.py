@@ -0,0 +1,174 @@
+# backend/ml/incremental.py
+# State kept next to the run_model.py artifacts for the `update` action.
+#
+#   reservoir.npz          uniform sample of every labeled row seen so far
+#                          (training split + all updates), at most
+#                          ML_RESERVOIR_SIZE rows (default 10000); one per
+#                          version directory (models/reservoir.npz before that)
+#   models/versions.json   artifact version counter and update history; the
+#                          artifacts of each version are kept in
+#                          models/versions/<version>/ (artifact_versions.py)
+#
+# Naive Bayes and the MLP are updated with partial_fit on the new rows only.
+# KNN, the decision tree and the SVM cannot learn incrementally; they are
+# refitted on the reservoir, so an update costs O(new rows + reservoir size)
+# no matter how much history has accumulated.
+import os
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from batch_io import parse_rows
+
+MODELS_DIR = Path(__file__).parent / "models"
+RESERVOIR_NAME = "reservoir.npz"
+# pre-versioning location, still read when the current version has no reservoir
+RESERVOIR_PATH = MODELS_DIR / RESERVOIR_NAME
+VERSIONS_PATH = MODELS_DIR / "versions.json"
+DEFAULT_RESERVOIR_SIZE = 10_000
+HISTORY_ENTRIES = 50
+
+
+def reservoir_capacity():
+    return int(os.environ.get("ML_RESERVOIR_SIZE", "0") or 0) or DEFAULT_RESERVOIR_SIZE
+
+
+# ---------------------------------------------------------------
+# reservoir (Algorithm R, vectorized per batch)
+# ---------------------------------------------------------------
+
+def new_reservoir(X, y, feature_names=None, label_name=None, capacity=None, seed=42):
+    X = np.asarray(X, dtype=np.float64)
+    res = {
+        "X": X[:0].copy(),
+        "y": np.asarray(y)[:0].copy(),
+        "seen": 0,
+        "capacity": capacity or reservoir_capacity(),
+        "seed": seed,
+        "feature_names": list(feature_names) if feature_names is not None else None,
+        "label_name": label_name,
+    }
+    return reservoir_add(res, X, y)
+
+
+def reservoir_add(res, X, y):
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y)
+    cap, seen, n = res["capacity"], res["seen"], len(X)
+    if y.dtype != res["y"].dtype:
+        y = y.astype(np.result_type(y, res["y"]))
+        res["y"] = res["y"].astype(y.dtype)
+
+    # rows that still fit are appended
+    fill = max(0, min(n, cap - len(res["X"])))
+    res["X"] = np.concatenate([res["X"], X[:fill]])
+    res["y"] = np.concatenate([res["y"], y[:fill]])
+
+    # row t (0-based over the whole stream) then replaces slot randint(0, t]
+    # when that slot is < capacity; seeding by `seen` keeps updates reproducible
+    if fill < n:
+        rng = np.random.default_rng([res["seed"], seen])
+        t = np.arange(seen + fill, seen + n)
+        slots = rng.integers(0, t + 1)
+        accepted = np.flatnonzero(slots < cap)
+        if len(accepted):
+            # a later row wins a slot drawn more than once, as in the sequential loop
+            last_slots, first_rev = np.unique(slots[accepted][::-1], return_index=True)
+            rows = fill + accepted[::-1][first_rev]
+            res["X"][last_slots] = X[rows]
+            res["y"][last_slots] = y[rows]
+    res["seen"] = seen + n
+    return res
+
+
+def save_reservoir(res, path=RESERVOIR_PATH):
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    meta = {k: res[k] for k in ("seen", "capacity", "seed", "feature_names", "label_name")}
+    with open(tmp, "wb") as f:
+        np.savez(f, X=res["X"], y=res["y"], meta=np.array(json.dumps(meta)))
+    os.replace(tmp, path)
+
+
+def load_reservoir(path=RESERVOIR_PATH):
+    if not Path(path).exists():
+        raise FileNotFoundError("No reservoir found; run the 'train' action before 'update'")
+    with np.load(path) as data:
+        res = json.loads(str(data["meta"]))
+        res["X"], res["y"] = data["X"], data["y"]
+    return res
+
+
+# ---------------------------------------------------------------
+# labeled update rows
+# ---------------------------------------------------------------
+
+def parse_labeled_rows(rows, feature_names, label_name, classes, n_features=None):
+    """(X, y, valid, errors) for rows that carry a label; unknown labels are row errors"""
+    label_name = label_name or "label"
+    known = {str(c): c for c in classes}
+    labels, feature_rows = [], []
+    for row in rows:
+        if isinstance(row, dict):
+            labels.append(row.get(label_name))
+            feature_rows.append(row)
+        elif isinstance(row, (list, tuple)) and row:
+            # plain lists carry the label last, like the training CSVs
+            labels.append(row[-1])
+            feature_rows.append(list(row[:-1]))
+        else:
+            labels.append(None)
+            feature_rows.append(row)
+
+    X, valid, errors = parse_rows(feature_rows, feature_names, n_features=n_features)
+    keep, y = [], []
+    for j, i in enumerate(valid):
+        label = labels[i]
+        if label is None or label == "":
+            errors[i] = f"Missing label '{label_name}'"
+            continue
+        key = str(label)
+        if key not in known:
+            # e.g. "2.0" in a CSV for integer classes
+            try:
+                key = str(type(classes[0].item())(float(label)))
+            except (TypeError, ValueError, AttributeError):
+                pass
+        if key not in known:
+            errors[i] = f"Unknown label {label!r} (expected one of {sorted(known)})"
+            continue
+        keep.append(j)
+        y.append(known[key])
+    valid = [valid[j] for j in keep]
+    return X[keep], np.asarray(y, dtype=np.asarray(classes).dtype), valid, errors
+
+
+# ---------------------------------------------------------------
+# versions.json
+# ---------------------------------------------------------------
+
+def read_versions(path=VERSIONS_PATH):
+    try:
+        return json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {"version": 0, "models": {}, "history": []}
+
+
+def record_version(action, models, rows=None, path=VERSIONS_PATH):
+    """Bump the version for `models` ({name: {"method": ..., "sha256": ...}})"""
+    versions = read_versions(path)
+    version = versions["version"] + 1
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for name, info in models.items():
+        versions["models"][name] = {"version": version, "updated_at": now, **info}
+    versions["version"] = version
+    entry = {"version": version, "action": action, "at": now, "models": sorted(models)}
+    if rows is not None:
+        entry["rows"] = rows
+    versions["history"] = (versions["history"] + [entry])[-HISTORY_ENTRIES:]
+    tmp = Path(path).with_name(f".{Path(path).name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(versions, indent=2))
+    os.replace(tmp, path)
+    return version
@@ -0,0 +1,252 @@
+# backend/ml/instrumentation.py
+# Opt-in per-stage timings for run_model.py and predict_knn.py.
+#
+# Enabled with ML_TIMINGS=1, `"timings": true` in a run_model request or
+# `--timings` for predict_knn.py. Each request then reports
+#   "timings": {"stages_ms": {"startup": .., "imports": .., "load": .., "parse": ..,
+#                             "predict": .., "predict_proba": .., "serialize": ..},
+#               "total_ms": .., "peak_rss_mb": .., "rss_mb": ..}
+# "startup" is interpreter start-up before the script's first line (one-shot
+# runs only). "imports" is the time spent in import statements, including the
+# module imports unpickling triggers; it is subtracted from the stage it
+# happened in, so the stages add up to the total.
+#
+# Every instrumented request is also folded into a Prometheus text file
+# (ML_METRICS_PATH, default .cache/metrics/ml.prom) that the Node layer serves
+# at GET /api/ml/metrics. Running totals live in a JSON file next to it and
+# are updated under an exclusive lock, so concurrent processes add up.
+import os
+import sys
+import json
+import time
+import builtins
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+DEFAULT_METRICS_PATH = ML_DIR / ".cache" / "metrics" / "ml.prom"
+# request latency histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()
+_original_import = builtins.__import__
+
+
+def _process_age():
+    """Seconds since this process was started, or None off Linux"""
+    try:
+        with open("/proc/self/stat") as f:
+            # field 22 (starttime, clock ticks after boot) follows the ")" of the comm field
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# measured when the entry script imports this module, i.e. before its own work
+STARTUP_S = _process_age()
+
+
+def enabled(flag=None):
+    if flag is not None:
+        return bool(flag)
+    return os.environ.get("ML_TIMINGS", "").lower() in ("1", "true", "yes")
+
+
+def _timed_import(*args, **kwargs):
+    timer = getattr(_local, "timer", None)
+    if timer is None or timer._import_depth:
+        # nested imports are already inside the outer one's time
+        return _original_import(*args, **kwargs)
+    timer._import_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_import(*args, **kwargs)
+    finally:
+        timer._import_depth -= 1
+        timer._import_s += time.perf_counter() - started
+
+
+class Timer:
+    def __init__(self, include_startup=False):
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.startup_s = STARTUP_S if include_startup else None
+        self._import_s = 0.0
+        self._import_depth = 0
+
+    @contextmanager
+    def stage(self, name):
+        imports_before = self._import_s
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started - (self._import_s - imports_before)
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def report(self):
+        total = time.perf_counter() - self.started
+        stages = dict(self.stages)
+        if self._import_s:
+            stages["imports"] = self._import_s
+        # time outside any stage (dispatch, validation, ...)
+        other = total - sum(stages.values())
+        if other > 0:
+            stages["other"] = other
+        if self.startup_s is not None:
+            stages = {"startup": self.startup_s, **stages}
+            total += self.startup_s
+        rss = _rss_mb()
+        return {
+            "stages_ms": {k: round(v * 1000, 3) for k, v in stages.items()},
+            "total_ms": round(total * 1000, 3),
+            "peak_rss_mb": rss[0],
+            "rss_mb": rss[1],
+        }
+
+
+def _rss_mb():
+    peak = current = None
+    try:
+        import resource
+        scale = 1 if sys.platform == "darwin" else 1024
+        peak = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+    except ImportError:
+        pass
+    try:
+        with open("/proc/self/statm") as f:
+            current = round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        pass
+    return peak, current
+
+
+def start(include_startup=False):
+    """Begin timing the current request on this thread"""
+    if builtins.__import__ is not _timed_import:
+        builtins.__import__ = _timed_import
+    timer = Timer(include_startup)
+    _local.timer = timer
+    return timer
+
+
+def finish():
+    timer = getattr(_local, "timer", None)
+    _local.timer = None
+    return timer
+
+
+def current():
+    return getattr(_local, "timer", None)
+
+
+def stage(name):
+    """Time a block against the current request; a no-op when timings are off"""
+    timer = getattr(_local, "timer", None)
+    return timer.stage(name) if timer is not None else nullcontext()
+
+
+def dumps_with_timings(result, timer, labels=None):
+    """json.dumps(result) with the timings appended, recording them as metrics too"""
+    with timer.stage("serialize"):
+        body = json.dumps(result, default=str)
+    finish()
+    timings = timer.report()
+    try:
+        record(timings, labels or {})
+    except OSError:
+        # metrics are best effort; never fail the request over them
+        pass
+    # splice into the serialized object instead of serializing the response twice
+    sep = ", " if result else ""
+    return f'{body[:-1]}{sep}"timings": {json.dumps(timings)}}}'
+
+
+# ---------------------------------------------------------------
+# Prometheus text file
+# ---------------------------------------------------------------
+
+def metrics_path():
+    return Path(os.environ.get("ML_METRICS_PATH") or DEFAULT_METRICS_PATH)
+
+
+def _label_value(value):
+    # the escapes the Prometheus text format defines for label values
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_key(labels):
+    return ",".join(f'{k}="{_label_value(v)}"' for k, v in sorted(labels.items()))
+
+
+def record(timings, labels, path=None):
+    path = metrics_path() if path is None else Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    state_path = path.with_suffix(".json")
+    with open(path.with_suffix(".lock"), "w") as lock:
+        try:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        try:
+            state = json.loads(state_path.read_text())
+        except (FileNotFoundError, ValueError):
+            state = {"requests": {}, "stages": {}, "buckets": {}, "peak_rss_mb": {}}
+
+        key = _label_key(labels)
+        total_s = timings["total_ms"] / 1000
+        req = state["requests"].setdefault(key, {"count": 0, "sum": 0.0})
+        req["count"] += 1
+        req["sum"] += total_s
+        buckets = state["buckets"].setdefault(key, [0] * len(BUCKETS))
+        for i, le in enumerate(BUCKETS):
+            if total_s <= le:
+                buckets[i] += 1
+        for name, ms in timings["stages_ms"].items():
+            st = state["stages"].setdefault(_label_key({**labels, "stage": name}), {"count": 0, "sum": 0.0})
+            st["count"] += 1
+            st["sum"] += ms / 1000
+        if timings.get("peak_rss_mb") is not None:
+            state["peak_rss_mb"][key] = max(state["peak_rss_mb"].get(key, 0), timings["peak_rss_mb"])
+
+        _atomic_write(state_path, json.dumps(state))
+        _atomic_write(path, render(state))
+
+
+def render(state):
+    lines = [
+        "# HELP ml_request_duration_seconds End-to-end ML request time, including start-up when measured.",
+        "# TYPE ml_request_duration_seconds histogram",
+    ]
+    for key, req in sorted(state["requests"].items()):
+        sep = "," if key else ""
+        for le, count in zip(BUCKETS, state["buckets"][key]):
+            lines.append(f'ml_request_duration_seconds_bucket{{{key}{sep}le="{le}"}} {count}')
+        lines.append(f'ml_request_duration_seconds_bucket{{{key}{sep}le="+Inf"}} {req["count"]}')
+        lines.append(f"ml_request_duration_seconds_sum{{{key}}} {req['sum']:.6f}")
+        lines.append(f"ml_request_duration_seconds_count{{{key}}} {req['count']}")
+    lines += [
+        "# HELP ml_stage_duration_seconds Time spent per request stage.",
+        "# TYPE ml_stage_duration_seconds summary",
+    ]
+    for key, st in sorted(state["stages"].items()):
+        lines.append(f"ml_stage_duration_seconds_sum{{{key}}} {st['sum']:.6f}")
+        lines.append(f"ml_stage_duration_seconds_count{{{key}}} {st['count']}")
+    lines += [
+        "# HELP ml_peak_rss_bytes Highest peak resident memory seen for a request.",
+        "# TYPE ml_peak_rss_bytes gauge",
+    ]
+    for key, mb in sorted(state["peak_rss_mb"].items()):
+        lines.append(f"ml_peak_rss_bytes{{{key}}} {int(mb * 2 ** 20)}")
+    return "\n".join(lines) + "\n"
+
+
+def _atomic_write(path, text):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
@@ -1,22 +1,23 @@
-import pandas as pd
 from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
-import joblib
+
+from feature_store import load_xy
+from mmap_artifacts import atomic_dump, export_artifact, mmap_enabled
+from run_model import build_estimator
 
 # Sample: student scores dataset
 # Columns: [quiz1, quiz2, quiz3, performance]
-data = pd.read_csv("student_scores.csv")
-
-X = data.drop("performance", axis=1)  # quiz scores
-y = data["performance"]  # labels (weak/average/strong)
+X, y = load_xy("student_scores.csv", label_column="performance")  # quiz scores, labels (weak/average/strong)
 
 # Split dataset
 X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
-# Train KNN model
-knn = KNeighborsClassifier(n_neighbors=3)
+# Train KNN model: the run_model.py pipeline (scaler + KD-tree index, built once
+# and saved with the model) with the tune.py parameters, if any
+knn = build_estimator("knn")
 knn.fit(X_train, y_train)
 
-# Save model
-joblib.dump(knn, "knn_model.pkl")
+# Save model (tmp + rename, as train_models.py does: predict_knn.py may be reading it)
+atomic_dump(knn, "knn_model.pkl")
+if mmap_enabled():
+    export_artifact("knn_model.pkl")
 print("✅ KNN Model trained and saved!")
@@ -0,0 +1,284 @@
+# backend/ml/lookup_table.py
+# "Compiled" predictors: a trained model evaluated once over a quantization
+# grid of the bounded input space, so serving is an array lookup.
+#
+#   quiz1..quiz3  0..100 in steps of --quiz-step (default 5)
+#   time_spent    300..2400 s in steps of --time-step (default 100; the range
+#                 data_generator.py clips to)
+#   confidence    1..5 in steps of 1
+#
+# Inputs are snapped to the nearest grid point and clipped to the grid range.
+# A table is a directory models/lut/<model>/ holding labels.npy (class codes),
+# proba.npy (probabilities scaled to uint8) and meta.json; the arrays are
+# memory-mapped on load. meta.json records the SHA-256 of the artifact it was
+# compiled from, and a stale table is never used.
+#
+#   python lookup_table.py build [knn ...] [--quiz-step 5] [--time-step 100]
+#   python lookup_table.py report knn [--holdout 20000]    # agreement vs the model
+#   python lookup_table.py sweep knn --quiz-steps 10 5 2 1  # resolution vs size
+import sys
+import json
+import time
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+from model_registry import DigestCache, file_sha256
+
+ML_DIR = Path(__file__).parent
+MODELS_DIR = ML_DIR / "models"
+LUT_DIR = MODELS_DIR / "lut"
+FEATURE_NAMES = ["quiz1", "quiz2", "quiz3", "time_spent", "confidence"]
+CHUNK_CELLS = 250_000
+PROBA_SCALE = 255
+# source artifact hashes for the freshness check, kept while the file is unchanged
+_DIGESTS = DigestCache()
+
+
+def make_grid(quiz_step=5, time_step=100):
+    """[(name, low, high, step)] per feature, in model input order"""
+    return [
+        ("quiz1", 0.0, 100.0, float(quiz_step)),
+        ("quiz2", 0.0, 100.0, float(quiz_step)),
+        ("quiz3", 0.0, 100.0, float(quiz_step)),
+        ("time_spent", 300.0, 2400.0, float(time_step)),
+        ("confidence", 1.0, 5.0, 1.0),
+    ]
+
+
+def grid_shape(grid):
+    return tuple(int(round((high - low) / step)) + 1 for _, low, high, step in grid)
+
+
+def grid_points(grid, flat_index):
+    shape = grid_shape(grid)
+    coords = np.unravel_index(flat_index, shape)
+    return np.column_stack([low + c * step for (_, low, _, step), c in zip(grid, coords)])
+
+
+class LookupTablePredictor:
+    """predict/predict_proba over a compiled table; drop-in for the batch helpers"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        self.grid = [tuple(g) for g in self.meta["grid"]]
+        self.shape = grid_shape(self.grid)
+        self.classes_ = np.asarray(self.meta["classes"])
+        self.n_features_in_ = len(self.grid)
+        self._labels = np.load(self.path / "labels.npy", mmap_mode="r")
+        self._proba = np.load(self.path / "proba.npy", mmap_mode="r")
+        self._low = np.array([g[1] for g in self.grid])
+        self._step = np.array([g[3] for g in self.grid])
+        self._max = np.array(self.shape) - 1
+
+    def cells(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but the lookup table expects {self.n_features_in_}")
+        idx = np.clip(np.rint((X - self._low) / self._step), 0, self._max).astype(np.intp)
+        return np.ravel_multi_index(idx.T, self.shape)
+
+    def predict(self, X):
+        return self.classes_[self._labels[self.cells(X)]]
+
+    def predict_proba(self, X):
+        return self._proba[self.cells(X)].astype(np.float64) / PROBA_SCALE
+
+
+def table_dir(model_name):
+    return LUT_DIR / model_name
+
+
+def artifact_path(model_name):
+    # the served version; a table compiled from another version fails the sha256 check
+    from artifact_versions import current_dir
+    return current_dir() / f"{model_name}.joblib"
+
+
+def compile_model(model, grid, chunk_cells=CHUNK_CELLS):
+    """(labels, proba) over every grid cell, evaluated in chunks"""
+    classes = np.asarray(model.classes_)
+    n_cells = int(np.prod(grid_shape(grid)))
+    code_dtype = np.uint8 if len(classes) <= 256 else np.uint16
+    labels = np.empty(n_cells, dtype=code_dtype)
+    proba = np.empty((n_cells, len(classes)), dtype=np.uint8)
+    lookup = {c: i for i, c in enumerate(classes.tolist())}
+    for start in range(0, n_cells, chunk_cells):
+        stop = min(start + chunk_cells, n_cells)
+        points = grid_points(grid, np.arange(start, stop))
+        # predict() is stored as well: for SVC it can differ from argmax(predict_proba)
+        preds = model.predict(points)
+        labels[start:stop] = [lookup[p] for p in preds.tolist()]
+        proba[start:stop] = np.rint(model.predict_proba(points) * PROBA_SCALE)
+    return labels, proba, classes
+
+
+def build(model_name, quiz_step=5, time_step=100):
+    from joblib import load
+    source = artifact_path(model_name)
+    if not source.exists():
+        raise FileNotFoundError(f"Model file not found: {source}")
+    model = load(source)
+    if getattr(model, "n_features_in_", None) != len(FEATURE_NAMES):
+        raise ValueError(f"{model_name} was not trained on {FEATURE_NAMES}; cannot compile a lookup table")
+
+    grid = make_grid(quiz_step, time_step)
+    started = time.perf_counter()
+    labels, proba, classes = compile_model(model, grid)
+    build_s = time.perf_counter() - started
+
+    target = table_dir(model_name)
+    tmp = target.with_name(f".{target.name}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    np.save(tmp / "labels.npy", labels)
+    np.save(tmp / "proba.npy", proba)
+    meta = {
+        "model": model_name,
+        "grid": [list(g) for g in grid],
+        "shape": list(grid_shape(grid)),
+        "classes": classes.tolist(),
+        "source_sha256": file_sha256(source),
+        "build_s": round(build_s, 3),
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, indent=2))
+    # swap the whole directory so readers never mix old and new arrays
+    old = target.with_name(f".{target.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if target.exists():
+        target.rename(old)
+    tmp.rename(target)
+    shutil.rmtree(old, ignore_errors=True)
+    return {**meta, "cells": len(labels), "bytes": labels.nbytes + proba.nbytes}
+
+
+def fresh_table(model_name):
+    """Table directory for model_name if it was compiled from the current artifact"""
+    target = table_dir(model_name)
+    try:
+        meta = json.loads((target / "meta.json").read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if meta.get("source_sha256") != _DIGESTS.get(artifact_path(model_name)):
+        return None
+    return target
+
+
+def load_table(model_name):
+    target = fresh_table(model_name)
+    if target is None:
+        raise FileNotFoundError(f"No up-to-date lookup table for {model_name}; run: python lookup_table.py build {model_name}")
+    return LookupTablePredictor(target)
+
+
+# ---------------------------------------------------------------
+# agreement report
+# ---------------------------------------------------------------
+
+def _holdout(rows, seed):
+    # fresh draws from the generator's distributions; a seed the training data did not use
+    from data_generator import generate_chunk
+    X, _ = generate_chunk(rows, seed)
+    return X
+
+
+def _latency_us(predict, X, n=200):
+    samples = []
+    for row in X[:n]:
+        started = time.perf_counter()
+        predict(row.reshape(1, -1))
+        samples.append(time.perf_counter() - started)
+    return round(float(np.median(samples)) * 1e6, 1)
+
+
+def agreement(model, table, X):
+    started = time.perf_counter()
+    model_pred = model.predict(X)
+    model_proba = model.predict_proba(X)
+    model_s = time.perf_counter() - started
+    started = time.perf_counter()
+    table_pred = table.predict(X)
+    table_proba = table.predict_proba(X)
+    table_s = time.perf_counter() - started
+    diff = np.abs(model_proba - table_proba)
+    return {
+        "rows": len(X),
+        "label_agreement": round(float(np.mean(model_pred == table_pred)), 4),
+        "proba_mean_abs_diff": round(float(diff.mean()), 4),
+        "proba_max_abs_diff": round(float(diff.max()), 4),
+        "model_batch_ms": round(model_s * 1000, 2),
+        "table_batch_ms": round(table_s * 1000, 2),
+        "model_single_us": _latency_us(model.predict, X),
+        "table_single_us": _latency_us(table.predict, X),
+    }
+
+
+def report(model_name, holdout=20_000, seed=2024):
+    from joblib import load
+    table = load_table(model_name)
+    result = agreement(load(artifact_path(model_name)), table, _holdout(holdout, seed))
+    return {"model": model_name, "shape": list(table.shape), "cells": int(np.prod(table.shape)),
+            "bytes": table._labels.nbytes + table._proba.nbytes, **result}
+
+
+def sweep(model_name, quiz_steps=(10, 5, 2), time_step=100, holdout=20_000, seed=2024):
+    """Agreement and size per quiz grid step, to choose a resolution"""
+    from joblib import load
+    model = load(artifact_path(model_name))
+    X = _holdout(holdout, seed)
+    rows = []
+    for step in quiz_steps:
+        grid = make_grid(step, time_step)
+        started = time.perf_counter()
+        labels, proba, classes = compile_model(model, grid)
+        build_s = time.perf_counter() - started
+        with _scratch_table(model_name, grid, labels, proba, classes) as table:
+            rows.append({"quiz_step": step, "time_step": time_step, "cells": len(labels),
+                         "bytes": labels.nbytes + proba.nbytes, "build_s": round(build_s, 2),
+                         **agreement(model, table, X)})
+    return {"model": model_name, "results": rows}
+
+
+class _scratch_table:
+    def __init__(self, model_name, grid, labels, proba, classes):
+        import tempfile
+        self._tmp = tempfile.TemporaryDirectory()
+        path = Path(self._tmp.name)
+        np.save(path / "labels.npy", labels)
+        np.save(path / "proba.npy", proba)
+        (path / "meta.json").write_text(json.dumps({"model": model_name, "grid": [list(g) for g in grid],
+                                                    "classes": classes.tolist()}))
+        self.table = LookupTablePredictor(path)
+
+    def __enter__(self):
+        return self.table
+
+    def __exit__(self, *exc):
+        del self.table
+        self._tmp.cleanup()
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compiled lookup-table predictors")
+    parser.add_argument("command", choices=["build", "report", "sweep"])
+    parser.add_argument("models", nargs="*", default=None)
+    parser.add_argument("--quiz-step", type=float, default=5)
+    parser.add_argument("--time-step", type=float, default=100)
+    parser.add_argument("--quiz-steps", type=float, nargs="+", default=[10, 5, 2])
+    parser.add_argument("--holdout", type=int, default=20_000)
+    args = parser.parse_args()
+    models = args.models or ["knn", "naive_bayes", "decision_tree", "svm", "neural_network"]
+
+    if args.command == "build":
+        out = {m: build(m, args.quiz_step, args.time_step) for m in models}
+    elif args.command == "report":
+        out = {m: report(m, args.holdout) for m in models}
+    else:
+        out = {m: sweep(m, args.quiz_steps, args.time_step, args.holdout) for m in models}
+    print(json.dumps({"success": True, "results": out}, indent=2))
+    sys.exit(0)
@@ -0,0 +1,349 @@
+# backend/ml/microbatch.py
+# Asyncio micro-batching front end for single-row predictions.
+#
+#   python run_model.py serve --microbatch [--socket /tmp/ml.sock]
+#                             [--window-ms 5] [--max-batch 256] [--max-queue 1024]
+#                             [--timeout-ms 1000] [--workers 4]
+#
+# Single-row `predict` requests are queued per model. A model's queue is
+# flushed as one vectorized predict/predict_proba call when it holds
+# --max-batch rows or when its oldest row has waited --window-ms, and every
+# caller gets its own row back. While a batch runs, new rows keep queueing,
+# so under load batches fill up on their own.
+#
+# Backpressure: once --max-queue rows are waiting, new predictions are
+# rejected immediately with "overloaded" instead of adding latency for
+# everyone, and rows that waited longer than --timeout-ms are answered with
+# an error instead of being evaluated. Every other action (batches, train,
+# status, ...) goes to run_model.handle_request on the worker pool.
+# Every request counts towards the server's `health` counters, and
+# `"timings": true` (or ML_TIMINGS=1) adds per-stage timings on both paths.
+#
+# The defaults can also be set with ML_MICROBATCH_WINDOW_MS,
+# ML_MICROBATCH_MAX_ROWS, ML_MICROBATCH_MAX_QUEUE and ML_MICROBATCH_TIMEOUT_MS.
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+import contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Overloaded(Exception):
+    pass
+
+
+def options_from_env():
+    def number(name, default):
+        value = os.environ.get(name, "")
+        return float(value) if value != "" else default
+    return {
+        "window_ms": number("ML_MICROBATCH_WINDOW_MS", 5.0),
+        "max_batch": int(number("ML_MICROBATCH_MAX_ROWS", 256)),
+        "max_queue": int(number("ML_MICROBATCH_MAX_QUEUE", 1024)),
+        "timeout_ms": number("ML_MICROBATCH_TIMEOUT_MS", 1000.0),
+    }
+
+
+class MicroBatcher:
+    def __init__(self, resolve, window_ms=5.0, max_batch=256, max_queue=1024, timeout_ms=1000.0, executor=None):
+        # resolve(model_name) -> fitted estimator (run_model.load_model)
+        self.resolve = resolve
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.timeout = timeout_ms / 1000 if timeout_ms else None
+        self.executor = executor or ThreadPoolExecutor(max_workers=4)
+        self._queues = {}
+        self._wakeups = {}
+        self._tasks = {}
+        self.depth = 0
+        self.stats_ = {"requests": 0, "batches": 0, "rows": 0, "rejected": 0, "timed_out": 0,
+                       "errors": 0, "max_batch_seen": 0, "wait_ms_total": 0.0}
+
+    def stats(self):
+        s = dict(self.stats_)
+        s["queue_depth"] = self.depth
+        s["mean_batch"] = round(s["rows"] / s["batches"], 2) if s["batches"] else None
+        wait_ms = s.pop("wait_ms_total")
+        s["mean_wait_ms"] = round(wait_ms / s["rows"], 3) if s["rows"] else None
+        return s
+
+    async def predict(self, model, row):
+        """(prediction, probabilities or None, batch size) for one feature row"""
+        loop = asyncio.get_running_loop()
+        self.stats_["requests"] += 1
+        if self.depth >= self.max_queue:
+            self.stats_["rejected"] += 1
+            raise Overloaded(f"overloaded: {self.depth} rows queued (max {self.max_queue})")
+        if model not in self._queues:
+            self._queues[model] = deque()
+            self._wakeups[model] = asyncio.Event()
+            self._tasks[model] = loop.create_task(self._drain(model))
+        future = loop.create_future()
+        self._queues[model].append((row, future, loop.time()))
+        self.depth += 1
+        self._wakeups[model].set()
+        return await future
+
+    async def _drain(self, model):
+        loop = asyncio.get_running_loop()
+        queue, wakeup = self._queues[model], self._wakeups[model]
+        while True:
+            if not queue:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            # hold the batch open until it is full or its oldest row's window closes
+            deadline = queue[0][2] + self.window
+            while len(queue) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [queue.popleft() for _ in range(min(len(queue), self.max_batch))]
+            self.depth -= len(batch)
+            now = loop.time()
+            live = []
+            for row, future, enqueued in batch:
+                if future.done():
+                    continue
+                if self.timeout and now - enqueued > self.timeout:
+                    self.stats_["timed_out"] += 1
+                    future.set_exception(TimeoutError(f"timed out after {(now - enqueued) * 1000:.0f} ms in queue"))
+                    continue
+                live.append((row, future, enqueued))
+            if not live:
+                continue
+
+            try:
+                preds, proba = await loop.run_in_executor(
+                    self.executor, self._evaluate, model, [r for r, _, _ in live])
+            except Exception as e:
+                self.stats_["errors"] += len(live)
+                for _, future, _ in live:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats_["batches"] += 1
+            self.stats_["rows"] += len(live)
+            self.stats_["max_batch_seen"] = max(self.stats_["max_batch_seen"], len(live))
+            self.stats_["wait_ms_total"] += sum(now - enqueued for _, _, enqueued in live) * 1000
+            for j, (_, future, _) in enumerate(live):
+                if not future.done():
+                    future.set_result((preds[j], None if proba is None else proba[j], len(live)))
+
+    def _evaluate(self, model_name, rows):
+        import numpy as np
+        from batch_io import predict_rows
+        model = self.resolve(model_name)
+        preds, proba = predict_rows(model, np.asarray(rows, dtype=float))
+        return preds.tolist(), None if proba is None else proba.tolist()
+
+    def validate(self, model_name, features):
+        """The request's single row as floats, or ValueError"""
+        from batch_io import parse_rows
+        row = features[0] if len(features) == 1 and isinstance(features[0], (list, tuple)) else features
+        width = getattr(self.resolve(model_name), "n_features_in_", None)
+        _, _, errors = parse_rows([row], n_features=width)
+        if errors:
+            raise ValueError(errors[0])
+        return [float(v) for v in row]
+
+
+def _is_single_row(features):
+    if not isinstance(features, list) or not features:
+        return False
+    if isinstance(features[0], list):
+        return len(features) == 1
+    return True
+
+
+class MicroBatchServer:
+    def __init__(self, batcher, fallback, health=None, record=None, labels=None):
+        # fallback(payload) -> serialized response for everything that is not batched;
+        # record(out) counts a response answered here; labels(payload) -> metric labels
+        self.batcher = batcher
+        self.fallback = fallback
+        self.health = health
+        self.record = record
+        self.labels = labels
+        self.stopping = None
+        self.pending = set()
+        self.writers = set()
+
+    async def reply(self, payload):
+        """Serialized response; with timings on, the stages are appended as in run_model.py"""
+        loop = asyncio.get_running_loop()
+        if not self._batched(payload) and (payload.get("action") or "").lower() not in ("health", "ping", "shutdown"):
+            # counted and timed by the fallback on its worker thread
+            try:
+                return await loop.run_in_executor(self.batcher.executor, self.fallback, payload)
+            except Exception as e:
+                out = {"success": False, "error": str(e)}
+                return json.dumps({"id": payload["id"], **out} if "id" in payload else out)
+        import instrumentation
+        # the loop thread serves many requests at once, so the timer is not
+        # made current (instrumentation.start) and stages are timed explicitly
+        timer = instrumentation.Timer() if instrumentation.enabled(payload.get("timings")) else None
+        out = await self.respond(payload, timer)
+        if self.record:
+            self.record(out)
+        if timer is None:
+            return json.dumps(out, default=str)
+        return instrumentation.dumps_with_timings(out, timer, self.labels(payload) if self.labels else None)
+
+    def _batched(self, payload):
+        return ((payload.get("action") or "").lower() == "predict" and payload.get("model")
+                and _is_single_row(payload.get("features"))
+                and payload.get("eps") is None and not payload.get("compiled"))
+
+    async def respond(self, payload, timer=None):
+        loop = asyncio.get_running_loop()
+        action = (payload.get("action") or "").lower()
+        timed = timer.stage if timer else lambda name: contextlib.nullcontext()
+        if action in ("health", "ping"):
+            out = {**(self.health() if self.health else {"success": True}), "microbatch": self.batcher.stats()}
+        elif action == "shutdown":
+            self.stopping.set()
+            out = {"success": True, "status": "stopping"}
+        elif self._batched(payload):
+            model = payload["model"]
+            started = time.perf_counter()
+            try:
+                with timed("parse"):
+                    row = await loop.run_in_executor(self.batcher.executor, self.batcher.validate, model, payload["features"])
+                # queue wait included
+                with timed("predict"):
+                    pred, proba, size = await self.batcher.predict(model, row)
+                out = {"success": True, "model": model,
+                       "result": {"predictions": [pred], "probabilities": None if proba is None else [proba]},
+                       "batch": {"size": size, "latency_ms": round((time.perf_counter() - started) * 1000, 3)}}
+            except Overloaded as e:
+                out = {"success": False, "error": str(e), "overloaded": True}
+            except Exception as e:
+                out = {"success": False, "error": str(e)}
+        else:
+            raise ValueError(f"Not answered by the micro-batcher: {action}")
+        if "id" in payload:
+            out = {"id": payload["id"], **out}
+        return out
+
+    async def handle_line(self, line, write):
+        try:
+            payload = json.loads(line)
+            if not isinstance(payload, dict):
+                raise ValueError("Request must be a JSON object")
+        except Exception as e:
+            write(json.dumps({"success": False, "error": f"Invalid request: {e}"}))
+            return
+        write(await self.reply(payload))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+        return task
+
+    async def _client(self, reader, writer):
+        def write(text):
+            if not writer.is_closing():
+                writer.write((text + "\n").encode("utf-8"))
+        mine = set()
+        self.writers.add(writer)
+        try:
+            while True:
+                raw = await reader.readline()
+                if not raw:
+                    break
+                if raw.strip():
+                    # not awaited: the connection's next request queues right behind this one
+                    mine.add(self._spawn(self.handle_line(raw.decode("utf-8"), write)))
+            await asyncio.gather(*mine, return_exceptions=True)
+            await writer.drain()
+        except (asyncio.CancelledError, ConnectionError):
+            # shutdown (run() has already flushed every response) or the client went away
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def serve_socket(self, socket_path):
+        from pathlib import Path
+        path = Path(socket_path)
+        if path.exists():
+            path.unlink()
+        server = await asyncio.start_unix_server(self._client, path=str(path))
+        try:
+            await self.stopping.wait()
+        finally:
+            # stop accepting; open connections are flushed by run() and then cancelled
+            server.close()
+            if path.exists():
+                path.unlink()
+
+    async def serve_stdio(self):
+        # a reader thread feeds stdin lines into the loop; stdout writes are
+        # made from the loop thread only, so no lock is needed
+        loop = asyncio.get_running_loop()
+        lines = asyncio.Queue()
+
+        def read():
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(lines.put_nowait, line)
+            loop.call_soon_threadsafe(lines.put_nowait, None)
+        threading.Thread(target=read, daemon=True).start()
+
+        def write(text):
+            sys.stdout.write(text + "\n")
+            sys.stdout.flush()
+
+        stop = asyncio.ensure_future(self.stopping.wait())
+        while True:
+            get = asyncio.ensure_future(lines.get())
+            done, _ = await asyncio.wait({get, stop}, return_when=asyncio.FIRST_COMPLETED)
+            if get not in done:
+                get.cancel()
+                break
+            line = get.result()
+            if line is None:
+                break
+            if line.strip():
+                self._spawn(self.handle_line(line, write))
+        stop.cancel()
+
+    async def run(self, socket_path=None):
+        self.stopping = asyncio.Event()
+        self.pending = set()
+        self.writers = set()
+        if socket_path:
+            await self.serve_socket(socket_path)
+        else:
+            await self.serve_stdio()
+        # answer everything already accepted before the loop goes away
+        while self.pending:
+            await asyncio.gather(*list(self.pending), return_exceptions=True)
+        for writer in list(self.writers):
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+
+def serve_microbatch(resolve, fallback, health=None, socket_path=None, workers=4,
+                     window_ms=5.0, max_batch=256, max_queue=1024, timeout_ms=1000.0, record=None, labels=None):
+    executor = ThreadPoolExecutor(max_workers=workers)
+    batcher = MicroBatcher(resolve, window_ms, max_batch, max_queue, timeout_ms, executor)
+    try:
+        asyncio.run(MicroBatchServer(batcher, fallback, health, record, labels).run(socket_path))
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,195 @@
+# backend/ml/mmap_artifacts.py
+# Memory-mappable copies of the model artifacts.
+#
+# `export` re-dumps every artifact uncompressed into an mmap/ directory, where
+# joblib stores each numpy array as an aligned raw buffer. The run_model.py
+# artifacts are exported into a copy of the current version that is published
+# as a new version (published directories are never modified); the
+# train_models.py pickles go to models/mmap/. Loading with
+# mmap_mode="c" maps those buffers instead of copying them: the KNN reference
+# matrix, SVM support vectors and dual coefficients, MLP weight matrices and
+# NB/scaler statistics stay in the page cache and are shared by every worker
+# process (copy-on-write, so libsvm's writeable-buffer requirement is met).
+# Decision tree node arrays are the exception: sklearn copies them into the
+# tree object on load, so they are still private per process.
+#
+#   python mmap_artifacts.py export     # write the mmap/*.joblib copies (publishes a version)
+#   python mmap_artifacts.py compare [artifact ...]   # cold load time and RSS, pickle vs mmap
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+MODELS_DIR = ML_DIR / "models"
+MMAP_DIR = MODELS_DIR / "mmap"
+# artifacts written by train_models.py next to this file
+LEGACY_ARTIFACTS = ["knn_model.pkl", "naive_bayes_model.pkl", "decision_tree_model.pkl",
+                    "svm_model.pkl", "neural_network_model.pkl"]
+
+
+def mmap_enabled():
+    return os.environ.get("ML_MMAP_MODELS", "").lower() in ("1", "true", "yes")
+
+
+def source_artifacts():
+    from artifact_versions import current_dir
+    sources = sorted(current_dir().glob("*.joblib"))
+    sources += [ML_DIR / name for name in LEGACY_ARTIFACTS if (ML_DIR / name).exists()]
+    return sources
+
+
+def mmap_path(source):
+    # run_model.py artifacts keep their copies in their own (version) directory,
+    # so a rollback never maps a copy of another version
+    source = Path(source)
+    parent = MMAP_DIR if source.resolve().parent == ML_DIR.resolve() else source.parent / "mmap"
+    return parent / f"{source.stem}.joblib"
+
+
+def atomic_dump(model, path):
+    # write next to the target and rename: a process that has the old file
+    # mapped keeps reading the old inode instead of a half-written one
+    from joblib import dump
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    dump(model, tmp)
+    os.replace(tmp, path)
+
+
+def _published(source):
+    parent = Path(source).parent
+    return parent.name.isdigit() and parent.parent.name == "versions"
+
+
+def export_artifact(source):
+    from joblib import load
+    if _published(source):
+        raise ValueError(f"{source} is in a published version, which is never modified; use export_version()")
+    target = mmap_path(source)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    atomic_dump(load(source), target)
+    return target
+
+
+def export_version():
+    """Publish the served run_model.py artifacts again, as a new version that has mmap copies"""
+    # the copies are written into a staging copy of the current version, so
+    # the published directory and its checksum manifest stay untouched
+    from artifact_versions import current_dir, stage, publish, discard, publishing
+    from incremental import record_version
+    with publishing():
+        staging = stage(base=current_dir())
+        try:
+            exported = [export_artifact(p).relative_to(staging) for p in sorted(staging.glob("*.joblib"))]
+            version = record_version("export_mmap", {})
+            target = publish(staging, version, "export_mmap")
+        except BaseException:
+            discard(staging)
+            raise
+    return {"version": version, "exported": {p.name: str(target / p) for p in exported}}
+
+
+def export_all(sources=None):
+    if sources is not None:
+        return {"exported": {str(Path(s).name): str(export_artifact(s)) for s in sources}}
+    exported = {name: str(export_artifact(ML_DIR / name)) for name in LEGACY_ARTIFACTS if (ML_DIR / name).exists()}
+    version = None
+    from artifact_versions import current_dir
+    if any(current_dir().glob("*.joblib")):
+        out = export_version()
+        exported.update(out["exported"])
+        version = out["version"]
+    return {"exported": exported, "version": version}
+
+
+def fresh_mmap_copy(source):
+    """models/mmap copy of `source` if it exists and is not older than the source"""
+    target = mmap_path(source)
+    try:
+        if target.stat().st_mtime_ns >= Path(source).stat().st_mtime_ns:
+            return target
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def load_artifact(path):
+    from joblib import load
+    path = Path(path)
+    if path.parent.name == "mmap":
+        return load(path, mmap_mode="c")
+    return load(path)
+
+
+# ---------------------------------------------------------------
+# compare: every measurement runs in a fresh interpreter so that
+# load time and RSS are those of a cold worker process
+# ---------------------------------------------------------------
+
+_PROBE = r"""
+import sys, time, json
+import numpy, joblib
+# import the estimator modules up front so only deserialization is timed
+import sklearn.pipeline, sklearn.preprocessing, sklearn.neighbors, sklearn.naive_bayes
+import sklearn.tree, sklearn.svm, sklearn.neural_network
+def rss():
+    out = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS", "RssAnon", "RssFile")):
+                    k, v = line.split(":")
+                    out[k] = int(v.split()[0]) * 1024
+    except OSError:
+        pass
+    return out
+before = rss()
+t0 = time.perf_counter()
+model = joblib.load(sys.argv[1], mmap_mode=(sys.argv[2] or None))
+elapsed = time.perf_counter() - t0
+after = rss()
+print(json.dumps({"load_ms": elapsed * 1000,
+                  "rss_delta": after.get("VmRSS", 0) - before.get("VmRSS", 0),
+                  "anon_delta": after.get("RssAnon", 0) - before.get("RssAnon", 0)}))
+"""
+
+
+def _probe(path, mmap_mode, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", _PROBE, str(path), mmap_mode or ""],
+                             capture_output=True, text=True, check=True)
+        runs.append(json.loads(out.stdout))
+    runs.sort(key=lambda r: r["load_ms"])
+    median = runs[len(runs) // 2]
+    return {
+        "load_ms": round(median["load_ms"], 3),
+        "rss_delta_bytes": median["rss_delta"],
+        # private (anonymous) memory is what each extra worker really costs
+        "private_delta_bytes": median["anon_delta"],
+    }
+
+
+def compare(sources=None, repeat=5):
+    report = {}
+    for source in sources or source_artifacts():
+        target = fresh_mmap_copy(source) or export_artifact(source)
+        report[Path(source).name] = {
+            "bytes": Path(source).stat().st_size,
+            "pickle": _probe(source, None, repeat),
+            "mmap": _probe(target, "c", repeat),
+        }
+    return report
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    if command == "export":
+        print(json.dumps({"success": True, **export_all()}, indent=2))
+    elif command == "compare":
+        # optional artifact paths; defaults to every known artifact
+        print(json.dumps({"success": True, "results": compare(sys.argv[2:] or None)}, indent=2))
+    else:
+        print(json.dumps({"success": False, "error": f"Unknown command: {command}"}))
@@ -0,0 +1,225 @@
+# backend/ml/model_registry.py
+# In-process cache for model artifacts.
+#
+# Artifacts are keyed by path. A cached estimator is reused while the file's
+# (mtime, size) is unchanged; when they change the content hash decides whether
+# the artifact really needs to be deserialized again (a `touch` or a copy of
+# identical bytes does not trigger a reload).
+#
+# digest(path) serves the prediction cache keys and the lookup-table checks. It
+# keeps its own hashes keyed on the path it is given, so a source artifact
+# whose mmap copy is what got loaded is still hashed once, not per request.
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DigestCache:
+    """SHA-256 per file path, hashed again only when the file's (inode, mtime, size) changes"""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(st):
+        # artifacts are replaced by rename, which always gives a new inode
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def get(self, path):
+        path = Path(path)
+        key = str(path.resolve())
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self._stamp(st):
+                return entry[1]
+        digest = file_sha256(path)
+        self.put(key, st, digest)
+        return digest
+
+    def put(self, key, st, digest):
+        with self._lock:
+            self._entries[key] = (self._stamp(st), digest)
+
+    def discard(self, key=None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def retain(self, directory):
+        with self._lock:
+            for key in [k for k in self._entries if directory not in Path(k).parents]:
+                del self._entries[key]
+
+
+class _PendingLoad:
+    __slots__ = ("done", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+def _default_loader(path):
+    from joblib import load
+    return load(path)
+
+
+class ModelRegistry:
+    def __init__(self, loader=None, memory_budget_mb=None):
+        self.loader = loader or _default_loader
+        if memory_budget_mb is None:
+            memory_budget_mb = float(os.environ.get("ML_MODEL_CACHE_MB", "0") or 0)
+        # 0 means unlimited
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._entries = OrderedDict()
+        # key -> _PendingLoad while one thread loads that artifact
+        self._loading = {}
+        # hashes by path, also of files that were never loaded here (the
+        # source of an mmap copy, the artifact behind a lookup table)
+        self.digests = DigestCache()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def get(self, path):
+        # the lock only guards the entries; hashing and unpickling run outside
+        # it, so a slow load never holds up requests for cached models.
+        # Concurrent misses on one file wait for a single load.
+        path = Path(path)
+        key = str(path.resolve())
+        while True:
+            st = os.stat(path)
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and (st.st_mtime_ns, st.st_size) == (entry["mtime_ns"], entry["size"]):
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return entry["model"]
+                pending = self._loading.get(key)
+                if pending is None:
+                    pending = self._loading[key] = _PendingLoad()
+                    break
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            # loaded by another thread: look again (the file may have moved on)
+
+        try:
+            return self._load(path, key, st, entry)
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            pending.done.set()
+
+    def _load(self, path, key, st, entry):
+        digest = file_sha256(path)
+        self.digests.put(key, st, digest)
+        if entry is not None and digest == entry["sha256"]:
+            # same bytes, new timestamp
+            with self._lock:
+                self.revalidations += 1
+                self.hits += 1
+                entry["mtime_ns"], entry["size"] = st.st_mtime_ns, st.st_size
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+            return entry["model"]
+
+        t0 = time.perf_counter()
+        model = self.loader(path)
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            if entry is not None:
+                self.reloads += 1
+            self.misses += 1
+            self.load_seconds += elapsed
+            self._entries[key] = {
+                "name": path.stem,
+                "model": model,
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "sha256": digest,
+                "load_ms": round(elapsed * 1000, 3),
+            }
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        return model
+
+    def _evict(self, keep):
+        # the serialized size is used as the estimate of an estimator's
+        # footprint; uncompressed joblib files track it closely
+        if not self.memory_budget:
+            return
+        total = sum(e["size"] for e in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)["size"]
+            self.evictions += 1
+
+    def digest(self, path):
+        """SHA-256 of path, hashed once per version of the file whether or not it was loaded here"""
+        return self.digests.get(path)
+
+    def invalidate(self, path=None):
+        key = None if path is None else str(Path(path).resolve())
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+        self.digests.discard(key)
+
+    def retain(self, directory):
+        """Drop every entry whose artifact is not inside directory"""
+        directory = Path(directory).resolve()
+        with self._lock:
+            for key in [k for k in self._entries if directory not in Path(k).parents]:
+                del self._entries[key]
+        self.digests.retain(directory)
+
+    def loaded(self):
+        with self._lock:
+            return [e["name"] for e in self._entries.values()]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "reloads": self.reloads,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "load_ms_total": round(self.load_seconds * 1000, 3),
+                "memory_budget_bytes": self.memory_budget or None,
+                "cached_bytes": sum(e["size"] for e in self._entries.values()),
+                "entries": [
+                    {"name": e["name"], "bytes": e["size"], "load_ms": e["load_ms"], "sha256": e["sha256"][:12]}
+                    for e in self._entries.values()
+                ],
+            }
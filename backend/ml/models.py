@@ -1,5 +1,4 @@
 # backend/ml/models.py
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 from sklearn.neighbors import KNeighborsClassifier
@@ -7,13 +6,13 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.naive_bayes import GaussianNB
 from sklearn.svm import SVC
 from sklearn.neural_network import MLPClassifier
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+
+from evaluation import evaluate
+from feature_store import load_xy
 
 def train_and_evaluate():
     # Sample dataset (you can replace with your own CSV)
-    data = pd.read_csv('backend/ml/student_performance.csv')
-    X = data[['quiz1', 'quiz2', 'quiz3']]
-    y = data['performance']
+    X, y = load_xy('backend/ml/student_performance.csv', columns=['quiz1', 'quiz2', 'quiz3'], label_column='performance')
 
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42)
 
@@ -33,12 +32,13 @@ def train_and_evaluate():
     for name, model in models.items():
         model.fit(X_train, y_train)
         y_pred = model.predict(X_test)
+        metrics = evaluate(y_test, y_pred)
         results.append({
             "model": name,
-            "accuracy": round(accuracy_score(y_test, y_pred), 3),
-            "precision": round(precision_score(y_test, y_pred, average='weighted'), 3),
-            "recall": round(recall_score(y_test, y_pred, average='weighted'), 3),
-            "f1_score": round(f1_score(y_test, y_pred, average='weighted'), 3)
+            "accuracy": round(metrics["accuracy"], 3),
+            "precision": round(metrics["precision_weighted"], 3),
+            "recall": round(metrics["recall_weighted"], 3),
+            "f1_score": round(metrics["f1_weighted"], 3)
         })
 
     return results
@@ -0,0 +1,340 @@
+# backend/ml/pipeline.py
+# Data generation, training and charts in one process:
+#
+#   python pipeline.py [--rows 500] [--seed 42] [--jobs N] [--dpi 300]
+#                      [--background-charts] [--until train] [--force generate ...]
+#                      [--p99-ms 25] [--memory-mb 256]
+#
+# The stages form a small DAG,
+#   generate -> train -> select (serving manifest, profiling.py)
+#                     -> visualize
+# and hand their results to each other in memory (feature arrays, the metrics
+# list). This replaces the three chained scripts POST /api/ml/train used to
+# spawn, each paying interpreter start-up and imports.
+#
+# A stage's key is the SHA-256 of its parameters, the source of the modules it
+# runs and the output digests of the stages it depends on. After a stage runs,
+# its key and the SHA-256 of every file it wrote go to
+# .cache/pipeline/state.json. A stage whose key matches and whose files are
+# unchanged on disk is skipped, and if a later stage needs its value it is
+# read back from those files. The JSON report lists status and seconds per
+# stage.
+import os
+import sys
+import json
+import time
+import hashlib
+from pathlib import Path
+
+from model_registry import file_sha256
+from profiling import policy_from_env
+
+ML_DIR = Path(__file__).parent
+STATE_DIR = ML_DIR / ".cache" / "pipeline"
+STATE_PATH = STATE_DIR / "state.json"
+DATASET_PATH = ML_DIR / "student_scores.csv"
+RESULTS_PATH = ML_DIR / "model_results.json"
+COMPARISON_PATH = ML_DIR / "model_comparison.json"
+MANIFEST_PATH = ML_DIR / "serving_manifest.json"
+# train_models.MODELS artifacts; listed here so a cached run does not import sklearn
+TRAIN_ARTIFACTS = ["knn_model.pkl", "naive_bayes_model.pkl", "decision_tree_model.pkl",
+                   "svm_model.pkl", "neural_network_model.pkl"]
+
+
+class Stage:
+    def __init__(self, name, deps, run, load, outputs, code, params=(), versions=None, check=None):
+        self.name = name
+        self.deps = deps            # upstream stage names
+        self.run = run              # run(ctx, inputs) -> value
+        self.load = load            # load(ctx) -> value, rebuilt from the outputs of a skipped run
+        self.outputs = outputs      # outputs(ctx) -> [Path]
+        self.code = code            # source files whose changes invalidate the stage
+        self.params = params        # ctx keys that change the result
+        self.versions = versions    # versions() -> dict of library versions that change the result
+        self.check = check          # check(ctx, value) -> bool, extra freshness test for a skipped run
+
+
+# ---------------------------------------------------------------
+# stages
+# ---------------------------------------------------------------
+
+def _atomic_write(path, text):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def run_generate(ctx, inputs):
+    import numpy as np
+    from data_generator import CLASSES, chunk_bounds, generate_chunk, to_frame
+    # the same chunking and seeds as data_generator.py, so the CSV is identical
+    chunks = [generate_chunk(stop - start, ctx["seed"] + i)
+              for i, (start, stop) in enumerate(chunk_bounds(ctx["rows"], 1_000_000))]
+    X = np.concatenate([c[0] for c in chunks])
+    codes = np.concatenate([c[1] for c in chunks])
+    tmp = DATASET_PATH.with_name(f".{DATASET_PATH.name}.{os.getpid()}.tmp")
+    to_frame(X, codes).to_csv(tmp, index=False)
+    os.replace(tmp, DATASET_PATH)
+    return X, np.asarray(CLASSES, dtype=object)[codes]
+
+
+def load_generate(ctx):
+    import numpy as np
+    from feature_store import load_xy
+    X, y = load_xy(DATASET_PATH, label_column="performance")
+    return np.asarray(X), y
+
+
+def run_train(ctx, inputs):
+    import warnings
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    from profiling import profile_results
+    from train_models import MODELS, add_confidence_intervals, fit_and_save, parse_jobs, train_all
+    warnings.filterwarnings("ignore")
+    if [artifact for _, _, artifact in MODELS] != TRAIN_ARTIFACTS:
+        raise RuntimeError("pipeline.TRAIN_ARTIFACTS is out of date with train_models.MODELS")
+    X, y = inputs["generate"]
+    # the same split as train_models.py
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    jobs = ctx["jobs"] if ctx["jobs"] > 0 else parse_jobs([])
+    if jobs > 1:
+        # worker processes map the feature store, as in train_models.py
+        from feature_store import build_store
+        trained = [(result, y_pred) for result, _, y_pred in
+                   train_all(build_store(DATASET_PATH, "performance"), train_idx, test_idx, jobs=jobs,
+                             artifact_dir=ML_DIR)]
+    else:
+        trained = [fit_and_save(name, str(ML_DIR / artifact), X[train_idx], y[train_idx], X[test_idx], y[test_idx])
+                   for _, name, artifact in MODELS]
+    results = [result for result, _ in trained]
+    comparison = add_confidence_intervals(results, y[test_idx], [y_pred for _, y_pred in trained])
+    # inference cost per model, for the select stage
+    profile_results(results, ML_DIR, dict(zip([name for _, name, _ in MODELS], TRAIN_ARTIFACTS)), X[np.sort(test_idx)])
+    _atomic_write(RESULTS_PATH, json.dumps(results, indent=2))
+    _atomic_write(COMPARISON_PATH, json.dumps(comparison, indent=2))
+    return results
+
+
+def load_train(ctx):
+    return json.loads(RESULTS_PATH.read_text())
+
+
+def train_outputs(ctx):
+    return [ML_DIR / artifact for artifact in TRAIN_ARTIFACTS] + [RESULTS_PATH, COMPARISON_PATH]
+
+
+def _sklearn_version():
+    # package metadata, not `import sklearn`: a cached run should not pay for the import
+    from importlib.metadata import version
+    return {"scikit-learn": version("scikit-learn")}
+
+
+def _train_versions():
+    # the tuned parameters (tune.BEST_PARAMS_PATH) change the trained models like code does
+    best_params = ML_DIR / "models" / "best_params.json"
+    return {**_sklearn_version(), "best_params": file_sha256(best_params) if best_params.exists() else None}
+
+
+def run_select(ctx, inputs):
+    from profiling import select_from_results
+    results = inputs["train"]
+    # results keep train_models.MODELS order, as TRAIN_ARTIFACTS does
+    return select_from_results(results, ML_DIR, dict(zip([r["model"] for r in results], TRAIN_ARTIFACTS)),
+                               ctx["serving_policy"])
+
+
+def load_select(ctx):
+    return json.loads(MANIFEST_PATH.read_text())
+
+
+def run_visualize(ctx, inputs):
+    from visualize_results import visualize
+    return visualize(inputs["train"], ctx["dpi"], ctx["background_charts"])
+
+
+def load_visualize(ctx):
+    spec = json.loads((ML_DIR / "model_chart_spec.json").read_text())
+    return {"sha256": spec["source_sha256"], "png": "cached"}
+
+
+def visualize_outputs(ctx):
+    return [ML_DIR / "model_chart_spec.json", ML_DIR / "model_comparison_charts.svg"]
+
+
+def png_cached(ctx, value):
+    from visualize_results import CHART_CACHE_DIR
+    return (CHART_CACHE_DIR / f"{value['sha256']}.png").exists()
+
+
+STAGES = {
+    "generate": Stage("generate", [], run_generate, load_generate, lambda ctx: [DATASET_PATH],
+                      ["data_generator.py"], params=("rows", "seed")),
+    "train": Stage("train", ["generate"], run_train, load_train, train_outputs,
+                   ["train_models.py", "run_model.py", "tune.py", "spatial_knn.py", "evaluation.py", "profiling.py"],
+                   versions=_train_versions),
+    # the serving model: a budget change re-runs only this stage
+    "select": Stage("select", ["train"], run_select, load_select, lambda ctx: [MANIFEST_PATH],
+                    ["profiling.py"], params=("serving_policy",)),
+    "visualize": Stage("visualize", ["train"], run_visualize, load_visualize, visualize_outputs,
+                       ["visualize_results.py"], params=("dpi",), check=png_cached),
+}
+
+
+# ---------------------------------------------------------------
+# runner
+# ---------------------------------------------------------------
+
+def execution_order(stages, until=None):
+    """Topological order of the stages `until` depends on (all stages by default)"""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Pipeline has a cycle through {name}")
+        if name not in stages:
+            raise ValueError(f"Unknown stage: {name}")
+        visiting.add(name)
+        for dep in stages[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in ([until] if until else stages):
+        visit(name)
+    return order
+
+
+def stage_key(stage, ctx, upstream):
+    blob = json.dumps({
+        "stage": stage.name,
+        "params": {k: ctx[k] for k in stage.params},
+        "code": {f: file_sha256(ML_DIR / f) for f in stage.code},
+        "versions": stage.versions() if stage.versions else {},
+        "upstream": upstream,
+    }, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def output_hashes(paths):
+    return {p.name: file_sha256(p) for p in paths}
+
+
+def outputs_digest(hashes):
+    return hashlib.sha256(json.dumps(hashes, sort_keys=True).encode()).hexdigest()
+
+
+def _unchanged(entry, paths):
+    try:
+        return output_hashes(paths) == entry["outputs"]
+    except FileNotFoundError:
+        return False
+
+
+def read_state():
+    try:
+        return json.loads(STATE_PATH.read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def run_pipeline(ctx, stages=STAGES, until=None, force=(), want=(), progress=None):
+    """Run the stages up to `until`; `want` names the stage values to return"""
+    STATE_DIR.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    # one run at a time; a concurrent /train waits and then finds everything cached
+    with open(STATE_DIR / "lock", "w") as lock:
+        try:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        state = read_state()
+        values, digests, report = {}, {}, []
+
+        def value_of(name):
+            # skipped stages are only read back from disk when something downstream runs
+            if callable(values[name]):
+                values[name] = values[name]()
+            return values[name]
+
+        for name in execution_order(stages, until):
+            stage = stages[name]
+            stage_started = time.perf_counter()
+            key = stage_key(stage, ctx, {dep: digests[dep] for dep in stage.deps})
+            paths = stage.outputs(ctx)
+            entry = state.get(name)
+            fresh = (name not in force and entry is not None and entry.get("key") == key
+                     and _unchanged(entry, paths))
+            if fresh:
+                values[name] = lambda stage=stage: stage.load(ctx)
+                fresh = stage.check is None or stage.check(ctx, value_of(name))
+            if fresh:
+                status = "cached"
+                hashes = entry["outputs"]
+            else:
+                inputs = {dep: value_of(dep) for dep in stage.deps}
+                values[name] = stage.run(ctx, inputs)
+                status = "ran"
+                hashes = output_hashes(paths)
+                state[name] = {"key": key, "outputs": hashes, "finished": time.time()}
+                _atomic_write(STATE_PATH, json.dumps(state, indent=2))
+            digests[name] = outputs_digest(hashes)
+            report.append({"stage": name, "status": status,
+                           "seconds": round(time.perf_counter() - stage_started, 3)})
+            if progress:
+                progress(report[-1])
+
+        return {
+            "stages": report,
+            "total_s": round(time.perf_counter() - started, 3),
+            "values": {name: value_of(name) for name in want if name in values},
+        }
+
+
+def _print_progress(entry):
+    print(f"  {entry['stage']:<10} {entry['status']:<7} {entry['seconds']:.3f}s", file=sys.stderr)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate data, train models and draw charts in one process")
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--jobs", type=int, default=0, help="training processes (0 = ML_TRAIN_JOBS or one per core)")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--background-charts", action="store_true", help="render a missing PNG in a detached process")
+    parser.add_argument("--p99-ms", type=float, default=None, help="serving latency budget (default ML_SERVING_P99_MS or 25)")
+    parser.add_argument("--memory-mb", type=float, default=None, help="serving memory budget (default ML_SERVING_MEMORY_MB or 256)")
+    parser.add_argument("--until", choices=list(STAGES), default=None, help="stop after this stage")
+    parser.add_argument("--force", nargs="+", choices=list(STAGES), default=[], help="re-run these stages")
+    args = parser.parse_args(argv)
+
+    ctx = {
+        "rows": args.rows,
+        "seed": args.seed,
+        "jobs": args.jobs,
+        "dpi": args.dpi,
+        "background_charts": args.background_charts,
+        "serving_policy": policy_from_env(args.p99_ms, args.memory_mb),
+    }
+    try:
+        out = run_pipeline(ctx, until=args.until, force=set(args.force), want=("train", "select", "visualize"),
+                           progress=_print_progress)
+    except Exception as e:
+        print(json.dumps({"success": False, "error": str(e)}))
+        print(f"pipeline failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    values = out.pop("values")
+    serving = values.get("select")
+    if serving:
+        serving = {k: serving[k] for k in ("serving", "chain", "within_budget", "rejected", "policy")}
+    print(json.dumps({"success": True, **out, "results": values.get("train"), "serving": serving,
+                      "chart": values.get("visualize")},
+                     indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -2,7 +2,6 @@
 import sys
 import json
 import numpy as np
-from joblib import load
 
 # Dummy prediction just to simulate
 # Replace with your trained model if available
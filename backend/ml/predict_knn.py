@@ -1,47 +1,174 @@
+import os
 import sys
 import json
+
+# --timings (or ML_TIMINGS=1) adds per-stage timings to the output; the timer
+# starts before the heavy imports below so they are measured too
+import instrumentation
+from instrumentation import stage
+TIMER = instrumentation.start(include_startup=True) if instrumentation.enabled("--timings" in sys.argv or None) else None
+
+from prediction_cache import SqlitePredictionCache, normalize
+from profiling import serving_chain
+
+# Usage:
+#   python predict_knn.py '{"quiz1": 80, "quiz2": 70, "quiz3": 60}'
+#   python predict_knn.py '[{"quiz1": 80, ...}, {"quiz1": 55, ...}]'       (batch)
+#   python predict_knn.py --batch students.csv [--format csv|json|jsonl]  (batch, "-" reads stdin)
+#   python predict_knn.py --timings '{"quiz1": 80, ...}'                  (adds "timings")
+
+MODEL_PATH = "knn_model.pkl"
+# the serving model and its fallbacks from serving_manifest.json (written by
+# train_models.py / pipeline.py, see profiling.py); KNN when there is none
+CANDIDATES = [(name, str(path)) for name, path in
+              serving_chain(os.path.dirname(os.path.abspath(__file__)), ("KNN", MODEL_PATH))
+              if os.path.exists(path)] or [("KNN", MODEL_PATH)]
+MODEL_NAME, MODEL_PATH = CANDIDATES[0]
+
+
+def emit(result):
+    if TIMER is None:
+        print(json.dumps(result))
+    else:
+        print(instrumentation.dumps_with_timings(result, TIMER, {"script": "predict_knn", "action": "predict", "model": MODEL_NAME}))
+
+
+def input_dict(features):
+    return {
+        "quiz1": features[0],
+        "quiz2": features[1],
+        "quiz3": features[2],
+        "time_spent": features[3],
+        "confidence": features[4]
+    }
+
+
+args = [a for a in sys.argv[1:] if a != "--timings"]
+
+# single-row requests are looked up in the prediction cache (SQLite, shared by
+# every run) before numpy, joblib and the model are loaded at all
+cache = cache_key = input_data = None
+if "--batch" not in args:
+    with stage("parse"):
+        input_data = json.loads(args[0] if args else "{}")
+    if not isinstance(input_data, list):
+        with stage("parse"):
+            features = [
+                float(input_data.get("quiz1", 0)),
+                float(input_data.get("quiz2", 0)),
+                float(input_data.get("quiz3", 0)),
+                float(input_data.get("time_spent", 1200)),
+                float(input_data.get("confidence", 3))
+            ]
+    if not isinstance(input_data, list) and os.path.exists(MODEL_PATH):
+        with stage("cache"):
+            cache = SqlitePredictionCache()
+            if cache.enabled:
+                # retraining rewrites the pickle, which changes the version
+                st = os.stat(MODEL_PATH)
+                cache_key = (MODEL_NAME, f"{st.st_mtime_ns}-{st.st_size}", "predict_knn", normalize(features))
+                hit = cache.get(*cache_key)
+        if cache_key and hit is not None:
+            emit({"model": hit["model"], "prediction": hit["prediction"], "input": input_dict(features),
+                  **hit, "cached": True})
+            # hit counters are written only after the answer is out
+            sys.stdout.flush()
+            cache.flush()
+            sys.exit(0)
+
 import joblib
 import numpy as np
 
-knn = joblib.load("knn_model.pkl")
+from mmap_artifacts import fresh_mmap_copy, load_artifact, mmap_enabled
+from batch_io import FEATURE_NAMES, FEATURE_DEFAULTS, parse_text, read_rows, parse_rows, predict_rows, assemble_results
+
+
+def predict_batch(model, rows):
+    with stage("parse"):
+        X, valid, errors = parse_rows(rows, FEATURE_NAMES, FEATURE_DEFAULTS)
+    preds, proba = predict_rows(model, X)
+    classes = getattr(model, "classes_", None)
+    results = assemble_results(len(rows), valid, errors, preds, proba, classes)
+    for j, i in enumerate(valid):
+        results[i]["input"] = dict(zip(FEATURE_NAMES, X[j].tolist()))
+        results[i]["prediction"] = str(results[i]["prediction"])
+    return {
+        "model": MODEL_NAME,
+        "count": len(rows),
+        "valid": len(valid),
+        "invalid": len(errors),
+        "results": results
+    }
+
+
+def read_batch_args(args):
+    fmt = None
+    if "--format" in args:
+        fmt = args[args.index("--format") + 1]
+    source = args[args.index("--batch") + 1]
+    if source == "-":
+        return parse_text(sys.stdin.read(), fmt or "json")
+    return read_rows(source, fmt)
+
+
+def load_serving_model(path):
+    if mmap_enabled():
+        # ML_MMAP_MODELS=1: map the exported copy instead of unpickling the arrays
+        return load_artifact(fresh_mmap_copy(path) or path)
+    return joblib.load(path)
+
 
-raw_input = sys.argv[1] if len(sys.argv) > 1 else "{}"
-input_data = json.loads(raw_input)
+with stage("load"):
+    for i, (name, path) in enumerate(CANDIDATES):
+        try:
+            model = load_serving_model(path)
+        except Exception:
+            # next model in the fallback chain
+            if i == len(CANDIDATES) - 1:
+                raise
+            continue
+        if name != MODEL_NAME:
+            # the cache key was made for the preferred model
+            cache_key = None
+        MODEL_NAME, MODEL_PATH = name, path
+        break
 
-features = [
-    float(input_data.get("quiz1", 0)),
-    float(input_data.get("quiz2", 0)),
-    float(input_data.get("quiz3", 0)),
-    float(input_data.get("time_spent", 1200)),
-    float(input_data.get("confidence", 3))
-]
+if "--batch" in args:
+    with stage("read_request"):
+        rows = read_batch_args(args)
+    emit(predict_batch(model, rows))
+    sys.exit(0)
 
-features_array = np.array([features])
+if isinstance(input_data, list):
+    emit(predict_batch(model, input_data))
+    sys.exit(0)
 
-prediction = knn.predict(features_array)[0]
+with stage("parse"):
+    features_array = np.array([features])
+
+with stage("predict"):
+    prediction = model.predict(features_array)[0]
 
 probabilities = {}
-if hasattr(knn, "predict_proba"):
-    classes = knn.classes_
-    probs = knn.predict_proba(features_array)[0]
+if hasattr(model, "predict_proba"):
+    classes = model.classes_
+    with stage("predict_proba"):
+        probs = model.predict_proba(features_array)[0]
     probabilities = {
         str(label): round(float(prob), 4)
         for label, prob in zip(classes, probs)
     }
 
 result = {
-    "model": "KNN",
+    "model": MODEL_NAME,
     "prediction": str(prediction),
-    "input": {
-        "quiz1": features[0],
-        "quiz2": features[1],
-        "quiz3": features[2],
-        "time_spent": features[3],
-        "confidence": features[4]
-    }
+    "input": input_dict(features)
 }
 
 if probabilities:
     result["probabilities"] = probabilities
 
-print(json.dumps(result))
+if cache_key:
+    cache.put(*cache_key, {k: v for k, v in result.items() if k != "input"})
+
+emit(result)
@@ -0,0 +1,289 @@
+# backend/ml/prediction_cache.py
+# Caches single-row predictions keyed on
+#   (model name, artifact version, request variant, rounded feature vector)
+# so a repeated request (a student reloading the dashboard with unchanged
+# attempts) skips model evaluation.
+#
+# PredictionCache lives in memory and serves run_model.py (most useful in
+# `serve` mode). SqlitePredictionCache keeps the same entries in a small
+# SQLite file for one-shot scripts such as predict_knn.py, where the process
+# exits after every request.
+#
+# Entries are evicted least recently used beyond ML_PREDICTION_CACHE_SIZE
+# (default 1024, 0 disables caching; SQLite records hits with its next write) and expire after ML_PREDICTION_CACHE_TTL
+# seconds (default 300). Features are rounded to ML_PREDICTION_CACHE_DECIMALS
+# (default 2) before keying. The artifact version is part of the key, and
+# entries of an older version are dropped as soon as a newer one is seen (by
+# the next put in SQLite), so retraining invalidates the cache without any
+# explicit call.
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+DEFAULT_SIZE = 1024
+DEFAULT_TTL_S = 300.0
+DEFAULT_DECIMALS = 2
+DEFAULT_SQLITE_PATH = Path(__file__).parent / ".cache" / "predictions.sqlite"
+# a busy file is given up on quickly: predicting is cheaper than waiting
+SQLITE_TIMEOUT_S = 1.0
+
+
+def _env_number(name, default, cast=float):
+    value = os.environ.get(name, "")
+    return cast(value) if value != "" else default
+
+
+def normalize(features, decimals=None):
+    """Tuple of rounded floats for one row, or None if features is not a single row"""
+    if decimals is None:
+        decimals = _env_number("ML_PREDICTION_CACHE_DECIMALS", DEFAULT_DECIMALS, int)
+    row = features
+    if isinstance(row, (list, tuple)) and len(row) == 1 and isinstance(row[0], (list, tuple)):
+        row = row[0]
+    if not isinstance(row, (list, tuple)) or not row:
+        return None
+    try:
+        # +0.0 folds -0.0 into 0.0
+        return tuple(round(float(v), decimals) + 0.0 for v in row)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Counters:
+    NAMES = ("hits", "misses", "evictions", "expirations", "invalidations")
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+class PredictionCache:
+    def __init__(self, max_entries=None, ttl_s=None, clock=time.monotonic):
+        self.max_entries = int(_env_number("ML_PREDICTION_CACHE_SIZE", DEFAULT_SIZE) if max_entries is None else max_entries)
+        self.ttl_s = _env_number("ML_PREDICTION_CACHE_TTL", DEFAULT_TTL_S) if ttl_s is None else ttl_s
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.counters = _Counters()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def _check_version(self, model, version):
+        # a new artifact version retires every entry of the old one
+        if self._versions.get(model) == version:
+            return
+        if model in self._versions:
+            stale = [k for k in self._entries if k[0] == model]
+            for k in stale:
+                del self._entries[k]
+            self.counters.invalidations += len(stale)
+        self._versions[model] = version
+
+    def get(self, model, version, variant, row):
+        key = (model, version, variant, row)
+        with self._lock:
+            self._check_version(model, version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters.misses += 1
+                return None
+            if self.ttl_s and self.clock() - entry[0] > self.ttl_s:
+                del self._entries[key]
+                self.counters.expirations += 1
+                self.counters.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters.hits += 1
+            return entry[1]
+
+    def put(self, model, version, variant, row, value):
+        if not self.enabled:
+            return
+        key = (model, version, variant, row)
+        with self._lock:
+            self._check_version(model, version)
+            self._entries[key] = (self.clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters.evictions += 1
+
+    def invalidate(self, model=None):
+        with self._lock:
+            stale = [k for k in self._entries if model is None or k[0] == model]
+            for k in stale:
+                del self._entries[k]
+            self.counters.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters.as_dict(), "entries": len(self._entries),
+                    "max_entries": self.max_entries, "ttl_s": self.ttl_s}
+
+
+class SqlitePredictionCache:
+    """The same cache persisted in SQLite, shared by short-lived processes
+
+    Best effort: if the file cannot be opened, is locked past the timeout or
+    fails in any other way, the cache turns itself off for the process and
+    callers simply predict. get() is one SELECT. Purging old versions,
+    expiry, eviction, the counters and the last-use times of the entries
+    that were hit are written by put() in a single transaction (or by
+    flush() after a hit), never before an answer.
+    """
+
+    def __init__(self, path=None, max_entries=None, ttl_s=None):
+        import sqlite3
+        self.max_entries = int(_env_number("ML_PREDICTION_CACHE_SIZE", DEFAULT_SIZE) if max_entries is None else max_entries)
+        self.ttl_s = _env_number("ML_PREDICTION_CACHE_TTL", DEFAULT_TTL_S) if ttl_s is None else ttl_s
+        self.path = Path(path or os.environ.get("ML_PREDICTION_CACHE_PATH") or DEFAULT_SQLITE_PATH)
+        self.db = None
+        self.error = None
+        # counted in memory and added to the table on the next write
+        self._pending = _Counters()
+        # key -> time of its last hit, written to `used` with the counters
+        self._touched = {}
+        if self.max_entries <= 0:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.db = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT_S, isolation_level=None)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, model TEXT, version TEXT, "
+                            "value TEXT, created REAL, used REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        except (sqlite3.Error, OSError) as e:
+            self._disable(e)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.db is not None
+
+    def _disable(self, error):
+        self.error = str(error)
+        if self.db is not None:
+            try:
+                self.db.close()
+            except Exception:
+                pass
+        self.db = None
+
+    @staticmethod
+    def _key(model, version, variant, row):
+        return json.dumps([model, version, variant, row])
+
+    def get(self, model, version, variant, row):
+        import sqlite3
+        if not self.enabled:
+            return None
+        try:
+            found = self.db.execute("SELECT value, created FROM entries WHERE key = ?",
+                                    (self._key(model, version, variant, row),)).fetchone()
+        except sqlite3.Error as e:
+            self._disable(e)
+            return None
+        if found is None or (self.ttl_s and time.time() - found[1] > self.ttl_s):
+            # expired rows are removed by the next put()
+            self._pending.misses += 1
+            return None
+        self._pending.hits += 1
+        self._touched[self._key(model, version, variant, row)] = time.time()
+        return json.loads(found[0])
+
+    def _write_touched(self):
+        if self._touched:
+            self.db.executemany("UPDATE entries SET used = MAX(used, ?) WHERE key = ?",
+                                [(used, key) for key, used in self._touched.items()])
+        self._touched = {}
+
+    def _write_counters(self):
+        for name in _Counters.NAMES:
+            n = getattr(self._pending, name)
+            if n:
+                self.db.execute("INSERT INTO counters VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                                (name, n, n))
+        self._pending = _Counters()
+
+    def put(self, model, version, variant, row, value):
+        import sqlite3
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                # entries of any other version of this model can never be hit again
+                self._pending.invalidations += self.db.execute(
+                    "DELETE FROM entries WHERE model = ? AND version != ?", (model, version)).rowcount
+                if self.ttl_s:
+                    self._pending.expirations += self.db.execute(
+                        "DELETE FROM entries WHERE created < ?", (now - self.ttl_s,)).rowcount
+                self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                (self._key(model, version, variant, row), model, version, json.dumps(value), now, now))
+                # this process's hits count as uses before anything is evicted
+                self._write_touched()
+                self._pending.evictions += self.db.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)).rowcount
+                self._write_counters()
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def flush(self):
+        """Write the counters and hits of a process that only read; skipped if the file is busy"""
+        import sqlite3
+        if not self.enabled or not (self._touched or any(getattr(self._pending, n) for n in _Counters.NAMES)):
+            return
+        try:
+            self.db.execute("PRAGMA busy_timeout = 50")
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_touched()
+                self._write_counters()
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            self._disable(e)
+
+    def stats(self):
+        import sqlite3
+        counters = _Counters()
+        entries = 0
+        if self.enabled:
+            try:
+                for name, value in self.db.execute("SELECT name, value FROM counters"):
+                    setattr(counters, name, value)
+                entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            except sqlite3.Error as e:
+                self._disable(e)
+        for name in _Counters.NAMES:
+            setattr(counters, name, getattr(counters, name) + getattr(self._pending, name))
+        return {**counters.as_dict(), "entries": entries, "max_entries": self.max_entries, "ttl_s": self.ttl_s,
+                "error": self.error}
@@ -0,0 +1,211 @@
+# backend/ml/profiling.py
+# Inference cost next to accuracy, and the serving model chosen from both.
+#
+# After training, every saved artifact is profiled in the training process:
+#   artifact_bytes   size on disk
+#   load_ms          joblib.load time
+#   memory_mb        memory held by the loaded model (tracemalloc, at least the artifact size)
+#   single           p50/p99 ms of one-row predict + predict_proba, as predict_knn.py serves it
+#   batch            p50/p99 ms and rows/s for batches of ML_PROFILE_BATCH rows (default 256)
+# The profile goes into each model's entry in the results.
+#
+# Selection policy: models whose single-row p99 and memory fit the budget
+# (ML_SERVING_P99_MS, default 25; ML_SERVING_MEMORY_MB, default 256) are ranked
+# by accuracy, then by p99. The first is served and the rest form the
+# fallback chain. If nothing fits, the model with the lowest p99 is served and
+# the manifest says so. The manifest is written next to the artifacts:
+#   serving_manifest.json          train_models.py / pipeline.py (*.pkl), read by predict_knn.py
+#   models/versions/<n>/serving_manifest.json   run_model.py train, read by run_model.py predict
+#
+#   python profiling.py [--p99-ms 10] [--memory-mb 64] [--reprofile]
+# re-applies the policy to the profiles in model_results.json (measuring the
+# *.pkl models again with --reprofile) and rewrites serving_manifest.json.
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+MANIFEST_NAME = "serving_manifest.json"
+DEFAULT_P99_MS = 25.0
+DEFAULT_MEMORY_MB = 256.0
+
+
+def policy_from_env(p99_ms=None, memory_mb=None):
+    def number(name, default):
+        value = os.environ.get(name, "")
+        return float(value) if value != "" else default
+    return {
+        "max_p99_ms": p99_ms if p99_ms is not None else number("ML_SERVING_P99_MS", DEFAULT_P99_MS),
+        "max_memory_mb": memory_mb if memory_mb is not None else number("ML_SERVING_MEMORY_MB", DEFAULT_MEMORY_MB),
+    }
+
+
+def _percentiles(samples_s):
+    import numpy as np
+    ms = np.asarray(samples_s) * 1000
+    return {"p50_ms": round(float(np.percentile(ms, 50)), 4), "p99_ms": round(float(np.percentile(ms, 99)), 4)}
+
+
+def _serve(model, X):
+    model.predict(X)
+    if hasattr(model, "predict_proba"):
+        model.predict_proba(X)
+
+
+def profile_artifact(path, X_sample, single_rows=None, batch_size=None):
+    """Load, memory and latency profile of one saved model on rows like X_sample"""
+    import gc
+    import tracemalloc
+    import joblib
+    import numpy as np
+    single_rows = single_rows or int(os.environ.get("ML_PROFILE_ROWS", "0") or 0) or 200
+    batch_size = batch_size or int(os.environ.get("ML_PROFILE_BATCH", "0") or 0) or 256
+    path = Path(path)
+    X_sample = np.asarray(X_sample, dtype=np.float64)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        model = joblib.load(path)
+        load_s = time.perf_counter() - started
+        gc.collect()
+        memory = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    # rows cycle through the sample so a small test split still gives enough queries
+    def rows(n):
+        return X_sample[np.arange(n) % len(X_sample)]
+
+    _serve(model, rows(1))
+    singles = []
+    for row in rows(single_rows):
+        row = row.reshape(1, -1)
+        started = time.perf_counter()
+        _serve(model, row)
+        singles.append(time.perf_counter() - started)
+
+    n_batches = max(5, min(20, 4096 // batch_size))
+    batches = rows(batch_size * n_batches).reshape(n_batches, batch_size, -1)
+    samples = []
+    for batch in batches:
+        started = time.perf_counter()
+        _serve(model, batch)
+        samples.append(time.perf_counter() - started)
+
+    return {
+        "artifact_bytes": path.stat().st_size,
+        "load_ms": round(load_s * 1000, 3),
+        # tracemalloc misses allocations made directly in C (a decision tree's node
+        # array); the loaded model takes at least as much memory as its pickle
+        "memory_mb": round(max(memory, path.stat().st_size) / 2 ** 20, 3),
+        "single": _percentiles(singles),
+        "batch": {"size": batch_size, **_percentiles(samples),
+                  "rows_per_s": round(batch_size * n_batches / sum(samples), 1)},
+    }
+
+
+def select_serving(candidates, policy):
+    """candidates: [{"model", "accuracy", "profile"}]; the serving model, the fallback chain and why others were left out"""
+    within, rejected = [], {}
+    for c in candidates:
+        p99, memory = c["profile"]["single"]["p99_ms"], c["profile"]["memory_mb"]
+        reasons = []
+        if p99 > policy["max_p99_ms"]:
+            reasons.append(f"p99 {p99} ms > {policy['max_p99_ms']} ms")
+        if memory > policy["max_memory_mb"]:
+            reasons.append(f"memory {memory} MB > {policy['max_memory_mb']} MB")
+        if reasons:
+            rejected[c["model"]] = "; ".join(reasons)
+        else:
+            within.append(c)
+    within.sort(key=lambda c: (-c["accuracy"], c["profile"]["single"]["p99_ms"]))
+    chain = [c["model"] for c in within]
+    if not chain:
+        # nothing fits: serve the cheapest rather than nothing
+        chain = [min(candidates, key=lambda c: c["profile"]["single"]["p99_ms"])["model"]]
+    return {"serving": chain[0], "chain": chain, "within_budget": bool(within), "rejected": rejected}
+
+
+def write_manifest(path, candidates, artifacts, policy):
+    """Select from the profiled candidates and write the manifest atomically; returns it"""
+    selection = select_serving(candidates, policy)
+    manifest = {
+        **selection,
+        "artifacts": {name: str(artifacts[name]) for name in selection["chain"]},
+        "policy": policy,
+        "profiles": {c["model"]: {"accuracy": c["accuracy"], **c["profile"]} for c in candidates},
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, path)
+    return manifest
+
+
+def read_manifest(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def serving_chain(artifact_dir, default):
+    """[(name, artifact path)] to try in order; [default] when there is no manifest"""
+    artifact_dir = Path(artifact_dir)
+    manifest = read_manifest(artifact_dir / MANIFEST_NAME)
+    if not manifest:
+        return [default]
+    chain = [(name, artifact_dir / manifest["artifacts"][name]) for name in manifest["chain"]
+             if name in manifest.get("artifacts", {})]
+    return chain or [default]
+
+
+def profile_results(results, artifact_dir, artifacts, X_sample):
+    """Profile each result's artifact ({model: file name in artifact_dir}) into result["profile"]"""
+    for result in results:
+        result["profile"] = profile_artifact(Path(artifact_dir) / artifacts[result["model"]], X_sample)
+    return results
+
+
+def select_from_results(results, artifact_dir, artifacts, policy=None):
+    """Choose from profiled results and write artifact_dir/serving_manifest.json"""
+    candidates = [{"model": r["model"], "accuracy": r["accuracy"], "profile": r["profile"]}
+                  for r in results if "profile" in r]
+    if not candidates:
+        raise ValueError("No profiled models to choose from; train (or run profiling.py --reprofile) first")
+    return write_manifest(Path(artifact_dir) / MANIFEST_NAME, candidates, artifacts, policy or policy_from_env())
+
+
+if __name__ == "__main__":
+    import argparse
+    import warnings
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser(description="Profile the trained *.pkl models and choose the serving model")
+    parser.add_argument("--p99-ms", type=float, default=None)
+    parser.add_argument("--memory-mb", type=float, default=None)
+    parser.add_argument("--reprofile", action="store_true", help="measure again instead of using the profiles in model_results.json")
+    args = parser.parse_args()
+
+    from train_models import MODELS
+    ml_dir = Path(__file__).parent
+    artifacts = {name: artifact for _, name, artifact in MODELS}
+    results_path = ml_dir / "model_results.json"
+    results = json.loads(results_path.read_text())
+    if args.reprofile:
+        import numpy as np
+        from sklearn.model_selection import train_test_split
+        from feature_store import open_store
+        store = open_store(ml_dir / "student_scores.csv", label_column="performance")
+        # the test split train_models.py evaluates on
+        _, test_idx = train_test_split(np.arange(len(store)), test_size=0.2, random_state=42)
+        profile_results(results, ml_dir, artifacts, store.X[np.sort(test_idx)])
+        tmp = results_path.with_name(f".{results_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(results, indent=2))
+        os.replace(tmp, results_path)
+    manifest = select_from_results(results, ml_dir, artifacts, policy_from_env(args.p99_ms, args.memory_mb))
+    print(json.dumps({k: manifest[k] for k in ("serving", "chain", "within_budget", "rejected", "policy")}, indent=2))
+    sys.exit(0)
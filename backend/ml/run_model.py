@@ -1,146 +1,882 @@
 # ...existing code...
+import os
 import sys
 import json
 import time
+import threading
+import contextvars
 from pathlib import Path
 
-import numpy as np
-import pandas as pd
-from joblib import dump, load
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.naive_bayes import GaussianNB
-from sklearn.neural_network import MLPClassifier
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.svm import SVC
-from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+# numpy, pandas and scikit-learn are imported inside the functions that use
+# them, so `status`, `health` or a single-model `predict` only pay for the
+# modules that action needs (see --startup-report)
+import instrumentation
+from instrumentation import stage
+from model_registry import ModelRegistry
+from prediction_cache import PredictionCache, normalize
+from mmap_artifacts import atomic_dump, export_artifact, fresh_mmap_copy, load_artifact, mmap_enabled
+from artifact_versions import current_dir
 
 MODELS_DIR = Path(__file__).parent / "models"
 MODELS_DIR.mkdir(exist_ok=True)
+# per-model validation scores written by `train`, in each version directory
+METRICS_NAME = "metrics.json"
+
+# artifacts are read from the published version directory (artifact_versions.py).
+# ACTIVE_DIR None follows models/CURRENT on every request; `serve` pins the
+# version it has loaded and moves the pin once the next one is in memory
+ACTIVE_DIR = None
+# fixed for the duration of one request, so a request never mixes two versions
+REQUEST_DIR = contextvars.ContextVar("request_dir", default=None)
+
+# budget in MB via ML_MODEL_CACHE_MB (unset/0 keeps every model loaded)
+REGISTRY = ModelRegistry(loader=load_artifact)
+# compiled lookup tables (lookup_table.py), keyed by their meta.json
+TABLES = ModelRegistry(loader=lambda meta: _open_table(meta))
+# single-row predictions; ML_PREDICTION_CACHE_SIZE / _TTL, 0 disables
+PREDICTIONS = PredictionCache()
+
+MODEL_NAMES = ["knn", "naive_bayes", "decision_tree", "svm", "neural_network"]
+
+def artifact_dir():
+    return REQUEST_DIR.get() or ACTIVE_DIR or current_dir()
 
 def load_dataset(path=None):
     if path:
-        p = Path(path)
-        if not p.exists():
-            raise FileNotFoundError(f"Dataset not found: {path}")
-        df = pd.read_csv(p)
-        if df.shape[1] < 2:
-            raise ValueError("Dataset must contain features + label (label as last column)")
-        X = df.iloc[:, :-1].values
-        y = df.iloc[:, -1].values
-        return X, y
+        # CSVs are converted once into the memory-mapped feature store
+        from feature_store import load_xy
+        return load_xy(path)
     # fallback: iris sample dataset
     from sklearn.datasets import load_iris
     iris = load_iris()
     return iris.data, iris.target
 
-def train_and_save(dataset_path=None, test_size=0.2, random_state=42):
-    X, y = load_dataset(dataset_path)
+def build_estimator(name, random_state=42, tuned=True):
+    # tuned=True applies models/best_params.json written by tune.py, if any
+    model = default_estimator(name, random_state)
+    if tuned:
+        from tune import load_best_params
+        params = load_best_params(name)
+        if params:
+            model.set_params(**params)
+    return model
+
+def default_estimator(name, random_state=42):
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+    if name == "knn":
+        # KNN (with scaling); the KD-tree index is built here and saved with the artifact
+        from spatial_knn import SpatialKNNClassifier
+        return Pipeline([("scaler", StandardScaler()), ("knn", SpatialKNNClassifier(n_neighbors=5))])
+    if name == "naive_bayes":
+        # Naive Bayes (Gaussian)
+        from sklearn.naive_bayes import GaussianNB
+        return Pipeline([("scaler", StandardScaler()), ("nb", GaussianNB())])
+    if name == "decision_tree":
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier(random_state=random_state, max_depth=10)
+    if name == "svm":
+        from sklearn.svm import SVC
+        return Pipeline([
+            ("scaler", StandardScaler()),
+            ("svm", SVC(kernel="rbf", probability=True, random_state=random_state))
+        ])
+    if name == "neural_network":
+        from sklearn.neural_network import MLPClassifier
+        return Pipeline([
+            ("scaler", StandardScaler()),
+            ("mlp", MLPClassifier(hidden_layer_sizes=(64, 32), max_iter=500, random_state=random_state))
+        ])
+    raise ValueError(f"Unknown model: {name}")
+
+def fit_and_save(name, dataset_ref, train_idx, test_idx, random_state=42, out_dir=None):
+    # runs in a worker process; the dataset is re-opened from the feature
+    # store (memory-mapped, shared page cache) instead of being pickled over,
+    # and the artifact is written as soon as the fit is done
+    X, y = load_dataset(dataset_ref)
+    X_train, y_train = X[train_idx], y[train_idx]
+    X_test, y_test = X[test_idx], y[test_idx]
+    model = build_estimator(name, random_state)
+    model.fit(X_train, y_train)
+    return save_and_score(name, model, X_test, y_test, out_dir)
+
+def save_and_score(name, model, X_test, y_test, out_dir=None):
+    from evaluation import evaluate
+    preds = model.predict(X_test)
+    path = Path(out_dir or artifact_dir()) / f"{name}.joblib"
+    atomic_dump(model, path)
+    if mmap_enabled():
+        export_artifact(path)
+    # one confusion matrix; accuracy and the report are derived from it
+    metrics = evaluate(y_test, preds)
+    return {
+        "accuracy": metrics["accuracy"],
+        "classification_report": metrics["classification_report"],
+        "confusion_matrix": metrics["confusion_matrix"]
+    }, preds
+
+def train_jobs(jobs=None):
+    if jobs is None:
+        jobs = int(os.environ.get("ML_TRAIN_JOBS", "0") or 0)
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return max(1, min(jobs, len(MODEL_NAMES)))
+
+def train_and_save(dataset_path=None, test_size=0.2, random_state=42, jobs=None, shards=None, policy=None):
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    dataset_ref = None
+    if dataset_path:
+        from feature_store import build_store
+        dataset_ref = str(build_store(dataset_path))
+    X, y = load_dataset(dataset_ref)
     strat = y if len(np.unique(y)) > 1 else None
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=random_state, stratify=strat)
-
-    results = {}
-
-    # KNN (with scaling)
-    knn_pipe = Pipeline([("scaler", StandardScaler()), ("knn", KNeighborsClassifier(n_neighbors=5))])
-    knn_pipe.fit(X_train, y_train)
-    preds = knn_pipe.predict(X_test)
-    results['knn'] = {
-        "accuracy": float(accuracy_score(y_test, preds)),
-        "classification_report": classification_report(y_test, preds, output_dict=True),
-        "confusion_matrix": classification_matrix_to_list(confusion_matrix(y_test, preds))
-    }
-    dump(knn_pipe, MODELS_DIR / "knn.joblib")
-
-    # Naive Bayes (Gaussian)
-    nb_pipe = Pipeline([("scaler", StandardScaler()), ("nb", GaussianNB())])
-    nb_pipe.fit(X_train, y_train)
-    preds = nb_pipe.predict(X_test)
-    results['naive_bayes'] = {
-        "accuracy": float(accuracy_score(y_test, preds)),
-        "classification_report": classification_report(y_test, preds, output_dict=True),
-        "confusion_matrix": classification_matrix_to_list(confusion_matrix(y_test, preds))
-    }
-    dump(nb_pipe, MODELS_DIR / "naive_bayes.joblib")
-
-    # Decision Tree
-    dt_model = DecisionTreeClassifier(random_state=random_state, max_depth=10)
-    dt_model.fit(X_train, y_train)
-    preds = dt_model.predict(X_test)
-    results['decision_tree'] = {
-        "accuracy": float(accuracy_score(y_test, preds)),
-        "classification_report": classification_report(y_test, preds, output_dict=True),
-        "confusion_matrix": classification_matrix_to_list(confusion_matrix(y_test, preds))
-    }
-    dump(dt_model, MODELS_DIR / "decision_tree.joblib")
-
-    # SVM
-    svm_pipe = Pipeline([
-        ("scaler", StandardScaler()),
-        ("svm", SVC(kernel="rbf", probability=True, random_state=random_state))
-    ])
-    svm_pipe.fit(X_train, y_train)
-    preds = svm_pipe.predict(X_test)
-    results['svm'] = {
-        "accuracy": float(accuracy_score(y_test, preds)),
-        "classification_report": classification_report(y_test, preds, output_dict=True),
-        "confusion_matrix": classification_matrix_to_list(confusion_matrix(y_test, preds))
-    }
-    dump(svm_pipe, MODELS_DIR / "svm.joblib")
-
-    # Neural Network (MLP)
-    mlp_pipe = Pipeline([
-        ("scaler", StandardScaler()),
-        ("mlp", MLPClassifier(hidden_layer_sizes=(64, 32), max_iter=500, random_state=random_state))
-    ])
-    mlp_pipe.fit(X_train, y_train)
-    preds = mlp_pipe.predict(X_test)
-    results['neural_network'] = {
-        "accuracy": float(accuracy_score(y_test, preds)),
-        "classification_report": classification_report(y_test, preds, output_dict=True),
-        "confusion_matrix": classification_matrix_to_list(confusion_matrix(y_test, preds))
-    }
-    dump(mlp_pipe, MODELS_DIR / "neural_network.joblib")
+    # splitting row indices gives the same partition as splitting X and y
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=test_size, random_state=random_state, stratify=strat)
+
+    # everything is written into a staging directory and published as one
+    # version at the end; predictors never see a partial set. The lock keeps
+    # a concurrent `update` from publishing on top of it from an older base
+    from artifact_versions import stage, publish, discard, publishing
+    with publishing():
+        staging = stage()
+        try:
+            out, version = _train_into(staging, dataset_ref, X, y, train_idx, test_idx, random_state, jobs, shards, policy)
+            publish(staging, version, "train")
+        except BaseException:
+            discard(staging)
+            raise
+    return {**out, "version": version}
+
+def _train_into(staging, dataset_ref, X, y, train_idx, test_idx, random_state, jobs, shards, policy):
+    import numpy as np
+    fitted, sharding = {}, None
+    shards = train_shards(shards)
+    if shards > 1:
+        # KNN and Naive Bayes from merged per-shard statistics, see sharded_training.py
+        from sharded_training import SHARDABLE, fit_sharded
+        templates = {name: build_estimator(name, random_state) for name in SHARDABLE}
+        # workers per shard, not per model: not capped at the number of models
+        shard_jobs = jobs or int(os.environ.get("ML_TRAIN_JOBS", "0") or 0)
+        models, sharding = fit_sharded(templates, dataset_ref, train_idx, shards,
+                                       jobs=shard_jobs if shard_jobs > 0 else os.cpu_count() or 1)
+        X_test, y_test = X[test_idx], y[test_idx]
+        fitted = {name: save_and_score(name, model, X_test, y_test, staging) for name, model in models.items()}
+
+    remaining = [name for name in MODEL_NAMES if name not in fitted]
+    jobs = min(train_jobs(jobs), len(remaining))
+    split = (dataset_ref, train_idx, test_idx, random_state, str(staging))
+    if jobs <= 1:
+        fitted.update({name: fit_and_save(name, *split) for name in remaining})
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {name: pool.submit(fit_and_save, name, *split) for name in remaining}
+            fitted.update({name: f.result() for name, f in futures.items()})
+
+    # paired bootstrap over the shared test split: intervals per model and
+    # whether the differences between models hold up
+    from evaluation import compare
+    comparison = compare(y[test_idx], {name: fitted[name][1] for name in MODEL_NAMES},
+                         n_resamples=bootstrap_resamples(), seed=random_state)
+    # same key order as a sequential run
+    results = {name: {**fitted[name][0], "ci": comparison["models"][name]} for name in MODEL_NAMES}
+    # inference cost next to accuracy; the most accurate model within the
+    # latency/memory budget serves requests that name no model (profiling.py)
+    from profiling import profile_results, select_from_results
+    artifacts = {name: f"{name}.joblib" for name in MODEL_NAMES}
+    profiled = profile_results([{"model": name, "accuracy": results[name]["accuracy"]} for name in MODEL_NAMES],
+                               staging, artifacts, X[np.sort(test_idx)])
+    for row in profiled:
+        results[row["model"]]["profile"] = row["profile"]
+    manifest = select_from_results(profiled, staging, artifacts, policy)
+    # validation scores; predict_all's ensemble mode weighs its vote with them
+    metrics = {name: {"accuracy": results[name]["accuracy"], "f1_weighted": comparison["models"][name]["f1_weighted"]["value"]}
+               for name in MODEL_NAMES}
+    metrics_path = staging / METRICS_NAME
+    tmp = metrics_path.with_name(f".{METRICS_NAME}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(metrics, indent=2))
+    os.replace(tmp, metrics_path)
+    version = record_training(dataset_ref, X, y, train_idx, random_state, staging)
+    out = {"results": results, "comparison": {k: comparison[k] for k in ("n_test", "n_resamples", "alpha", "pairwise", "p_best")}}
+    out["serving"] = {k: manifest[k] for k in ("serving", "chain", "within_budget", "rejected", "policy")}
+    if sharding:
+        out["sharded"] = sharding
+    return out, version
 
-    return results
+def train_shards(shards=None):
+    # ML_TRAIN_SHARDS when the request does not say; 0 or 1 trains unsharded
+    if shards is None:
+        shards = int(os.environ.get("ML_TRAIN_SHARDS", "0") or 0)
+    return max(0, int(shards))
 
-def classification_matrix_to_list(cm):
+def bootstrap_resamples():
+    return int(os.environ.get("ML_BOOTSTRAP_RESAMPLES", "1000") or 1000)
+
+def record_training(dataset_ref, X, y, train_idx, random_state=42, out_dir=None):
+    # seed the reservoir used by `update` with the training split (kept in the
+    # version, so a rollback restores it) and start a new artifact version
+    from incremental import RESERVOIR_NAME, new_reservoir, save_reservoir, record_version
+    from model_registry import file_sha256
+    feature_names = label_name = None
+    if dataset_ref:
+        from feature_store import FeatureStore
+        meta = FeatureStore(dataset_ref).meta
+        feature_names, label_name = meta["feature_names"], meta.get("label_name")
+    out_dir = Path(out_dir or artifact_dir())
+    save_reservoir(new_reservoir(X[train_idx], y[train_idx], feature_names, label_name, seed=random_state),
+                   out_dir / RESERVOIR_NAME)
+    artifacts = {name: {"method": "train", "sha256": file_sha256(out_dir / f"{name}.joblib")} for name in MODEL_NAMES}
+    return record_version("train", artifacts, rows=len(train_idx))
+
+# ------------------------------------------------------------------
+# update: fold newly labeled rows into the trained models without
+# retraining on the full history, see incremental.py
+# ------------------------------------------------------------------
+
+INCREMENTAL_MODELS = ("naive_bayes", "neural_network")
+
+def artifact_version():
+    # the version being served; read directly so `status` does not import
+    # numpy through incremental.py
+    directory = artifact_dir()
+    if directory.parent.name == "versions":
+        return int(directory.name)
     try:
-        return cm.tolist()
-    except Exception:
-        return []
+        return json.loads((MODELS_DIR / "versions.json").read_text())["version"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return 0
+
+def _fresh_model(name, directory=None):
+    # a private copy: the registry's instance may be serving other requests
+    from joblib import load
+    path = Path(directory or artifact_dir()) / f"{name}.joblib"
+    if not path.exists():
+        raise FileNotFoundError(f"Model file not found: {path}")
+    return load(path)
+
+def update_models(rows, feature_names=None, label_name=None, models=None, random_state=42):
+    from artifact_versions import current_dir, publishing
+    names = models or MODEL_NAMES
+    unknown = [n for n in names if n not in MODEL_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown model(s): {', '.join(unknown)}")
+    # the newest published version, not the one this request started on, is
+    # the base; holding the lock until the result is published means a
+    # concurrent update or train never starts from the same base
+    with publishing():
+        return _update_from(current_dir(), rows, feature_names, label_name, names, random_state)
+
+def _update_from(base, rows, feature_names, label_name, names, random_state):
+    from incremental import (RESERVOIR_NAME, RESERVOIR_PATH, load_reservoir, reservoir_add, save_reservoir,
+                             parse_labeled_rows, read_versions, record_version)
+    from artifact_versions import stage, publish, discard
+    from model_registry import file_sha256
+    # versions published before the reservoir moved into them use models/reservoir.npz
+    res_path = base / RESERVOIR_NAME
+    res = load_reservoir(res_path if res_path.exists() else RESERVOIR_PATH)
+    reference = _fresh_model("naive_bayes", base)
+    X, y, valid, errors = parse_labeled_rows(
+        rows, feature_names or res["feature_names"], label_name or res["label_name"],
+        reference.classes_, n_features=reference.n_features_in_)
+    summary = {"rows": len(rows), "valid": len(valid), "invalid": len(errors),
+               "errors": [{"index": i, "error": errors[i]} for i in sorted(errors)]}
+    if not valid:
+        return {**summary, "updated": {}, "version": read_versions()["version"]}
+
+    res = reservoir_add(res, X, y)
+    fitted = {}
+    for name in names:
+        started = time.perf_counter()
+        if name in INCREMENTAL_MODELS:
+            # the scaler stays frozen so earlier statistics and weights keep their meaning
+            model = _fresh_model(name, base)
+            model[-1].partial_fit(model[:-1].transform(X), y)
+            method, n = "partial_fit", len(X)
+        else:
+            model = build_estimator(name, random_state)
+            model.fit(res["X"], res["y"])
+            method, n = "reservoir_refit", len(res["X"])
+        fitted[name] = (model, {"method": method, "rows": n, "ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    # write everything only after every fit succeeded: a new version holding
+    # the updated artifacts and links to the unchanged ones
+    staging = stage(base=base)
+    try:
+        artifacts = {}
+        for name, (model, info) in fitted.items():
+            path = staging / f"{name}.joblib"
+            atomic_dump(model, path)
+            if mmap_enabled():
+                export_artifact(path)
+            artifacts[name] = {"method": info["method"], "sha256": file_sha256(path)}
+        save_reservoir(res, staging / RESERVOIR_NAME)
+        version = record_version("update", artifacts, rows=len(valid))
+        publish(staging, version, "update")
+    except BaseException:
+        discard(staging)
+        raise
+    return {
+        **summary,
+        "version": version,
+        "updated": {name: info for name, (_, info) in fitted.items()},
+        "reservoir": {"size": len(res["X"]), "capacity": res["capacity"], "seen": res["seen"]},
+    }
 
 def ensure_models_exist():
-    if not any(MODELS_DIR.glob("*.joblib")):
+    if not any(artifact_dir().glob("*.joblib")):
         return train_and_save()
     return {"status": "models_exist"}
 
-def load_model(name):
-    path = MODELS_DIR / f"{name}.joblib"
+def load_model(name, directory=None):
+    path = Path(directory or artifact_dir()) / f"{name}.joblib"
     if not path.exists():
         raise FileNotFoundError(f"Model file not found: {path}")
-    return load(path)
+    if mmap_enabled():
+        # ML_MMAP_MODELS=1: map the exported copy so workers share its arrays
+        path = fresh_mmap_copy(path) or path
+    # cached in-process; reloaded only when the artifact changes on disk
+    with stage("load"):
+        return REGISTRY.get(path)
+
+def serving_model():
+    # first model of the serving manifest's chain whose artifact exists; None before the first train
+    from profiling import serving_chain
+    for name, path in serving_chain(artifact_dir(), (None, None)):
+        if name and path.exists():
+            return name
+    return None
+
+def _open_table(meta_path):
+    from lookup_table import LookupTablePredictor
+    return LookupTablePredictor(Path(meta_path).parent)
 
-def predict_with_model(model_name, features):
-    model = load_model(model_name)
-    X = np.array(features)
-    if X.ndim == 1:
-        X = X.reshape(1, -1)
-    preds = model.predict(X).tolist()
+def compiled_enabled(flag=None):
+    if flag is not None:
+        return bool(flag)
+    return os.environ.get("ML_COMPILED_MODELS", "").lower() in ("1", "true", "yes")
+
+def load_compiled(name):
+    """The model's lookup table if one was compiled from the current artifact, else None"""
+    meta = MODELS_DIR / "lut" / name / "meta.json"
+    if not meta.exists():
+        return None
+    with stage("load"):
+        table = TABLES.get(meta)
+        # hashed once per artifact file, even if only the table is ever served
+        if table.meta.get("source_sha256") != REGISTRY.digest(artifact_dir() / f"{name}.joblib"):
+            # retrained or updated since compiling: the table no longer matches
+            return None
+    return table
+
+def resolve_model(name, compiled=None, eps=None):
+    """(estimator, "lookup_table" | "model") for one request"""
+    if compiled_enabled(compiled) and eps is None:
+        table = load_compiled(name)
+        if table is not None:
+            return table, "lookup_table"
+    return with_knn_eps(load_model(name), eps), "model"
+
+def with_knn_eps(model, eps):
+    # approximate KD-tree search for one request; shallow copies keep the
+    # cached model (and its tree) shared and untouched
+    import copy
+    from spatial_knn import SpatialKNNClassifier
+    if eps is None or not hasattr(model, "steps"):
+        return model
+    name, final = model.steps[-1]
+    if not isinstance(final, SpatialKNNClassifier):
+        return model
+    knn = copy.copy(final)
+    knn.eps = float(eps)
+    model = copy.copy(model)
+    model.steps = model.steps[:-1] + [(name, knn)]
+    return model
+
+def predict_with_model(model_name, features, eps=None, compiled=None):
+    # repeated single-row requests are answered from PREDICTIONS; the key
+    # carries the artifact's hash, so a retrained model never serves old entries
+    row = normalize(features) if PREDICTIONS.enabled else None
+    if row is not None:
+        path = artifact_dir() / f"{model_name}.joblib"
+        if not path.exists():
+            raise FileNotFoundError(f"Model file not found: {path}")
+        version = REGISTRY.digest(path)
+        variant = (eps, compiled_enabled(compiled))
+        hit = PREDICTIONS.get(model_name, version, variant, row)
+        if hit is not None:
+            return {**hit, "cached": True}
+    out = _evaluate(model_name, features, eps, compiled)
+    if row is not None:
+        PREDICTIONS.put(model_name, version, variant, row, out)
+    return out
+
+def _evaluate(model_name, features, eps=None, compiled=None):
+    import numpy as np
+    model, served_by = resolve_model(model_name, compiled, eps)
+    with stage("parse"):
+        X = np.array(features)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+    with stage("predict"):
+        preds = model.predict(X).tolist()
     proba = None
     if hasattr(model, "predict_proba"):
         try:
-            proba = model.predict_proba(X).tolist()
+            with stage("predict_proba"):
+                proba = model.predict_proba(X).tolist()
         except Exception:
             proba = None
-    return {"predictions": preds, "probabilities": proba}
+    return {"predictions": preds, "probabilities": proba, "served_by": served_by}
+
+def _batch_rows(payload):
+    # batch input: inline "rows" or a JSON/JSONL/CSV file at "input_path"
+    if payload.get("rows") is not None:
+        rows = payload["rows"]
+        if not isinstance(rows, list):
+            raise ValueError("'rows' must be a list")
+        return rows
+    if payload.get("input_path"):
+        from batch_io import read_rows
+        return read_rows(payload["input_path"], payload.get("format"))
+    return None
+
+def predict_batch(model_name, rows, feature_names=None, eps=None, compiled=None):
+    from batch_io import parse_rows
+    model, served_by = resolve_model(model_name, compiled, eps)
+    with stage("parse"):
+        X, valid, errors = parse_rows(rows, feature_names, n_features=getattr(model, "n_features_in_", None))
+    return {**_predict_parsed(model, X, valid, errors, len(rows)), "served_by": served_by}
+
+def _predict_parsed(model, X, valid, errors, n_rows):
+    from batch_io import predict_rows, assemble_results
+    preds, proba = predict_rows(model, X)
+    classes = getattr(model, "classes_", None)
+    return {
+        "count": n_rows,
+        "valid": len(valid),
+        "invalid": len(errors),
+        "results": assemble_results(n_rows, valid, errors, preds, proba, classes),
+    }
+
+def predict_ensemble(features=None, rows=None, feature_names=None, weights=None, budget_ms=None, compiled=None):
+    # fused predict_all: shared scaling, members in a thread pool, weighted soft vote
+    import numpy as np
+    import ensemble
+    members, failed = {}, {}
+    for m in MODEL_NAMES:
+        try:
+            members[m] = resolve_model(m, compiled)
+        except Exception as e:
+            failed[m] = {"error": str(e)}
+    if not members:
+        raise ValueError("No model could be loaded")
+    vote_weights = {**ensemble.load_weights(artifact_dir() / METRICS_NAME, members), **(weights or {})}
+    if budget_ms is None:
+        budget_ms = ensemble.default_budget_ms()
+
+    if rows is None:
+        with stage("parse"):
+            X = np.array(features, dtype=float)
+            if X.ndim == 1:
+                X = X.reshape(1, -1)
+        with stage("predict"):
+            out = ensemble.run(members, X, vote_weights, budget_ms)
+        out["members"].update(failed)
+        return out
+
+    from batch_io import parse_rows, assemble_results
+    width = getattr(next(iter(members.values()))[0], "n_features_in_", None)
+    with stage("parse"):
+        X, valid, errors = parse_rows(rows, feature_names, n_features=width)
+    if not valid:
+        return {"count": len(rows), "valid": 0, "invalid": len(errors),
+                "results": assemble_results(len(rows), valid, errors, [], None)}
+    with stage("predict"):
+        out = ensemble.run(members, X, vote_weights, budget_ms)
+    vote = out.pop("ensemble")
+    # per-row member outputs would multiply the response; members report status and timing only
+    members_report = {m: {k: v for k, v in r.items() if k not in ("predictions", "probabilities")}
+                      for m, r in {**out["members"], **failed}.items()}
+    return {
+        "count": len(rows),
+        "valid": len(valid),
+        "invalid": len(errors),
+        "results": assemble_results(len(rows), valid, errors, vote["predictions"],
+                                    np.asarray(vote["probabilities"]), vote["classes"]),
+        **{k: v for k, v in out.items() if k != "members"},
+        "members": members_report,
+        "weights": vote["weights"],
+        "members_used": vote["members_used"],
+    }
+
+def predict_all_batch(rows, feature_names=None, compiled=None):
+    from batch_io import parse_rows
+    all_results = {}
+    parsed = {}
+    for m in MODEL_NAMES:
+        try:
+            model, served_by = resolve_model(m, compiled)
+            # rows are parsed once per distinct input width
+            width = getattr(model, "n_features_in_", None)
+            if width not in parsed:
+                with stage("parse"):
+                    parsed[width] = parse_rows(rows, feature_names, n_features=width)
+            X, valid, errors = parsed[width]
+            all_results[m] = {**_predict_parsed(model, X, valid, errors, len(rows)), "served_by": served_by}
+        except Exception as e:
+            all_results[m] = {"error": str(e)}
+    return all_results
+
+def handle_request(payload):
+    token = REQUEST_DIR.set(artifact_dir())
+    try:
+        return _handle(payload)
+    finally:
+        REQUEST_DIR.reset(token)
+
+def _handle(payload):
+    action = (payload.get("action") or "status").lower()
+
+    if action == "train":
+        dataset = payload.get("dataset_path")
+        from profiling import policy_from_env
+        res = train_and_save(dataset, jobs=payload.get("jobs"), shards=payload.get("shards"),
+                             policy=policy_from_env(payload.get("max_p99_ms"), payload.get("max_memory_mb")))
+        return {"success": True, "trained": True, **res}
+
+    if action == "rollback":
+        # CURRENT back to the previous (or the given) version; running `serve`
+        # processes switch to it like to a new one
+        from artifact_versions import rollback
+        return {"success": True, "rolled_back": rollback(payload.get("version"))}
+
+    if action == "versions":
+        from artifact_versions import describe
+        return {"success": True, **describe()}
+
+    ensure_models_exist()
+
+    if action == "predict":
+        model = payload.get("model") or serving_model()
+        features = payload.get("features")
+        rows = _batch_rows(payload)
+        if model and rows is not None:
+            out = predict_batch(model, rows, payload.get("feature_names"), payload.get("eps"), payload.get("compiled"))
+            return {"success": True, "model": model, "result": out}
+        if not model or features is None:
+            raise ValueError("Provide 'model' (knn|naive_bayes|decision_tree|svm|neural_network) and 'features', 'rows' or 'input_path'")
+        out = predict_with_model(model, features, payload.get("eps"), payload.get("compiled"))
+        return {"success": True, "model": model, "result": out}
+
+    if action == "predict_all":
+        features = payload.get("features")
+        rows = _batch_rows(payload)
+        if payload.get("ensemble"):
+            if rows is None and features is None:
+                raise ValueError("Provide 'features', 'rows' or 'input_path'")
+            out = predict_ensemble(features, rows, payload.get("feature_names"), payload.get("weights"),
+                                   payload.get("budget_ms"), payload.get("compiled"))
+            return {"success": True, **out}
+        if rows is not None:
+            return {"success": True, "results": predict_all_batch(rows, payload.get("feature_names"), payload.get("compiled"))}
+        if features is None:
+            raise ValueError("Provide 'features' as list, or 'rows' / 'input_path' for a batch")
+        all_results = {}
+        for m in MODEL_NAMES:
+            try:
+                all_results[m] = predict_with_model(m, features, compiled=payload.get("compiled"))
+            except Exception as e:
+                all_results[m] = {"error": str(e)}
+        return {"success": True, "results": all_results}
+
+    if action == "score":
+        # streaming cohort scoring of a CSV/JSONL export, see stream_score.py
+        from stream_score import score_stream, print_progress
+        model = payload.get("model") or serving_model()
+        if not model:
+            raise ValueError("Provide 'model' (knn|naive_bayes|decision_tree|svm|neural_network); no model is serving yet")
+        if not payload.get("input_path") or not payload.get("output_path"):
+            raise ValueError("Provide 'input_path' and 'output_path' for scoring")
+        summary = score_stream(
+            load_model(model), payload["input_path"], payload["output_path"],
+            chunk_size=int(payload.get("chunk_size") or 50000),
+            fmt=payload.get("format"),
+            feature_names=payload.get("feature_names"),
+            id_columns=payload.get("id_columns"),
+            progress=print_progress if payload.get("progress") else None,
+            attempts=bool(payload.get("attempts")),
+        )
+        return {"success": True, "model": model, **summary}
+
+    if action == "update":
+        rows = _batch_rows(payload)
+        if rows is None:
+            raise ValueError("Provide labeled 'rows' or 'input_path' (json, jsonl or csv) for an update")
+        out = update_models(rows, payload.get("feature_names"), payload.get("label_column"), payload.get("models"))
+        return {"success": True, **out}
+
+    if action == "export_mmap":
+        from mmap_artifacts import export_all
+        return {"success": True, **export_all()}
+
+    if action == "status":
+        files = [p.name for p in artifact_dir().glob("*.joblib")]
+        return {"success": True, "models": files, "version": artifact_version(), "serving": serving_model(),
+                "cache": REGISTRY.stats(), "prediction_cache": PREDICTIONS.stats()}
+
+    raise ValueError(f"Unknown action: {action}")
+
+# ------------------------------------------------------------------
+# serve: long-lived worker answering newline-delimited JSON requests.
+# Every request may carry an "id" which is echoed in its response;
+# responses are written as soon as they complete, so callers must
+# match them by id rather than by order.
+# ------------------------------------------------------------------
+
+CONTROL_ACTIONS = ("health", "ping", "shutdown", "serve")
+
+class _ServeState:
+    def __init__(self, workers):
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.workers = workers
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.stopping = threading.Event()
+        self.watcher = None
+
+    def health(self):
+        with self.lock:
+            counters = {"requests": self.requests, "errors": self.errors, "in_flight": self.in_flight}
+        return {
+            "success": True,
+            "status": "stopping" if self.stopping.is_set() else "ok",
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started, 3),
+            "workers": self.workers,
+            "models_loaded": sorted(REGISTRY.loaded()),
+            "version": artifact_version(),
+            "reload": self.watcher.stats() if self.watcher else None,
+            **counters,
+            "cache": REGISTRY.stats(),
+            "prediction_cache": PREDICTIONS.stats(),
+        }
+
+    def respond(self, payload):
+        action = (payload.get("action") or "").lower()
+        if action in ("health", "ping"):
+            out = self.health()
+        elif action == "shutdown":
+            self.stopping.set()
+            out = {"success": True, "status": "stopping"}
+        elif action == "serve":
+            out = {"success": False, "error": "Already serving"}
+        else:
+            with self.lock:
+                self.in_flight += 1
+            try:
+                out = handle_request(payload)
+            except Exception as e:
+                out = {"success": False, "error": str(e)}
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+        self.record(out)
+        if "id" in payload:
+            out = {"id": payload["id"], **out}
+        return out
+
+    def record(self, out):
+        with self.lock:
+            self.requests += 1
+            if not out.get("success"):
+                self.errors += 1
+
+    def submit(self, line, write):
+        try:
+            payload = json.loads(line)
+            if not isinstance(payload, dict):
+                raise ValueError("Request must be a JSON object")
+        except Exception as e:
+            write(json.dumps({"success": False, "error": f"Invalid request: {e}"}))
+            return None
+        # health checks and shutdown are answered inline so they never
+        # queue behind slow predictions
+        if (payload.get("action") or "").lower() in CONTROL_ACTIONS:
+            write(json.dumps(self.respond(payload), default=str))
+            return None
+        return self.executor.submit(lambda: write(self.reply(payload)))
+
+    def reply(self, payload):
+        # serialized response; with timings on, stages are recorded on this worker thread
+        if not instrumentation.enabled(payload.get("timings")):
+            return json.dumps(self.respond(payload), default=str)
+        timer = instrumentation.start()
+        return instrumentation.dumps_with_timings(self.respond(payload), timer, _metric_labels(payload))
+
+def _line_writer(stream):
+    lock = threading.Lock()
+    def write(text):
+        with lock:
+            stream.write(text + "\n")
+            stream.flush()
+    return write
+
+def _serve_stdio(state):
+    write = _line_writer(sys.stdout)
+    for line in sys.stdin:
+        if line.strip():
+            state.submit(line, write)
+        if state.stopping.is_set():
+            break
+
+def _serve_unix_socket(state, socket_path):
+    import socket
+    import socketserver
+    from concurrent.futures import wait
+    if not hasattr(socket, "AF_UNIX"):
+        raise ValueError("Unix sockets are not supported on this platform; serve over stdio instead")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            write = _line_writer(self.wfile_text)
+            pending = []
+            for raw in self.rfile:
+                line = raw.decode("utf-8")
+                if line.strip():
+                    pending.append(state.submit(line, write))
+                if state.stopping.is_set():
+                    break
+            # keep the connection open until its responses are written
+            wait([f for f in pending if f is not None])
+
+        def setup(self):
+            super().setup()
+            import io
+            self.wfile_text = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+
+    path = Path(socket_path)
+    if path.exists():
+        path.unlink()
+    server = socketserver.ThreadingUnixStreamServer(str(path), Handler)
+    server.daemon_threads = True
+    watcher = threading.Thread(target=lambda: (state.stopping.wait(), server.shutdown()), daemon=True)
+    watcher.start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if path.exists():
+            path.unlink()
+
+def _switch_version(directory):
+    # on the watcher thread: every model of the new version is loaded before
+    # requests are pointed at it; requests already running keep the models
+    # they resolved, and the old version's cache entries are dropped after
+    global ACTIVE_DIR
+    for m in MODEL_NAMES:
+        if (directory / f"{m}.joblib").exists():
+            load_model(m, directory)
+    ACTIVE_DIR = directory
+    REGISTRY.retain(directory)
+
+def serve(socket_path=None, workers=4, preload=True, microbatch=None):
+    global ACTIVE_DIR
+    from artifact_versions import VersionWatcher, current
+    ensure_models_exist()
+    state = _ServeState(workers)
+    # serve the version published now; the watcher moves to newer ones
+    # (or a rollback) in the background, every ML_RELOAD_INTERVAL_S
+    pointer = current()
+    ACTIVE_DIR = current_dir()
+    if preload:
+        for m in MODEL_NAMES:
+            try:
+                load_model(m)
+            except Exception as e:
+                print(f"serve: could not preload {m}: {e}", file=sys.stderr)
+    state.watcher = VersionWatcher(_switch_version, active=pointer["version"] if pointer else None).start()
+    try:
+        if microbatch is not None:
+            # single-row predictions are coalesced; everything else still goes through state.reply
+            from microbatch import serve_microbatch
+            serve_microbatch(load_model, state.reply, state.health, socket_path, workers, **microbatch,
+                             record=state.record, labels=_metric_labels)
+        elif socket_path:
+            _serve_unix_socket(state, socket_path)
+        else:
+            _serve_stdio(state)
+    finally:
+        state.watcher.stop()
+        # drain in-flight requests before exiting
+        state.executor.shutdown(wait=True)
+
+_METRIC_ACTIONS = {"train", "rollback", "versions", "predict", "predict_all", "score", "update",
+                   "export_mmap", "status", "health", "ping", "shutdown", "serve"}
+
+def _metric_labels(payload):
+    # label values come from the request; anything unknown is "other" so a
+    # client cannot add a series per distinct string
+    action = str(payload.get("action") or "status").lower()
+    model = payload.get("model") or ""
+    return {"script": "run_model", "action": action if action in _METRIC_ACTIONS else "other",
+            "model": model if model == "" or model in MODEL_NAMES else "other"}
 
 def main():
+    # --startup-report: re-run this command under -X importtime and print
+    # the per-module breakdown instead of the normal response
+    if "--startup-report" in sys.argv:
+        from startup_profile import startup_report
+        argv = [a for a in sys.argv if a != "--startup-report"]
+        stdin_data = sys.stdin.read() if not sys.stdin.isatty() else ""
+        print(json.dumps(startup_report(argv, stdin_data), indent=2))
+        return
+
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "startup-check":
+        from startup_profile import check_budget
+        result = check_budget(float(sys.argv[2]) if len(sys.argv) > 2 else None)
+        print(json.dumps(result))
+        sys.exit(0 if result.get("within_budget") else 1)
+
     # accept JSON from stdin or simple argv commands
+    # (serve is started from argv because stdin then carries the request stream)
+    if len(sys.argv) > 1 and sys.argv[1].lower() == "serve":
+        args = sys.argv[2:]
+        socket_path = None
+        workers = 4
+        microbatch = False
+        batch_options = {}
+        batch_flags = {"--window-ms": ("window_ms", float), "--max-batch": ("max_batch", int),
+                       "--max-queue": ("max_queue", int), "--timeout-ms": ("timeout_ms", float)}
+        while args:
+            flag = args.pop(0)
+            if flag == "--socket" and args:
+                socket_path = args.pop(0)
+            elif flag == "--workers" and args:
+                workers = int(args.pop(0))
+            elif flag == "--microbatch":
+                microbatch = True
+            elif flag in batch_flags and args:
+                key, cast = batch_flags[flag]
+                batch_options[key] = cast(args.pop(0))
+            else:
+                print(json.dumps({"success": False, "error": f"Unknown serve option: {flag}"}))
+                return
+        if microbatch:
+            from microbatch import options_from_env
+            microbatch = {**options_from_env(), **batch_options}
+        serve(socket_path, workers, microbatch=microbatch or None)
+        return
+
+    # ML_TIMINGS=1 times the request read too; "timings": true starts after it
+    timer = instrumentation.start(include_startup=True) if instrumentation.enabled() else None
     try:
-        payload = json.load(sys.stdin) if not sys.stdin.isatty() else {}
+        with stage("read_request"):
+            payload = json.load(sys.stdin) if not sys.stdin.isatty() else {}
     except Exception:
         payload = {}
 
@@ -151,51 +887,18 @@ def main():
         if len(sys.argv) > 2:
             payload["dataset_path"] = sys.argv[2]
 
-    action = (payload.get("action") or "status").lower()
+    if timer is None and payload.get("timings"):
+        timer = instrumentation.start(include_startup=True)
 
     try:
-        if action == "train":
-            dataset = payload.get("dataset_path")
-            res = train_and_save(dataset)
-            print(json.dumps({"success": True, "trained": True, "results": res}, default=str))
-            return
-
-        ensure_models_exist()
-
-        if action == "predict":
-            model = payload.get("model")
-            features = payload.get("features")
-            if not model or features is None:
-                raise ValueError("Provide 'model' (knn|naive_bayes|decision_tree|svm|neural_network) and 'features'")
-            out = predict_with_model(model, features)
-            print(json.dumps({"success": True, "model": model, "result": out}, default=str))
-            return
-
-        if action == "predict_all":
-            features = payload.get("features")
-            if features is None:
-                raise ValueError("Provide 'features' as list")
-            models = ["knn", "naive_bayes", "decision_tree", "svm", "neural_network"]
-            all_results = {}
-            for m in models:
-                try:
-                    all_results[m] = predict_with_model(m, features)
-                except Exception as e:
-                    all_results[m] = {"error": str(e)}
-            print(json.dumps({"success": True, "results": all_results}, default=str))
-            return
-
-        if action == "status":
-            files = [p.name for p in MODELS_DIR.glob("*.joblib")]
-            print(json.dumps({"success": True, "models": files}))
-            return
-
-        raise ValueError(f"Unknown action: {action}")
-
+        result = handle_request(payload)
     except Exception as e:
-        print(json.dumps({"success": False, "error": str(e)}))
-        return
+        result = {"success": False, "error": str(e)}
+    if timer is None:
+        print(json.dumps(result, default=str))
+    else:
+        print(instrumentation.dumps_with_timings(result, timer, _metric_labels(payload)))
 
 if __name__ == "__main__":
     main()
-# ...existing code...
\ No newline at end of file
+# ...existing code...
@@ -0,0 +1,296 @@
+# backend/ml/sharded_training.py
+# Sharded (map-reduce) training for the models whose fit is a mergeable
+# summary of the data:
+#
+#   StandardScaler  count, mean and sum of squared deviations per feature
+#   GaussianNB      the same per class, plus the class counts
+#   KNN             the scaled training rows, kept as one KD-tree per shard
+#
+# The training rows are split into shards. Map: worker processes open the
+# feature store (memory-mapped), read only their shard's rows and return its
+# moments. Reduce: the moments are merged pairwise with Chan et al.'s update
+# (exact, no second pass), the scaler and the Naive Bayes parameters are set
+# from the totals (a class's mean and variance after scaling follow from the
+# raw ones), and the workers then scale their shard and build its KD-tree.
+# ShardedKNNClassifier queries every tree and keeps the k closest, which gives
+# the same neighbours as one tree over all rows. No process holds the full
+# training matrix.
+#
+# The decision tree, SVM and MLP have no mergeable fit; with sharding on they
+# are still trained as usual.
+#
+#   echo '{"action": "train", "dataset_path": "big.csv", "shards": 8, "jobs": 4}' | python run_model.py
+#   python sharded_training.py big.csv --shards 8 --jobs 1 2 4
+#
+# The CLI also fits the two models single-process on the full array and
+# reports wall time per worker count and how far the sharded artifacts are
+# from the single-process ones. ML_TRAIN_SHARDS sets the default shard count
+# for `train` (0 or 1 = off).
+import os
+import sys
+import json
+import time
+from functools import reduce
+
+import numpy as np
+
+SHARDABLE = ("knn", "naive_bayes")
+
+
+def shard_indices(train_idx, n_shards):
+    # sorted, so each shard reads the memory-mapped store front to back
+    return [part for part in np.array_split(np.sort(train_idx), max(1, n_shards)) if len(part)]
+
+
+def load_rows(dataset_ref, idx):
+    """Features and labels of the rows idx only; the iris sample without a dataset, as in run_model"""
+    if dataset_ref:
+        from feature_store import FeatureStore
+        store = FeatureStore(dataset_ref)
+        return np.asarray(store.X[idx], dtype=np.float64), store.labels(idx)
+    from sklearn.datasets import load_iris
+    iris = load_iris()
+    return iris.data[idx], iris.target[idx]
+
+
+# ---------------------------------------------------------------
+# moments
+# ---------------------------------------------------------------
+
+def moments(X):
+    """(count, mean, sum of squared deviations) per column"""
+    n = len(X)
+    if n == 0:
+        return 0, np.zeros(X.shape[1]), np.zeros(X.shape[1])
+    mean = X.mean(axis=0)
+    return n, mean, ((X - mean) ** 2).sum(axis=0)
+
+
+def merge_moments(a, b):
+    # Chan, Golub & LeVeque: combine two partitions' moments without revisiting the rows
+    na, ma, sa = a
+    nb, mb, sb = b
+    if na == 0:
+        return b
+    if nb == 0:
+        return a
+    n = na + nb
+    delta = mb - ma
+    return n, ma + delta * (nb / n), sa + sb + delta ** 2 * (na * nb / n)
+
+
+def shard_stats(dataset_ref, idx):
+    """Map step: moments of the shard, overall and per class"""
+    X, y = load_rows(dataset_ref, idx)
+    labels, codes = np.unique(y, return_inverse=True)
+    return {
+        "total": moments(X),
+        "classes": {label: moments(X[codes == k]) for k, label in enumerate(labels.tolist())},
+    }
+
+
+def merge_stats(parts):
+    total = reduce(merge_moments, [p["total"] for p in parts])
+    classes = {}
+    for part in parts:
+        for label, m in part["classes"].items():
+            classes[label] = merge_moments(classes[label], m) if label in classes else m
+    return total, classes
+
+
+# ---------------------------------------------------------------
+# reduce: fitted estimators from the merged moments
+# ---------------------------------------------------------------
+
+def build_scaler(template, total):
+    from sklearn.base import clone
+    if not (template.with_mean and template.with_std):
+        raise ValueError("Sharded training expects a StandardScaler with with_mean and with_std")
+    n, mean, m2 = total
+    var = m2 / n
+    # StandardScaler's test for constant features (variance within rounding error), which get scale 1
+    eps = np.finfo(np.float64).eps
+    constant = var <= n * eps * var + (n * mean * eps) ** 2
+    scale = np.sqrt(var)
+    scale[constant] = 1.0
+    scaler = clone(template)
+    scaler.mean_, scaler.var_, scaler.scale_ = mean, var, scale
+    scaler.n_samples_seen_ = np.int64(n)
+    scaler.n_features_in_ = len(mean)
+    return scaler
+
+
+def build_naive_bayes(template, classes, total, scaler):
+    from sklearn.base import clone
+    labels = np.array(sorted(classes))
+    counts = np.array([classes[c][0] for c in labels.tolist()], dtype=np.float64)
+    # the model sees scaled features: mean (m - mu) / s, variance v / s^2
+    theta = np.array([(classes[c][1] - scaler.mean_) / scaler.scale_ for c in labels.tolist()])
+    var = np.array([classes[c][2] / classes[c][0] / scaler.scale_ ** 2 for c in labels.tolist()])
+    nb = clone(template)
+    # var_smoothing is relative to the largest feature variance of the (scaled) training data
+    nb.epsilon_ = nb.var_smoothing * float(np.max(total[2] / total[0] / scaler.scale_ ** 2))
+    nb.classes_ = labels
+    nb.theta_ = theta
+    nb.var_ = var + nb.epsilon_
+    nb.class_count_ = counts
+    nb.class_prior_ = np.asarray(nb.priors, dtype=np.float64) if nb.priors is not None else counts / counts.sum()
+    nb.n_features_in_ = theta.shape[1]
+    return nb
+
+
+def knn_shard(dataset_ref, idx, mean, scale, leafsize):
+    """Second map step: the shard scaled with the merged statistics, as a KD-tree"""
+    from scipy.spatial import cKDTree
+    X, y = load_rows(dataset_ref, idx)
+    # the same operations as StandardScaler.transform, so the rows are bit-identical
+    X -= mean
+    X /= scale
+    return cKDTree(X, leafsize=leafsize, balanced_tree=False, compact_nodes=False), y
+
+
+def _check_template(name, template):
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.preprocessing import StandardScaler
+    from spatial_knn import SpatialKNNClassifier
+    final = GaussianNB if name == "naive_bayes" else SpatialKNNClassifier
+    steps = getattr(template, "steps", None)
+    if (not steps or len(steps) != 2 or type(steps[0][1]) is not StandardScaler
+            or not isinstance(steps[1][1], final)):
+        raise ValueError(f"Cannot shard '{name}': expected a StandardScaler + {final.__name__} pipeline")
+
+
+def _map(pool, fn, args):
+    if pool is None:
+        return [fn(*a) for a in args]
+    return [f.result() for f in [pool.submit(fn, *a) for a in args]]
+
+
+def fit_sharded(templates, dataset_ref, train_idx, n_shards, jobs=1):
+    """({name: fitted pipeline} for the templates, timings); templates are unfitted scaler pipelines"""
+    from sklearn.pipeline import Pipeline
+    from spatial_knn import ShardedKNNClassifier
+    for name, template in templates.items():
+        _check_template(name, template)
+    started = time.perf_counter()
+    shards = shard_indices(train_idx, n_shards)
+    jobs = max(1, min(jobs, len(shards)))
+    timings = {"shards": len(shards), "jobs": jobs, "rows": int(len(train_idx))}
+
+    pool = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(max_workers=jobs)
+    try:
+        t = time.perf_counter()
+        parts = _map(pool, shard_stats, [(dataset_ref, idx) for idx in shards])
+        timings["map_s"] = round(time.perf_counter() - t, 3)
+
+        t = time.perf_counter()
+        total, classes = merge_stats(parts)
+        scalers = {name: build_scaler(template.steps[0][1], total) for name, template in templates.items()}
+        fitted = {}
+        if "naive_bayes" in templates:
+            (scaler_name, _), (final_name, nb) = templates["naive_bayes"].steps
+            scaler = scalers["naive_bayes"]
+            fitted["naive_bayes"] = Pipeline([(scaler_name, scaler),
+                                              (final_name, build_naive_bayes(nb, classes, total, scaler))])
+        timings["merge_s"] = round(time.perf_counter() - t, 3)
+
+        if "knn" in templates:
+            t = time.perf_counter()
+            (scaler_name, _), (final_name, knn) = templates["knn"].steps
+            scaler = scalers["knn"]
+            built = _map(pool, knn_shard, [(dataset_ref, idx, scaler.mean_, scaler.scale_, knn.leafsize) for idx in shards])
+            model = ShardedKNNClassifier.from_shards([tree for tree, _ in built], [y for _, y in built],
+                                                     np.array(sorted(classes)), knn.n_neighbors, knn.leafsize,
+                                                     knn.eps, knn.n_jobs)
+            fitted["knn"] = Pipeline([(scaler_name, scaler), (final_name, model)])
+            timings["knn_s"] = round(time.perf_counter() - t, 3)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    timings["total_s"] = round(time.perf_counter() - started, 3)
+    return fitted, timings
+
+
+# ---------------------------------------------------------------
+# scaling and equivalence report
+# ---------------------------------------------------------------
+
+def _max_diff(a, b, relative=False):
+    a, b = np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64)
+    diff = np.abs(a - b)
+    if relative:
+        diff = diff / np.maximum(np.abs(b), np.finfo(np.float64).tiny)
+    return float(diff.max())
+
+
+def equivalence(sharded, reference, X_test):
+    """How far the sharded pipelines are from ones fitted on the full array"""
+    out = {}
+    for name, model in sharded.items():
+        ref = reference[name]
+        s_scaler, r_scaler = model.steps[0][1], ref.steps[0][1]
+        report = {
+            "scaler_mean_max_rel_diff": _max_diff(s_scaler.mean_, r_scaler.mean_, relative=True),
+            "scaler_var_max_rel_diff": _max_diff(s_scaler.var_, r_scaler.var_, relative=True),
+            "prediction_agreement": float(np.mean(model.predict(X_test) == ref.predict(X_test))),
+            "proba_max_abs_diff": _max_diff(model.predict_proba(X_test), ref.predict_proba(X_test)),
+        }
+        if name == "naive_bayes":
+            s_nb, r_nb = model.steps[1][1], ref.steps[1][1]
+            report["theta_max_abs_diff"] = _max_diff(s_nb.theta_, r_nb.theta_)
+            report["var_max_rel_diff"] = _max_diff(s_nb.var_, r_nb.var_, relative=True)
+        out[name] = report
+    return out
+
+
+def scaling_report(templates, dataset_ref, train_idx, test_idx, n_shards, jobs_list):
+    from sklearn.base import clone
+    X_test, _ = load_rows(dataset_ref, np.sort(test_idx))
+    t = time.perf_counter()
+    X_train, y_train = load_rows(dataset_ref, train_idx)
+    reference = {name: clone(template).fit(X_train, y_train) for name, template in templates.items()}
+    single_s = time.perf_counter() - t
+    del X_train, y_train
+
+    runs, fitted = [], None
+    for jobs in jobs_list:
+        fitted, timings = fit_sharded(templates, dataset_ref, train_idx, n_shards, jobs)
+        runs.append(timings)
+    base = runs[0]["total_s"]
+    for run in runs:
+        run["speedup"] = round(base / run["total_s"], 2) if run["total_s"] else None
+        run["efficiency"] = round(run["speedup"] / (run["jobs"] / runs[0]["jobs"]), 2) if run["speedup"] else None
+    return {
+        "models": list(templates),
+        "rows": int(len(train_idx)),
+        "cpu_count": os.cpu_count(),
+        "single_process_s": round(single_s, 3),
+        "sharded": runs,
+        "equivalence": equivalence(fitted, reference, X_test),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import warnings
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser(description="Sharded KNN/Naive Bayes training: wall time per worker count and equivalence")
+    parser.add_argument("dataset", nargs="?", default="student_scores.csv", help="CSV or feature store directory")
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--models", nargs="+", choices=SHARDABLE, default=list(SHARDABLE))
+    args = parser.parse_args()
+
+    from sklearn.model_selection import train_test_split
+    from feature_store import build_store, FeatureStore
+    from run_model import build_estimator
+    dataset_ref = str(build_store(args.dataset))
+    y = FeatureStore(dataset_ref).labels()
+    # the split train_and_save uses
+    train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42, stratify=y)
+    templates = {name: build_estimator(name) for name in args.models}
+    print(json.dumps(scaling_report(templates, dataset_ref, train_idx, test_idx, args.shards, args.jobs), indent=2))
+    sys.exit(0)
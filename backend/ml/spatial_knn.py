@@ -0,0 +1,196 @@
+# backend/ml/spatial_knn.py
+# KNN classifier backed by an explicit KD-tree index.
+#
+# The tree (scipy's cKDTree) is built once in fit() and pickled with the
+# estimator, so a loaded artifact answers queries in O(log n) without
+# rebuilding anything. eps > 0 switches to approximate search: every returned
+# neighbour is within (1 + eps) times the distance of the true k-th nearest
+# one, which prunes far more of the tree. eps can be changed on a fitted
+# model with set_params(eps=...).
+#
+#   python spatial_knn.py benchmark --rows 1000000 --queries 2000 --eps 0 0.5 1 2
+import sys
+import json
+import time
+
+import numpy as np
+from sklearn.base import BaseEstimator, ClassifierMixin
+
+
+class SpatialKNNClassifier(ClassifierMixin, BaseEstimator):
+    def __init__(self, n_neighbors=5, leafsize=32, eps=0.0, n_jobs=1):
+        self.n_neighbors = n_neighbors
+        self.leafsize = leafsize
+        self.eps = eps
+        self.n_jobs = n_jobs
+
+    def fit(self, X, y):
+        from scipy.spatial import cKDTree
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        if len(X) < self.n_neighbors:
+            raise ValueError(f"Need at least n_neighbors={self.n_neighbors} samples, got {len(X)}")
+        self.classes_, self._y = np.unique(y, return_inverse=True)
+        self.n_features_in_ = X.shape[1]
+        self.tree_ = cKDTree(X, leafsize=self.leafsize, balanced_tree=False, compact_nodes=False)
+        return self
+
+    def kneighbors(self, X, n_neighbors=None):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but SpatialKNNClassifier is expecting {self.n_features_in_} features as input.")
+        k = n_neighbors or self.n_neighbors
+        dist, idx = self.tree_.query(X, k=k, eps=self.eps, workers=self.n_jobs)
+        if k == 1:
+            dist, idx = dist[:, None], idx[:, None]
+        return dist, idx
+
+    def predict_proba(self, X):
+        _, idx = self.kneighbors(X)
+        votes = self._y[idx]
+        n_classes = len(self.classes_)
+        # one bincount over (row, class) pairs instead of a per-row loop
+        flat = (np.arange(len(votes))[:, None] * n_classes + votes).ravel()
+        counts = np.bincount(flat, minlength=len(votes) * n_classes).reshape(len(votes), n_classes)
+        return counts / votes.shape[1]
+
+    def predict(self, X):
+        # argmax takes the first maximum: ties go to the smallest class label,
+        # as in KNeighborsClassifier
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+class ShardedKNNClassifier(SpatialKNNClassifier):
+    # one KD-tree per training shard (sharded_training.py). Every shard returns
+    # its own k nearest rows and the k closest of those are the k nearest of
+    # the union; indices are global row positions, so predict_proba is shared.
+
+    @classmethod
+    def from_shards(cls, trees, labels, classes, n_neighbors=5, leafsize=32, eps=0.0, n_jobs=1):
+        # labels[i]: the class labels of the rows of trees[i], in tree order
+        model = cls(n_neighbors=n_neighbors, leafsize=leafsize, eps=eps, n_jobs=n_jobs)
+        return model._set_shards(trees, labels, classes)
+
+    def _set_shards(self, trees, labels, classes):
+        self.classes_ = np.asarray(classes)
+        self.trees_ = list(trees)
+        self.offsets_ = np.cumsum([0] + [t.n for t in self.trees_])
+        self._y = np.searchsorted(self.classes_, np.concatenate(labels))
+        self.n_features_in_ = self.trees_[0].m
+        if self.offsets_[-1] < self.n_neighbors:
+            raise ValueError(f"Need at least n_neighbors={self.n_neighbors} samples, got {self.offsets_[-1]}")
+        return self
+
+    def fit(self, X, y, n_shards=1):
+        # in-process refit (e.g. the `update` action); sharded_training.py builds the trees in workers
+        from scipy.spatial import cKDTree
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        parts = [p for p in np.array_split(np.arange(len(X)), max(1, n_shards)) if len(p)]
+        trees = [cKDTree(X[p], leafsize=self.leafsize, balanced_tree=False, compact_nodes=False) for p in parts]
+        return self._set_shards(trees, [y[p] for p in parts], np.unique(y))
+
+    def kneighbors(self, X, n_neighbors=None):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.n_features_in_:
+            raise ValueError(f"X has {X.shape[1]} features, but ShardedKNNClassifier is expecting {self.n_features_in_} features as input.")
+        k = n_neighbors or self.n_neighbors
+        dists, idxs = [], []
+        for tree, offset in zip(self.trees_, self.offsets_):
+            kk = min(k, tree.n)
+            dist, idx = tree.query(X, k=kk, eps=self.eps, workers=self.n_jobs)
+            if kk == 1:
+                dist, idx = dist[:, None], idx[:, None]
+            dists.append(dist)
+            idxs.append(idx + offset)
+        dist, idx = np.hstack(dists), np.hstack(idxs)
+        # stable: equal distances keep shard order, i.e. the lower global index first
+        order = np.argsort(dist, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(dist, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+
+# ---------------------------------------------------------------
+# benchmark: exact brute force vs KD-tree vs approximate KD-tree
+# ---------------------------------------------------------------
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def _single_row_latency(model, Q, n=200):
+    samples = []
+    for row in Q[:n]:
+        t0 = time.perf_counter()
+        model.predict(row.reshape(1, -1))
+        samples.append(time.perf_counter() - t0)
+    samples = np.array(samples) * 1000
+    return {"p50_ms": round(float(np.percentile(samples, 50)), 4), "p99_ms": round(float(np.percentile(samples, 99)), 4)}
+
+
+def benchmark(rows=200_000, queries=2000, eps_values=(0.0, 0.5, 1.0, 2.0), n_neighbors=5, seed=7):
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.preprocessing import StandardScaler
+    from data_generator import generate_chunk
+
+    X, y = generate_chunk(rows, seed)
+    Q, _ = generate_chunk(queries, seed + 1)
+    scaler = StandardScaler().fit(X)
+    X, Q = scaler.transform(X), scaler.transform(Q)
+
+    brute = KNeighborsClassifier(n_neighbors=n_neighbors, algorithm="brute").fit(X, y)
+    exact_pred, brute_s = _timed(brute.predict, Q)
+    _, exact_idx = brute.kneighbors(Q)
+
+    report = {
+        "rows": rows,
+        "queries": queries,
+        "n_neighbors": n_neighbors,
+        "brute": {
+            "batch_ms_per_row": round(brute_s / queries * 1000, 4),
+            **_single_row_latency(brute, Q),
+        },
+        "kd_tree": [],
+    }
+
+    sk_tree = KNeighborsClassifier(n_neighbors=n_neighbors, algorithm="kd_tree").fit(X, y)
+    _, sk_s = _timed(sk_tree.predict, Q)
+    report["sklearn_kd_tree"] = {
+        "batch_ms_per_row": round(sk_s / queries * 1000, 4),
+        **_single_row_latency(sk_tree, Q),
+    }
+
+    model, build_s = _timed(SpatialKNNClassifier(n_neighbors=n_neighbors).fit, X, y)
+    report["build_s"] = round(build_s, 3)
+    for eps in eps_values:
+        model.set_params(eps=eps)
+        pred, query_s = _timed(model.predict, Q)
+        _, idx = model.kneighbors(Q)
+        recall = np.mean([len(set(a) & set(b)) / n_neighbors for a, b in zip(idx, exact_idx)])
+        report["kd_tree"].append({
+            "eps": eps,
+            "batch_ms_per_row": round(query_s / queries * 1000, 4),
+            **_single_row_latency(model, Q),
+            "speedup_vs_brute": round(brute_s / query_s, 2) if query_s else None,
+            "prediction_agreement": round(float(np.mean(pred == exact_pred)), 4),
+            "neighbor_recall": round(float(recall), 4),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="KD-tree KNN benchmark")
+    parser.add_argument("command", choices=["benchmark"])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--eps", type=float, nargs="+", default=[0.0, 0.5, 1.0, 2.0])
+    parser.add_argument("--neighbors", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(benchmark(args.rows, args.queries, args.eps, args.neighbors), indent=2))
+    sys.exit(0)
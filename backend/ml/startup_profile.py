@@ -0,0 +1,132 @@
+# backend/ml/startup_profile.py
+# Cold-start profiling for the ML entry points.
+#
+#   python run_model.py status --startup-report          # per-module import times for one run
+#   echo '{...}' | python run_model.py --startup-report   # same, request read from stdin
+#   python startup_profile.py check [--budget-ms 2500] [--runs 5]
+#
+# The report re-runs the command in a fresh interpreter under `-X importtime`
+# and folds the per-module lines into top-level packages. `check` times a cold
+# single-model `predict` end to end and exits non-zero when the median goes
+# over the budget (ML_STARTUP_BUDGET_MS, default 2500 ms), so it can run as a
+# regression gate.
+import os
+import sys
+import json
+import time
+import subprocess
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+DEFAULT_BUDGET_MS = 2500
+CHECK_REQUEST = {"action": "predict", "model": "knn", "features": [75, 72, 70, 1200, 3]}
+
+
+def parse_importtime(stderr):
+    """(module, depth, self_us, cumulative_us) for every `-X importtime` line"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # one space before a top-level import, two more per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def startup_report(argv, stdin_data=None, top=15):
+    cmd = [sys.executable, "-X", "importtime", *argv]
+    started = time.perf_counter()
+    proc = subprocess.run(cmd, input=stdin_data or "", capture_output=True, text=True, cwd=ML_DIR)
+    wall_ms = (time.perf_counter() - started) * 1000
+    modules = parse_importtime(proc.stderr)
+
+    # self time summed per top-level package is exact; cumulative times of
+    # top-level imports show which import statement pulled the cost in
+    packages = {}
+    for name, _, self_us, _ in modules:
+        entry = packages.setdefault(name.split(".")[0], [0, 0])
+        entry[0] += self_us
+        entry[1] += 1
+    ranked = sorted(packages.items(), key=lambda kv: kv[1][0], reverse=True)
+    roots = sorted((m for m in modules if m[1] == 0), key=lambda m: m[3], reverse=True)
+
+    return {
+        "command": argv,
+        "wall_ms": round(wall_ms, 1),
+        "import_ms": round(sum(m[3] for m in modules if m[1] == 0) / 1000, 1),
+        "modules_imported": len(modules),
+        "packages": [
+            {"package": name, "self_ms": round(us / 1000, 1), "modules": count}
+            for name, (us, count) in ranked[:top]
+        ],
+        "slowest_imports": [
+            {"module": name, "cumulative_ms": round(cum / 1000, 1)}
+            for name, _, _, cum in roots[:top]
+        ],
+        "exit_code": proc.returncode,
+        "output": proc.stdout.strip()[-2000:],
+    }
+
+
+def check_request():
+    """CHECK_REQUEST with as many features as the served knn artifact takes"""
+    # loaded here, outside the timed runs; the artifacts committed with the
+    # repository predate time_spent/confidence and take 4 features
+    try:
+        from run_model import load_model
+        width = getattr(load_model("knn"), "n_features_in_", None)
+    except Exception:
+        # no artifact: the timed run reports the error
+        width = None
+    features = CHECK_REQUEST["features"]
+    if width:
+        features = (features + [0] * width)[:width]
+    return {**CHECK_REQUEST, "features": features}
+
+
+def check_budget(budget_ms=None, runs=5, script="run_model.py", request=None):
+    if budget_ms is None:
+        budget_ms = float(os.environ.get("ML_STARTUP_BUDGET_MS", DEFAULT_BUDGET_MS))
+    payload = json.dumps(request or check_request())
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.run([sys.executable, script], input=payload, capture_output=True, text=True, cwd=ML_DIR)
+        timings.append((time.perf_counter() - started) * 1000)
+        try:
+            ok = proc.returncode == 0 and json.loads(proc.stdout).get("success")
+        except ValueError:
+            ok = False
+        if not ok:
+            return {"success": False, "error": "predict failed during startup check",
+                    "stdout": proc.stdout[-500:], "stderr": proc.stderr[-500:]}
+    timings.sort()
+    median = timings[len(timings) // 2]
+    return {
+        "success": True,
+        "within_budget": median <= budget_ms,
+        "budget_ms": budget_ms,
+        "median_ms": round(median, 1),
+        "min_ms": round(timings[0], 1),
+        "max_ms": round(timings[-1], 1),
+        "runs": runs,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Cold-start checks for the ML entry points")
+    parser.add_argument("command", choices=["check", "report"])
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("args", nargs="*", help="arguments for run_model.py (report)")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        print(json.dumps(startup_report(["run_model.py", *args.args]), indent=2))
+    else:
+        result = check_budget(args.budget_ms, args.runs)
+        print(json.dumps(result, indent=2))
+        sys.exit(0 if result.get("within_budget") else 1)
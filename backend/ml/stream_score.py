@@ -0,0 +1,143 @@
+# backend/ml/stream_score.py
+# Chunked cohort scoring: reads a CSV/JSONL export a fixed number of rows at a
+# time, predicts each chunk with one vectorized call and appends the results to
+# the output file, so memory use depends on the chunk size, not the file size.
+#
+# The input is a features export (the five FEATURE_NAMES columns per row). With
+# --attempts it is a raw QuizAttempt export instead: feature_engineering.py folds
+# it into per-student features chunk by chunk, and those are scored per student.
+#
+# Usage:
+#   python stream_score.py features.csv scores.csv [--model knn] [--chunk-size 50000]
+#   python stream_score.py attempts.jsonl scores.csv --attempts [--model knn]
+#   echo '{"action": "score", "input_path": "...", "output_path": "...", "attempts": true}' | python run_model.py
+import sys
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from batch_io import FEATURE_NAMES, infer_format
+
+
+def iter_chunks(path, fmt, chunk_size):
+    import pandas as pd
+    if fmt == "csv":
+        return pd.read_csv(path, chunksize=chunk_size)
+    if fmt == "jsonl":
+        return pd.read_json(path, lines=True, chunksize=chunk_size)
+    raise ValueError("Streaming input must be CSV or JSONL")
+
+
+def attempt_feature_chunks(path, fmt, chunk_size):
+    """Per-student feature frames of a raw QuizAttempt export, chunk_size students at a time"""
+    from feature_engineering import read_window, compute_features
+    window_frame, _, _ = read_window(path, chunk_size, fmt)
+    features = compute_features(window_frame)
+    for start in range(0, len(features), chunk_size):
+        yield features.iloc[start:start + chunk_size]
+
+
+def chunk_features(chunk, feature_names):
+    missing = [c for c in feature_names if c not in chunk.columns]
+    if missing:
+        hint = "; for a raw QuizAttempt export use --attempts" if "student" in chunk.columns else ""
+        raise ValueError(f"Input is missing feature columns: {', '.join(missing)}{hint}")
+    import pandas as pd
+    X = chunk[feature_names].apply(pd.to_numeric, errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(X).all(axis=1)
+    return X, valid
+
+
+def _write_chunk(out, fmt, chunk, labels, proba, valid, classes, first, id_columns):
+    import pandas as pd
+    frame = chunk[id_columns].reset_index(drop=True) if id_columns else pd.DataFrame()
+    frame["prediction"] = labels
+    if proba is not None:
+        frame["confidence"] = proba.max(axis=1).round(4)
+        for k, c in enumerate(classes):
+            frame[f"p_{c}"] = proba[:, k].round(4)
+    frame["error"] = np.where(valid, "", "invalid or missing feature values")
+    if fmt == "csv":
+        frame.to_csv(out, header=first, index=False)
+    else:
+        frame.to_json(out, orient="records", lines=True)
+
+
+def score_stream(model, input_path, output_path, chunk_size=50000, fmt=None, out_fmt=None,
+                 feature_names=None, id_columns=None, progress=None, attempts=False):
+    feature_names = feature_names or FEATURE_NAMES
+    fmt = fmt or infer_format(input_path)
+    out_fmt = out_fmt or infer_format(output_path)
+    if out_fmt not in ("csv", "jsonl"):
+        raise ValueError("Streaming output must be CSV or JSONL")
+    classes = getattr(model, "classes_", None)
+    has_proba = hasattr(model, "predict_proba")
+
+    if attempts:
+        id_columns = id_columns or ["student"]
+
+    rows = scored = chunks = 0
+    started = time.perf_counter()
+    tmp_path = Path(str(output_path) + ".part")
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as out:
+            source = attempt_feature_chunks if attempts else iter_chunks
+            for chunk in source(input_path, fmt, chunk_size):
+                X, valid = chunk_features(chunk, feature_names)
+                n = len(chunk)
+                labels = np.full(n, None, dtype=object)
+                proba = np.full((n, len(classes)), np.nan) if has_proba and classes is not None else None
+                if valid.any():
+                    Xv = X[valid]
+                    labels[valid] = model.predict(Xv)
+                    if proba is not None:
+                        proba[valid] = model.predict_proba(Xv)
+                _write_chunk(out, out_fmt, chunk, labels, proba, valid, classes,
+                             chunks == 0, [c for c in (id_columns or []) if c in chunk.columns])
+                rows += n
+                scored += int(valid.sum())
+                chunks += 1
+                if progress:
+                    elapsed = time.perf_counter() - started
+                    progress({"chunks": chunks, "rows": rows, "rows_per_s": round(rows / elapsed, 1) if elapsed else None})
+        tmp_path.replace(output_path)
+    except BaseException:
+        # a failed or interrupted run leaves no partial output behind
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": rows,
+        "scored": scored,
+        "invalid": rows - scored,
+        "chunks": chunks,
+        "chunk_size": chunk_size,
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows / elapsed, 1) if elapsed else None,
+        "output_path": str(output_path),
+    }
+
+
+def print_progress(info):
+    print(f"[score] chunk {info['chunks']}: {info['rows']} rows ({info['rows_per_s']} rows/s)", file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Stream-score a CSV/JSONL export")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path")
+    parser.add_argument("--model", default="knn")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--id-column", action="append", dest="id_columns")
+    parser.add_argument("--attempts", action="store_true", help="input is a raw QuizAttempt export")
+    args = parser.parse_args()
+
+    from run_model import load_model
+    summary = score_stream(load_model(args.model), args.input_path, args.output_path,
+                           chunk_size=args.chunk_size, id_columns=args.id_columns, progress=print_progress,
+                           attempts=args.attempts)
+    print(json.dumps({"success": True, "model": args.model, **summary}))
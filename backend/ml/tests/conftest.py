@@ -0,0 +1,11 @@
+# backend/ml/tests/conftest.py
+# The ML modules are flat scripts that import each other by name, as they do
+# when run from backend/ml; put that directory on the path.
+#
+#   python -m pytest -q backend/ml/tests
+import sys
+from pathlib import Path
+
+ML_DIR = Path(__file__).resolve().parent.parent
+if str(ML_DIR) not in sys.path:
+    sys.path.insert(0, str(ML_DIR))
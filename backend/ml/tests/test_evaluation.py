@@ -0,0 +1,79 @@
+# backend/ml/tests/test_evaluation.py
+# evaluation.py replaces sklearn's metric functions with one confusion matrix;
+# its numbers must stay those of sklearn (zero_division=0).
+import numpy as np
+import pytest
+from sklearn import metrics as skm
+
+import evaluation
+
+
+def predictions(seed, n=500, labels=("average", "strong", "weak")):
+    rng = np.random.default_rng(seed)
+    y_true = rng.choice(labels, size=n, p=[0.5, 0.3, 0.2])
+    # mostly right, and "weak" is never predicted: its precision is 0/0
+    y_pred = np.where(rng.random(n) < 0.7, y_true, rng.choice(labels[:2], size=n))
+    y_pred[y_pred == "weak"] = "average"
+    return y_true, y_pred
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_evaluate_matches_sklearn(seed):
+    y_true, y_pred = predictions(seed)
+    got = evaluation.evaluate(y_true, y_pred)
+
+    labels = np.unique(np.concatenate([y_true, y_pred]))
+    assert got["labels"] == labels.tolist()
+    assert got["confusion_matrix"] == skm.confusion_matrix(y_true, y_pred, labels=labels).tolist()
+    assert got["accuracy"] == pytest.approx(skm.accuracy_score(y_true, y_pred))
+    for avg in ("macro", "weighted"):
+        p, r, f, _ = skm.precision_recall_fscore_support(y_true, y_pred, average=avg, zero_division=0)
+        assert got[f"precision_{avg}"] == pytest.approx(p)
+        assert got[f"recall_{avg}"] == pytest.approx(r)
+        assert got[f"f1_{avg}"] == pytest.approx(f)
+
+    expected = skm.classification_report(y_true, y_pred, output_dict=True, zero_division=0)
+    assert got["classification_report"].keys() == expected.keys()
+    for key, value in expected.items():
+        assert got["classification_report"][key] == pytest.approx(value), key
+
+
+def test_integer_labels_and_explicit_label_set():
+    y_true = np.array([0, 1, 2, 2, 1, 0, 2])
+    y_pred = np.array([0, 2, 2, 2, 1, 0, 1])
+    got = evaluation.evaluate(y_true, y_pred, labels=[0, 1, 2, 3])
+    assert got["confusion_matrix"] == skm.confusion_matrix(y_true, y_pred, labels=[0, 1, 2, 3]).tolist()
+    p, r, f, _ = skm.precision_recall_fscore_support(y_true, y_pred, labels=[0, 1, 2, 3], average="macro",
+                                                     zero_division=0)
+    assert (got["precision_macro"], got["recall_macro"], got["f1_macro"]) == pytest.approx((p, r, f))
+
+
+def test_bootstrap_joint_pass_matches_per_model(monkeypatch):
+    y_true, a = predictions(4)
+    _, b = predictions(5)
+    labels, t, codes = evaluation.encode(y_true, a, b)
+    joint = evaluation.bootstrap_confusions(t, codes, len(labels), n_resamples=50, seed=9)
+    # a code space too large for the joint pass: each model counted on its own
+    monkeypatch.setattr(evaluation, "JOINT_CELLS", 0)
+    separate = evaluation.bootstrap_confusions(t, codes, len(labels), n_resamples=50, seed=9, chunk_elements=7 * len(t))
+    for j, s in zip(joint, separate):
+        np.testing.assert_array_equal(j, s)
+
+    # every resample is a full-size draw, and resample 0 matches sklearn
+    assert (joint[0].sum(axis=(1, 2)) == len(t)).all()
+    rng = np.random.default_rng(9)
+    idx = rng.integers(0, len(t), size=(50, len(t)), dtype=np.int32)[0]
+    expected = skm.confusion_matrix(t[idx], codes[0][idx], labels=range(len(labels)))
+    np.testing.assert_array_equal(joint[0][0], expected)
+
+
+def test_compare_point_estimates_and_ties():
+    y_true, a = predictions(6)
+    out = evaluation.compare(y_true, {"A": a, "B": a.copy()}, n_resamples=200, seed=1)
+    assert out["models"]["A"]["accuracy"]["value"] == pytest.approx(skm.accuracy_score(y_true, a))
+    # identical predictions: zero difference, never significant, the win is shared
+    pair = out["pairwise"][0]
+    assert pair["difference"] == 0 and pair["low"] == 0 and pair["high"] == 0 and not pair["significant"]
+    assert out["p_best"]["accuracy"] == {"A": 0.5, "B": 0.5}
+    low, high = out["models"]["A"]["accuracy"]["low"], out["models"]["A"]["accuracy"]["high"]
+    assert low <= out["models"]["A"]["accuracy"]["value"] <= high
@@ -0,0 +1,97 @@
+# backend/ml/tests/test_feature_engineering.py
+# compute_features must give the features GET /api/ml/my-prediction
+# (routes/mlRoutes.js) computes for each student, JS `||` fallbacks included.
+import math
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import feature_engineering as fe
+
+
+def route_features(attempts):
+    """The route's inputData for one student's attempts, newest first (Python `or` is JS `||` on numbers)"""
+    attempts = attempts[:3]
+    scores = [a["score"] for a in attempts]
+    avg = sum(scores) / len(scores)
+
+    def at(i):
+        return scores[i] if i < len(scores) else None
+
+    return {
+        "quiz1": at(0) or avg,
+        "quiz2": at(1) or (at(1) if len(scores) > 1 else avg),
+        "quiz3": at(2) or (at(2) if len(scores) > 2 else avg),
+        "time_spent": sum(a.get("timeSpent") or 0 for a in attempts) / len(attempts) or 1200,
+        "confidence": sum(a.get("confidenceLevel") or 3 for a in attempts) / len(attempts) or 3,
+    }
+
+
+def make_export(n_students=60, seed=7):
+    """(export frame as mongoexport would give it, {student: attempts newest first})"""
+    rng = random.Random(seed)
+    rows, by_student = [], {}
+    base = pd.Timestamp("2026-01-01", tz="UTC")
+    for s in range(n_students):
+        student = f"{s:024x}"
+        minutes = rng.sample(range(100_000), rng.randint(1, 5))
+        attempts = []
+        for i, minute in enumerate(minutes):
+            attempt = {"student": student, "_id": f"{s:012x}{i:012x}",
+                       "createdAt": (base + pd.Timedelta(minutes=minute)).isoformat(),
+                       "score": rng.choice([0, 0, rng.randint(1, 100), rng.uniform(0, 100)])}
+            # missing, 0 and real values for both fallbacks
+            spent = rng.choice([None, 0, rng.randint(60, 3000)])
+            confidence = rng.choice([None, 0, rng.randint(1, 5)])
+            if spent is not None:
+                attempt["timeSpent"] = spent
+            if confidence is not None:
+                attempt["confidenceLevel"] = confidence
+            attempts.append(attempt)
+        rows.extend(attempts)
+        by_student[student] = sorted(attempts, key=lambda a: a["createdAt"], reverse=True)
+    rng.shuffle(rows)
+    return pd.DataFrame(rows), by_student
+
+
+def test_matches_route():
+    export, by_student = make_export()
+    features = fe.compute_features(fe.latest_attempts(fe.normalize(export))).set_index("student")
+    assert len(features) == len(by_student)
+    for student, attempts in by_student.items():
+        row = features.loc[student]
+        expected = route_features(attempts)
+        for name, value in expected.items():
+            assert math.isclose(row[name], value, rel_tol=1e-12), (student, name)
+        assert row["attempts"] == min(3, len(attempts))
+        assert row["last_attempt"] == pd.Timestamp(attempts[0]["createdAt"]).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+def test_chunked_read_matches_one_pass(tmp_path, chunk_size):
+    export, _ = make_export(n_students=25, seed=3)
+    path = tmp_path / "attempts.jsonl"
+    export.to_json(path, orient="records", lines=True)
+    window, rows, touched = fe.read_window(path, chunk_size=chunk_size)
+    assert rows == len(export)
+    assert set(touched) == set(export["student"])
+
+    chunked = fe.compute_features(window).sort_values("student").reset_index(drop=True)
+    whole = fe.compute_features(fe.latest_attempts(fe.normalize(export))).sort_values("student").reset_index(drop=True)
+    pd.testing.assert_frame_equal(chunked, whole)
+
+
+def test_extended_json_export(tmp_path):
+    path = tmp_path / "attempts.jsonl"
+    path.write_text(
+        '{"_id": {"$oid": "a1"}, "student": {"$oid": "s1"}, "createdAt": {"$date": "2026-02-01T10:00:00Z"}, "score": 80}\n'
+        '{"_id": {"$oid": "a2"}, "student": {"$oid": "s1"}, "createdAt": {"$date": {"$numberLong": "1769940000000"}}, "score": 0}\n')
+    window, _, _ = fe.read_window(path)
+    row = fe.compute_features(window).iloc[0]
+    assert row["student"] == "s1"
+    # 1769940000000 ms is 2026-02-01T10:00:00Z too; the tie goes to the larger _id, the 0 score
+    expected = route_features([{"score": 0}, {"score": 80}])
+    assert [row["quiz1"], row["quiz2"], row["quiz3"]] == [expected["quiz1"], expected["quiz2"], expected["quiz3"]]
+    assert np.isclose(row["time_spent"], 1200) and np.isclose(row["confidence"], 3)
@@ -0,0 +1,111 @@
+# backend/ml/tests/test_model_registry.py
+# A cached single-row prediction must not cost a hash of the model file, also
+# when ML_MMAP_MODELS=1 serves the mmap copy instead of the artifact itself,
+# and neither must checking that a lookup table is still fresh.
+import json
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.naive_bayes import GaussianNB
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+import lookup_table
+import model_registry
+import run_model
+from mmap_artifacts import export_artifact, load_artifact
+from prediction_cache import PredictionCache
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """Paths hashed with file_sha256, in order"""
+    seen = []
+    real = model_registry.file_sha256
+
+    def counting(path, *args, **kwargs):
+        seen.append(str(path))
+        return real(path, *args, **kwargs)
+    monkeypatch.setattr(model_registry, "file_sha256", counting)
+    return seen
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(60, 5))
+    y = np.where(X[:, 0] > 0, "strong", "weak")
+    model = Pipeline([("scaler", StandardScaler()), ("nb", GaussianNB())]).fit(X, y)
+    joblib.dump(model, tmp_path / "naive_bayes.joblib")
+    export_artifact(tmp_path / "naive_bayes.joblib")
+    monkeypatch.setenv("ML_MMAP_MODELS", "1")
+    monkeypatch.setattr(run_model, "ACTIVE_DIR", tmp_path)
+    monkeypatch.setattr(run_model, "REGISTRY", model_registry.ModelRegistry(loader=load_artifact))
+    monkeypatch.setattr(run_model, "PREDICTIONS", PredictionCache(max_entries=16, ttl_s=60))
+    return tmp_path
+
+
+def test_second_predict_does_not_rehash(served, hashes):
+    row = [0.5, 0.1, -0.2, 0.3, 0.0]
+    first = run_model.predict_with_model("naive_bayes", row)
+    assert not first.get("cached")
+    # the source once (cache key) and the mmap copy once (load)
+    assert sorted(hashes) == sorted([str(served / "naive_bayes.joblib"), str(served / "mmap" / "naive_bayes.joblib")])
+    assert run_model.REGISTRY.loaded() == ["naive_bayes"]
+
+    hashed = len(hashes)
+    assert run_model.predict_with_model("naive_bayes", row)["cached"]
+    run_model.predict_with_model("naive_bayes", [-1.0, 0.0, 0.0, 0.0, 0.0])
+    assert len(hashes) == hashed
+
+
+def test_replaced_artifact_is_hashed_again(served, hashes):
+    run_model.predict_with_model("naive_bayes", [0.5, 0.1, -0.2, 0.3, 0.0])
+    source = served / "naive_bayes.joblib"
+    before = run_model.REGISTRY.digest(source)
+    hashed = len(hashes)
+    # a retrain replaces the file by rename: new inode, new hash
+    tmp = source.with_name(".naive_bayes.tmp")
+    tmp.write_bytes(source.read_bytes() + b"\0")
+    tmp.replace(source)
+    assert run_model.REGISTRY.digest(source) != before
+    assert len(hashes) == hashed + 1
+
+
+@pytest.fixture
+def compiled(served, monkeypatch):
+    """A lookup table of the served model, compiled on a coarse grid"""
+    source = served / "naive_bayes.joblib"
+    grid = lookup_table.make_grid(quiz_step=50, time_step=1050)
+    labels, proba, classes = lookup_table.compile_model(joblib.load(source), grid)
+    target = served / "lut" / "naive_bayes"
+    target.mkdir(parents=True)
+    np.save(target / "labels.npy", labels)
+    np.save(target / "proba.npy", proba)
+    (target / "meta.json").write_text(json.dumps({
+        "model": "naive_bayes", "grid": [list(g) for g in grid], "shape": list(lookup_table.grid_shape(grid)),
+        "classes": classes.tolist(), "source_sha256": model_registry.file_sha256(source)}))
+    monkeypatch.setattr(run_model, "MODELS_DIR", served)
+    monkeypatch.setattr(run_model, "TABLES", model_registry.ModelRegistry(loader=run_model._open_table))
+    monkeypatch.setattr(lookup_table, "LUT_DIR", served / "lut")
+    monkeypatch.setattr(lookup_table, "artifact_path", lambda name: served / f"{name}.joblib")
+    monkeypatch.setattr(lookup_table, "_DIGESTS", model_registry.DigestCache())
+    return target
+
+
+def test_compiled_lookup_does_not_rehash_the_source(compiled, hashes):
+    table, served_by = run_model.resolve_model("naive_bayes", compiled=True)
+    assert served_by == "lookup_table"
+    # only the table is served: the joblib is never loaded, yet hashed once
+    assert run_model.REGISTRY.loaded() == []
+    hashed = len(hashes)
+    for _ in range(3):
+        assert run_model.resolve_model("naive_bayes", compiled=True)[0] is table
+    assert len(hashes) == hashed
+
+
+def test_fresh_table_hashes_the_source_once(compiled, hashes):
+    assert lookup_table.fresh_table("naive_bayes") == compiled
+    assert lookup_table.fresh_table("naive_bayes") == compiled
+    assert hashes == [str(compiled.parent.parent / "naive_bayes.joblib")]
@@ -0,0 +1,46 @@
+# backend/ml/tests/test_prediction_cache.py
+# The SQLite cache evicts the least recently used entry, hits included, even
+# though get() itself only reads.
+import json
+import sqlite3
+import time
+
+from prediction_cache import SqlitePredictionCache
+
+
+def fill(cache, *keys):
+    for key in keys:
+        cache.put("knn", "v1", None, (key,), {"predictions": [key]})
+        # distinct `used` times
+        time.sleep(0.002)
+
+
+def cached_keys(path):
+    with sqlite3.connect(path) as db:
+        return sorted(json.loads(key)[3][0] for (key,) in db.execute("SELECT key FROM entries"))
+
+
+def test_hit_protects_an_entry_from_eviction(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = SqlitePredictionCache(path, max_entries=2, ttl_s=0)
+    fill(cache, "a", "b")
+    assert cache.get("knn", "v1", None, ("a",)) == {"predictions": ["a"]}
+    time.sleep(0.002)
+    fill(cache, "c")
+    # FIFO would have dropped "a"
+    assert cached_keys(path) == ["a", "c"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hits_of_a_read_only_process_are_flushed(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    writer = SqlitePredictionCache(path, max_entries=2, ttl_s=0)
+    fill(writer, "a", "b")
+    # a predict_knn.py run that only hit: its use of "a" is written by flush()
+    reader = SqlitePredictionCache(path, max_entries=2, ttl_s=0)
+    assert reader.get("knn", "v1", None, ("a",)) is not None
+    reader.flush()
+    time.sleep(0.002)
+    fill(writer, "c")
+    assert cached_keys(path) == ["a", "c"]
+    assert writer.stats()["hits"] == 1
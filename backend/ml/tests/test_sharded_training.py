@@ -0,0 +1,83 @@
+# backend/ml/tests/test_sharded_training.py
+# Sharded KNN / Naive Bayes must be the models one process would fit on all
+# the training rows: same scaler, same class statistics, same neighbours.
+from functools import reduce
+from pathlib import Path
+
+import numpy as np
+import pytest
+from sklearn.base import clone
+from sklearn.model_selection import train_test_split
+
+import sharded_training as st
+from feature_store import FeatureStore, build_store
+from run_model import default_estimator
+
+DATA = Path(st.__file__).parent / "student_scores.csv"
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    return str(build_store(DATA, store_dir=tmp_path_factory.mktemp("stores")))
+
+
+def split(n, seed=42):
+    return train_test_split(np.arange(n), test_size=0.2, random_state=seed)
+
+
+def fit_both(dataset_ref, n_rows, n_shards, jobs=1):
+    train_idx, test_idx = split(n_rows)
+    templates = {name: default_estimator(name) for name in st.SHARDABLE}
+    sharded, timings = st.fit_sharded(templates, dataset_ref, train_idx, n_shards, jobs)
+    X_train, y_train = st.load_rows(dataset_ref, train_idx)
+    reference = {name: clone(t).fit(X_train, y_train) for name, t in templates.items()}
+    X_test, _ = st.load_rows(dataset_ref, np.sort(test_idx))
+    return sharded, reference, X_test, timings
+
+
+@pytest.mark.parametrize("n_shards, jobs", [(1, 1), (3, 1), (8, 1), (3, 2)])
+def test_sharded_matches_single_process(store, n_shards, jobs):
+    sharded, reference, X_test, timings = fit_both(store, len(FeatureStore(store)), n_shards, jobs)
+    assert timings["shards"] == n_shards
+    report = st.equivalence(sharded, reference, X_test)
+    for name in st.SHARDABLE:
+        assert report[name]["prediction_agreement"] == 1.0, name
+        assert report[name]["scaler_mean_max_rel_diff"] < 1e-12
+        assert report[name]["scaler_var_max_rel_diff"] < 1e-9
+        assert report[name]["proba_max_abs_diff"] < 1e-9
+    assert report["naive_bayes"]["theta_max_abs_diff"] < 1e-9
+    assert report["naive_bayes"]["var_max_rel_diff"] < 1e-6
+
+    # the KNN's neighbours themselves, not only the votes
+    s_scaler, s_knn = sharded["knn"].steps[0][1], sharded["knn"].steps[1][1]
+    r_scaler, r_knn = reference["knn"].steps[0][1], reference["knn"].steps[1][1]
+    s_dist, _ = s_knn.kneighbors(s_scaler.transform(X_test))
+    r_dist, _ = r_knn.kneighbors(r_scaler.transform(X_test))
+    np.testing.assert_allclose(s_dist, r_dist, rtol=1e-9, atol=1e-12)
+
+
+def test_merge_moments_is_exact():
+    rng = np.random.default_rng(0)
+    X = rng.normal(50, 20, size=(1000, 4))
+    parts = [st.moments(part) for part in np.array_split(X, [10, 11, 400, 999])]
+    total = reduce(st.merge_moments, parts)
+    whole = st.moments(X)
+    for got, expected in zip(total, whole):
+        np.testing.assert_allclose(got, expected, rtol=1e-10)
+
+
+def test_iris_without_dataset():
+    # no dataset_ref: the iris sample, as run_model trains without a dataset
+    sharded, reference, X_test, _ = fit_both(None, 150, 4)
+    report = st.equivalence(sharded, reference, X_test)
+    assert all(r["prediction_agreement"] == 1.0 for r in report.values())
+
+
+def test_shard_indices_cover_the_training_rows():
+    train_idx = np.random.default_rng(1).permutation(103)[:90]
+    shards = st.shard_indices(train_idx, 7)
+    assert len(shards) == 7
+    assert all((np.diff(s) > 0).all() for s in shards)
+    np.testing.assert_array_equal(np.sort(np.concatenate(shards)), np.sort(train_idx))
+    # more shards than rows: no empty shards
+    assert len(st.shard_indices(train_idx[:3], 10)) == 3
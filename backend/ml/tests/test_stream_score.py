@@ -0,0 +1,63 @@
+# backend/ml/tests/test_stream_score.py
+# Scoring a raw QuizAttempt export with attempts=True must match building the
+# features with feature_engineering.py first and scoring those.
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.naive_bayes import GaussianNB
+
+import feature_engineering as fe
+import run_model
+from batch_io import FEATURE_NAMES
+from stream_score import score_stream
+
+
+@pytest.fixture
+def model():
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.uniform(0, 100, (300, 3)), rng.uniform(300, 2400, 300), rng.integers(1, 6, 300)])
+    return GaussianNB().fit(X, np.where(X[:, :3].mean(axis=1) > 50, "pass", "fail"))
+
+
+@pytest.fixture
+def export(tmp_path):
+    rng = np.random.default_rng(1)
+    path = tmp_path / "attempts.jsonl"
+    with open(path, "w") as f:
+        for i in range(40):
+            f.write(json.dumps({"_id": {"$oid": f"a{i:03d}"}, "student": {"$oid": f"s{i % 7}"},
+                                "createdAt": {"$date": f"2026-02-{1 + i // 7:02d}T10:00:00Z"},
+                                "score": float(rng.integers(0, 101))}) + "\n")
+    return path
+
+
+def test_attempts_mode_matches_featurized_input(tmp_path, model, export):
+    features = tmp_path / "features.csv"
+    fe.build_features(export, features, chunk_size=9)
+    featurized = score_stream(model, features, tmp_path / "a.csv", chunk_size=3, id_columns=["student"])
+    raw = score_stream(model, export, tmp_path / "b.csv", chunk_size=3, attempts=True)
+
+    assert raw["rows"] == featurized["rows"] == 7 and raw["chunks"] == 3
+    a = pd.read_csv(tmp_path / "a.csv").sort_values("student").reset_index(drop=True)
+    b = pd.read_csv(tmp_path / "b.csv").sort_values("student").reset_index(drop=True)
+    pd.testing.assert_frame_equal(a, b)
+    expected = fe.compute_features(fe.read_window(export)[0]).sort_values("student")
+    assert b["prediction"].tolist() == model.predict(expected[FEATURE_NAMES].to_numpy(dtype=float)).tolist()
+
+
+def test_raw_export_without_attempts_mode_is_rejected(tmp_path, model, export):
+    csv = tmp_path / "attempts.csv"
+    pd.read_json(export, lines=True).assign(student=lambda d: d["student"].map(str)).to_csv(csv, index=False)
+    with pytest.raises(ValueError, match="--attempts"):
+        score_stream(model, csv, tmp_path / "out.csv")
+    assert not (tmp_path / "out.csv.part").exists()
+
+
+def test_score_action_defaults_to_serving_model(tmp_path, model, export, monkeypatch):
+    monkeypatch.setattr(run_model, "serving_model", lambda: "naive_bayes")
+    monkeypatch.setattr(run_model, "load_model", {"naive_bayes": model}.__getitem__)
+    out = run_model.handle_request({"action": "score", "input_path": str(export),
+                                    "output_path": str(tmp_path / "out.csv"), "attempts": True})
+    assert out["success"] and out["model"] == "naive_bayes" and out["rows"] == 7
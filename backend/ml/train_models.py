@@ -1,136 +1,205 @@
+import os
+import sys
+import time
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.naive_bayes import GaussianNB
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.svm import SVC
-from sklearn.neural_network import MLPClassifier
-from sklearn.metrics import accuracy_score, precision_recall_fscore_support, classification_report, confusion_matrix
-import joblib
 import json
+from evaluation import compare, evaluate
+from feature_store import open_store
+from mmap_artifacts import atomic_dump, export_artifact, mmap_enabled
+from profiling import profile_results, select_from_results
 import warnings
 warnings.filterwarnings('ignore')
 
-print("=" * 80)
-print("ML MODEL TRAINING AND COMPARISON")
-print("=" * 80)
+# (title, result name, artifact) in report order
+MODELS = [
+    ("1. K-NEAREST NEIGHBORS (KNN)", "KNN", "knn_model.pkl"),
+    ("2. NAIVE BAYES CLASSIFIER", "Naive Bayes", "naive_bayes_model.pkl"),
+    ("3. DECISION TREE", "Decision Tree", "decision_tree_model.pkl"),
+    ("4. SUPPORT VECTOR MACHINE (SVM)", "SVM", "svm_model.pkl"),
+    ("5. BACKPROPAGATION NEURAL NETWORK", "Neural Network", "neural_network_model.pkl"),
+]
 
-# Load dataset
-print("\n[*] Loading dataset...")
-data = pd.read_csv("student_scores.csv")
-print(f"Dataset shape: {data.shape}")
-print(f"\nPerformance distribution:")
-print(data['performance'].value_counts())
 
-# Prepare features and target
-X = data.drop("performance", axis=1)
-y = data["performance"]
+# result name -> run_model.py estimator name
+ESTIMATORS = {
+    "KNN": "knn",
+    "Naive Bayes": "naive_bayes",
+    "Decision Tree": "decision_tree",
+    "SVM": "svm",
+    "Neural Network": "neural_network",
+}
 
-# Split dataset
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-print(f"\nTraining samples: {len(X_train)}")
-print(f"Test samples: {len(X_test)}")
 
-# Store results for comparison
-results = []
+def build_model(name, random_state=42):
+    # the run_model.py estimators (scaler pipelines, parameters from
+    # models/best_params.json when tune.py has written it), so both training
+    # paths report the same models
+    from run_model import build_estimator
+    if name not in ESTIMATORS:
+        raise ValueError(f"Unknown model: {name}")
+    return build_estimator(ESTIMATORS[name], random_state)
+
 
 def evaluate_model(name, model, X_test, y_test):
     """Evaluate model and return metrics"""
     y_pred = model.predict(X_test)
-    
-    # Calculate metrics
-    accuracy = accuracy_score(y_test, y_pred)
-    precision, recall, f1, _ = precision_recall_fscore_support(y_test, y_pred, average='weighted', zero_division=0)
-    
+
+    # Calculate metrics (all from one confusion matrix)
+    metrics = evaluate(y_test, y_pred)
+
     return {
         'model': name,
-        'accuracy': round(accuracy * 100, 2),
-        'precision': round(precision * 100, 2),
-        'recall': round(recall * 100, 2),
-        'f1_score': round(f1 * 100, 2)
-    }
-
-print("\n" + "=" * 80)
-print("1. K-NEAREST NEIGHBORS (KNN)")
-print("=" * 80)
-
-knn = KNeighborsClassifier(n_neighbors=5)
-knn.fit(X_train, y_train)
-joblib.dump(knn, "knn_model.pkl")
-knn_result = evaluate_model("KNN", knn, X_test, y_test)
-results.append(knn_result)
-print(f"[OK] Accuracy: {knn_result['accuracy']}%")
-print(f"[OK] F1-Score: {knn_result['f1_score']}%")
-
-print("\n" + "=" * 80)
-print("2. NAIVE BAYES CLASSIFIER")
-print("=" * 80)
-
-nb = GaussianNB()
-nb.fit(X_train, y_train)
-joblib.dump(nb, "naive_bayes_model.pkl")
-nb_result = evaluate_model("Naive Bayes", nb, X_test, y_test)
-results.append(nb_result)
-print(f"[OK] Accuracy: {nb_result['accuracy']}%")
-print(f"[OK] F1-Score: {nb_result['f1_score']}%")
-
-print("\n" + "=" * 80)
-print("3. DECISION TREE")
-print("=" * 80)
-
-dt = DecisionTreeClassifier(random_state=42, max_depth=10)
-dt.fit(X_train, y_train)
-joblib.dump(dt, "decision_tree_model.pkl")
-dt_result = evaluate_model("Decision Tree", dt, X_test, y_test)
-results.append(dt_result)
-print(f"[OK] Accuracy: {dt_result['accuracy']}%")
-print(f"[OK] F1-Score: {dt_result['f1_score']}%")
-
-print("\n" + "=" * 80)
-print("4. SUPPORT VECTOR MACHINE (SVM)")
-print("=" * 80)
-
-svm = SVC(kernel='rbf', random_state=42, probability=True)
-svm.fit(X_train, y_train)
-joblib.dump(svm, "svm_model.pkl")
-svm_result = evaluate_model("SVM", svm, X_test, y_test)
-results.append(svm_result)
-print(f"[OK] Accuracy: {svm_result['accuracy']}%")
-print(f"[OK] F1-Score: {svm_result['f1_score']}%")
-
-print("\n" + "=" * 80)
-print("5. BACKPROPAGATION NEURAL NETWORK")
-print("=" * 80)
-
-# MLPClassifier uses backpropagation
-nn = MLPClassifier(hidden_layer_sizes=(100, 50), max_iter=1000, random_state=42)
-nn.fit(X_train, y_train)
-joblib.dump(nn, "neural_network_model.pkl")
-nn_result = evaluate_model("Neural Network", nn, X_test, y_test)
-results.append(nn_result)
-print(f"[OK] Accuracy: {nn_result['accuracy']}%")
-print(f"[OK] F1-Score: {nn_result['f1_score']}%")
-
-print("\n" + "=" * 80)
-print("MODEL COMPARISON SUMMARY")
-print("=" * 80)
-
-# Create comparison DataFrame
-comparison_df = pd.DataFrame(results)
-comparison_df = comparison_df.sort_values('accuracy', ascending=False)
-
-print("\n" + comparison_df.to_string(index=False))
-
-# Find best model
-best_model = comparison_df.iloc[0]
-print(f"\n[BEST MODEL] {best_model['model']}")
-print(f"   Accuracy: {best_model['accuracy']}%")
-print(f"   F1-Score: {best_model['f1_score']}%")
-
-# Save results to JSON
-with open("model_results.json", "w") as f:
-    json.dump(results, f, indent=2)
-
-print("\n[OK] All models trained and saved!")
-print("[OK] Results saved to model_results.json")
+        'accuracy': round(metrics['accuracy'] * 100, 2),
+        'precision': round(metrics['precision_weighted'] * 100, 2),
+        'recall': round(metrics['recall_weighted'] * 100, 2),
+        'f1_score': round(metrics['f1_weighted'] * 100, 2)
+    }, y_pred
+
+
+def add_confidence_intervals(results, y_test, predictions, random_state=42):
+    """Bootstrap CIs (in %) into each result; returns the paired comparison between the models"""
+    n_resamples = int(os.environ.get("ML_BOOTSTRAP_RESAMPLES", "1000") or 1000)
+    comparison = compare(y_test, dict(zip([r['model'] for r in results], predictions)),
+                         n_resamples=n_resamples, seed=random_state)
+    for result in results:
+        ci = comparison['models'][result['model']]
+        result['ci95'] = {
+            'accuracy': [round(ci['accuracy']['low'] * 100, 2), round(ci['accuracy']['high'] * 100, 2)],
+            'f1_score': [round(ci['f1_weighted']['low'] * 100, 2), round(ci['f1_weighted']['high'] * 100, 2)],
+        }
+    return comparison
+
+
+def fit_and_save(name, artifact, X_train, y_train, X_test, y_test, random_state=42):
+    """Fit one model on in-memory arrays, save its artifact and return its metrics"""
+    model = build_model(name, random_state)
+    model.fit(X_train, y_train)
+    atomic_dump(model, artifact)
+    if mmap_enabled():
+        export_artifact(artifact)
+    # (metrics, test-set predictions)
+    return evaluate_model(name, model, X_test, y_test)
+
+
+def train_one(name, artifact, store_path, train_idx, test_idx, random_state=42):
+    """Fit one model, save its artifact right away and return its metrics"""
+    warnings.filterwarnings('ignore')
+    start = time.perf_counter()
+    # workers map the same feature store instead of receiving pickled copies
+    store = open_store(store_path)
+    X_train, y_train = store.X[train_idx], store.labels(train_idx)
+    X_test, y_test = store.X[test_idx], store.labels(test_idx)
+    result, y_pred = fit_and_save(name, artifact, X_train, y_train, X_test, y_test, random_state)
+    return result, time.perf_counter() - start, y_pred
+
+
+def train_all(store_path, train_idx, test_idx, jobs=1, random_state=42, artifact_dir="."):
+    """Train every model, concurrently when jobs > 1; results keep report order"""
+    split = (str(store_path), train_idx, test_idx, random_state)
+    artifacts = [(name, os.path.join(artifact_dir, artifact)) for _, name, artifact in MODELS]
+    if jobs == 1:
+        return [train_one(name, artifact, *split) for name, artifact in artifacts]
+
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(train_one, name, artifact, *split) for name, artifact in artifacts]
+        return [f.result() for f in futures]
+
+
+def parse_jobs(argv):
+    # --jobs N, otherwise ML_TRAIN_JOBS, otherwise one worker per model/core
+    jobs = int(os.environ.get("ML_TRAIN_JOBS", "0") or 0)
+    if "--jobs" in argv:
+        jobs = int(argv[argv.index("--jobs") + 1])
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return max(1, min(jobs, len(MODELS)))
+
+
+def main():
+    jobs = parse_jobs(sys.argv[1:])
+
+    print("=" * 80)
+    print("ML MODEL TRAINING AND COMPARISON")
+    print("=" * 80)
+
+    # Load dataset
+    print("\n[*] Loading dataset...")
+    store = open_store("student_scores.csv", label_column="performance")
+    print(f"Dataset shape: {(len(store), len(store.feature_names) + 1)}")
+    print("\nPerformance distribution:")
+    print(pd.Series(store.labels(), name="performance").value_counts())
+
+    # Split dataset (row indices; the same partition as splitting X and y)
+    train_idx, test_idx = train_test_split(np.arange(len(store)), test_size=0.2, random_state=42)
+    print(f"\nTraining samples: {len(train_idx)}")
+    print(f"Test samples: {len(test_idx)}")
+    print(f"Training workers: {jobs}")
+
+    # Store results for comparison
+    trained = train_all(store.path, train_idx, test_idx, jobs=jobs)
+    results = [result for result, _, _ in trained]
+    comparison = add_confidence_intervals(results, store.labels(test_idx), [y_pred for _, _, y_pred in trained])
+    # inference cost next to accuracy; the serving model is chosen from both
+    artifacts = {name: artifact for _, name, artifact in MODELS}
+    profile_results(results, ".", artifacts, store.X[np.sort(test_idx)])
+    manifest = select_from_results(results, ".", artifacts)
+
+    for (title, _, _), (result, seconds, _) in zip(MODELS, trained):
+        print("\n" + "=" * 80)
+        print(title)
+        print("=" * 80)
+        print(f"[OK] Accuracy: {result['accuracy']}%  (95% CI {result['ci95']['accuracy'][0]}-{result['ci95']['accuracy'][1]})")
+        print(f"[OK] F1-Score: {result['f1_score']}%  (95% CI {result['ci95']['f1_score'][0]}-{result['ci95']['f1_score'][1]})")
+        print(f"[OK] Trained in {seconds:.2f}s")
+        print(f"[OK] Single-row p99: {result['profile']['single']['p99_ms']} ms, memory: {result['profile']['memory_mb']} MB")
+
+    print("\n" + "=" * 80)
+    print("MODEL COMPARISON SUMMARY")
+    print("=" * 80)
+
+    # Create comparison DataFrame
+    comparison_df = pd.DataFrame([{**{k: r[k] for k in ('model', 'accuracy', 'precision', 'recall', 'f1_score')},
+                                   'p99_ms': r['profile']['single']['p99_ms'], 'memory_mb': r['profile']['memory_mb']}
+                                  for r in results])
+    comparison_df = comparison_df.sort_values('accuracy', ascending=False)
+
+    print("\n" + comparison_df.to_string(index=False))
+
+    # Find best model
+    best_model = comparison_df.iloc[0]
+    print(f"\n[BEST MODEL] {best_model['model']}")
+    print(f"   Accuracy: {best_model['accuracy']}%")
+    print(f"   F1-Score: {best_model['f1_score']}%")
+
+    # Paired bootstrap: is the ranking more than test-set noise?
+    print(f"\nAccuracy differences ({comparison['n_resamples']} bootstrap resamples, 95% CI):")
+    for pair in comparison['pairwise']:
+        if pair['metric'] != 'accuracy':
+            continue
+        verdict = "significant" if pair['significant'] else "not significant"
+        print(f"   {pair['a']} vs {pair['b']}: {pair['difference'] * 100:+.2f} "
+              f"[{pair['low'] * 100:+.2f}, {pair['high'] * 100:+.2f}] {verdict}")
+    print("   P(best): " + ", ".join(f"{m} {p:.0%}" for m, p in comparison['p_best']['accuracy'].items()))
+
+    policy = manifest['policy']
+    print(f"\n[SERVING] {manifest['serving']} (fallbacks: {', '.join(manifest['chain'][1:]) or 'none'}; "
+          f"budget p99 <= {policy['max_p99_ms']} ms, memory <= {policy['max_memory_mb']} MB)")
+    for name, reason in manifest['rejected'].items():
+        print(f"   {name}: {reason}")
+
+    # Save results to JSON
+    with open("model_results.json", "w") as f:
+        json.dump(results, f, indent=2)
+    with open("model_comparison.json", "w") as f:
+        json.dump(comparison, f, indent=2)
+
+    print("\n[OK] All models trained and saved!")
+    print("[OK] Results saved to model_results.json")
+    print("[OK] Serving model recorded in serving_manifest.json")
+
+
+if __name__ == "__main__":
+    main()
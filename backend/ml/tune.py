@@ -0,0 +1,286 @@
+# backend/ml/tune.py
+# Hyperparameter search for the run_model.py pipelines.
+#
+#   python tune.py [--dataset student_scores.csv] [--models knn svm ...]
+#                  [--folds 5] [--factor 3] [--min-resources 200]
+#                  [--scoring f1_macro|accuracy|balanced_accuracy] [--jobs N] [--no-apply]
+#
+# Successive halving: every candidate in SPACES is cross-validated on a small
+# stratified subsample, the best 1/factor move on to a subsample `factor` times
+# larger, until one candidate is left or the full dataset is used. The
+# (candidate, fold) fits of a round run in a process pool; workers map the
+# feature store instead of receiving pickled data.
+#
+# Each fold's score is cached under .cache/tune/ keyed by the dataset hash,
+# model, parameters, subsample size, fold and seed, so a re-run (another
+# --factor, an extra value in a grid) only fits what it has not seen before.
+# The winners go to models/best_params.json, which run_model.py applies the
+# next time it trains.
+#
+# The default score is macro F1: the SVM and MLP in model_results.json reach
+# 71% accuracy by always predicting the majority class (train_models.py used to
+# feed them unscaled features), which accuracy alone does not reveal.
+import os
+import sys
+import json
+import time
+import hashlib
+import itertools
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+CACHE_DIR = ML_DIR / ".cache" / "tune"
+BEST_PARAMS_PATH = ML_DIR / "models" / "best_params.json"
+SEED = 42
+
+# parameter grids per run_model.py estimator; keys are pipeline set_params names
+SPACES = {
+    "knn": {
+        "knn__n_neighbors": [3, 5, 7, 11, 15, 21, 31],
+    },
+    "naive_bayes": {
+        "nb__var_smoothing": [1e-9, 1e-8, 1e-7, 1e-6, 1e-5],
+    },
+    "decision_tree": {
+        "max_depth": [4, 6, 8, 10, 14, None],
+        "min_samples_leaf": [1, 5, 20],
+    },
+    "svm": {
+        "svm__C": [0.1, 1.0, 10.0, 100.0],
+        "svm__gamma": ["scale", 0.01, 0.1, 1.0],
+    },
+    "neural_network": {
+        "mlp__hidden_layer_sizes": [(32,), (64, 32), (100, 50)],
+        "mlp__alpha": [1e-4, 1e-3, 1e-2],
+    },
+}
+
+
+def candidates(space):
+    keys = sorted(space)
+    return [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+
+
+def to_json_params(params):
+    return {k: list(v) if isinstance(v, tuple) else v for k, v in params.items()}
+
+
+def from_json_params(params):
+    # JSON has no tuples; hidden_layer_sizes and friends expect one
+    return {k: tuple(v) if isinstance(v, list) else v for k, v in params.items()}
+
+
+def dataset_hash(store):
+    digest = store.meta.get("source_sha256")
+    if digest:
+        return digest
+    # data_generator.py --format npy directories have no source file
+    from model_registry import file_sha256
+    return hashlib.sha256((file_sha256(store.path / "features.npy") +
+                           file_sha256(store.path / "labels.npy")).encode()).hexdigest()
+
+
+def fold_key(data_hash, model, params, n_samples, fold, folds, scoring, seed):
+    blob = json.dumps([data_hash, model, to_json_params(params), n_samples, fold, folds, scoring, seed],
+                      sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _cache_path(key):
+    return CACHE_DIR / key[:2] / f"{key}.json"
+
+
+def cached_fold(key):
+    try:
+        return json.loads(_cache_path(key).read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def store_fold(key, result):
+    path = _cache_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(result))
+    os.replace(tmp, path)
+
+
+def subsample(y, n, seed=SEED):
+    """First n indices of a fixed stratified ordering: nested across rounds, same on every run"""
+    import numpy as np
+    if n >= len(y):
+        return np.arange(len(y))
+    from sklearn.model_selection import train_test_split
+    idx, _ = train_test_split(np.arange(len(y)), train_size=n, random_state=seed, stratify=y)
+    return np.sort(idx)
+
+
+# ---------------------------------------------------------------
+# worker
+# ---------------------------------------------------------------
+
+def fit_fold(store_path, model, params, n_samples, fold, folds, scoring, seed=SEED):
+    import warnings
+    from sklearn.metrics import get_scorer
+    from sklearn.model_selection import StratifiedKFold
+    from feature_store import open_store
+    from run_model import build_estimator
+    warnings.filterwarnings("ignore")
+
+    store = open_store(store_path)
+    y_all = store.labels()
+    idx = subsample(y_all, n_samples, seed)
+    X, y = store.X[idx], y_all[idx]
+    train, test = list(StratifiedKFold(folds, shuffle=True, random_state=seed).split(X, y))[fold]
+
+    estimator = build_estimator(model, seed, tuned=False).set_params(**params)
+    started = time.perf_counter()
+    estimator.fit(X[train], y[train])
+    fit_s = time.perf_counter() - started
+    return {"score": float(get_scorer(scoring)(estimator, X[test], y[test])), "fit_s": round(fit_s, 4)}
+
+
+# ---------------------------------------------------------------
+# successive halving
+# ---------------------------------------------------------------
+
+def _run_round(pool, store_path, model, data_hash, cands, n_samples, folds, scoring, stats):
+    import numpy as np
+    pending, scores = {}, np.zeros((len(cands), folds))
+    for c, params in enumerate(cands):
+        for fold in range(folds):
+            key = fold_key(data_hash, model, params, n_samples, fold, folds, scoring, SEED)
+            hit = cached_fold(key)
+            if hit is not None:
+                stats["cache_hits"] += 1
+                scores[c, fold] = hit["score"]
+            elif pool is None:
+                result = fit_fold(store_path, model, params, n_samples, fold, folds, scoring)
+                store_fold(key, result)
+                stats["fits"] += 1
+                scores[c, fold] = result["score"]
+            else:
+                pending[pool.submit(fit_fold, store_path, model, params, n_samples, fold, folds, scoring)] = (c, fold, key)
+    for future, (c, fold, key) in pending.items():
+        result = future.result()
+        store_fold(key, result)
+        stats["fits"] += 1
+        scores[c, fold] = result["score"]
+    return scores
+
+
+def halving_search(store_path, model, folds=5, factor=3, min_resources=200, scoring="f1_macro", pool=None, progress=None):
+    import numpy as np
+    from feature_store import open_store
+    store = open_store(store_path)
+    data_hash = dataset_hash(store)
+    n_total = len(store)
+    cands = candidates(SPACES[model])
+    stats = {"fits": 0, "cache_hits": 0}
+    # every fold needs at least one row per class in its validation part
+    n_samples = min(n_total, max(min_resources, folds * len(store.classes) * 2))
+    rounds = []
+    started = time.perf_counter()
+
+    while True:
+        scores = _run_round(pool, store_path, model, data_hash, cands, n_samples, folds, scoring, stats)
+        means = scores.mean(axis=1)
+        order = np.argsort(-means, kind="stable")
+        rounds.append({
+            "n_samples": int(n_samples),
+            "candidates": len(cands),
+            "best_score": round(float(means[order[0]]), 4),
+            "best_params": to_json_params(cands[order[0]]),
+        })
+        if progress:
+            progress(model, rounds[-1])
+        if len(cands) == 1 or n_samples >= n_total:
+            break
+        keep = max(1, int(np.ceil(len(cands) / factor)))
+        cands = [cands[i] for i in order[:keep]]
+        n_samples = min(n_total, n_samples * factor)
+
+    best = order[0]
+    return {
+        "params": to_json_params(cands[best]),
+        "score": round(float(means[best]), 4),
+        "score_std": round(float(scores[best].std()), 4),
+        "scoring": scoring,
+        "n_samples": int(n_samples),
+        "data_sha256": data_hash,
+        "rounds": rounds,
+        "seconds": round(time.perf_counter() - started, 2),
+        **stats,
+    }
+
+
+def tune(dataset=None, models=None, folds=5, factor=3, min_resources=200, scoring="f1_macro", jobs=None, apply=True, progress=None):
+    from feature_store import build_store
+    store_path = str(build_store(dataset or ML_DIR / "student_scores.csv"))
+    models = models or list(SPACES)
+    unknown = [m for m in models if m not in SPACES]
+    if unknown:
+        raise ValueError(f"No search space for: {', '.join(unknown)}")
+
+    if not jobs or jobs <= 0:
+        # candidates x folds is far more tasks than models, so no cap at five here
+        jobs = int(os.environ.get("ML_TRAIN_JOBS", "0") or 0) or os.cpu_count() or 1
+    results = {}
+    if jobs == 1:
+        for model in models:
+            results[model] = halving_search(store_path, model, folds, factor, min_resources, scoring, None, progress)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for model in models:
+                results[model] = halving_search(store_path, model, folds, factor, min_resources, scoring, pool, progress)
+
+    if apply:
+        save_best_params(results)
+    return {"dataset": store_path, "jobs": jobs, "results": results}
+
+
+def save_best_params(results, path=BEST_PARAMS_PATH):
+    path = Path(path)
+    try:
+        best = json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        best = {}
+    for model, res in results.items():
+        best[model] = {k: res[k] for k in ("params", "score", "scoring", "data_sha256")}
+    path.parent.mkdir(exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(best, indent=2))
+    os.replace(tmp, path)
+
+
+def load_best_params(model, path=BEST_PARAMS_PATH):
+    try:
+        entry = json.loads(Path(path).read_text()).get(model)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return from_json_params(entry["params"]) if entry else {}
+
+
+def _print_progress(model, round_info):
+    print(f"  {model:<16} n={round_info['n_samples']:<7} candidates={round_info['candidates']:<3} "
+          f"best={round_info['best_score']:.4f} {round_info['best_params']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Successive-halving hyperparameter search")
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--models", nargs="+", default=None, choices=list(SPACES))
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--factor", type=int, default=3)
+    parser.add_argument("--min-resources", type=int, default=200)
+    parser.add_argument("--scoring", default="f1_macro")
+    parser.add_argument("--jobs", type=int, default=None)
+    parser.add_argument("--no-apply", action="store_true", help="do not write models/best_params.json")
+    args = parser.parse_args()
+    if args.factor < 2:
+        parser.error("--factor must be at least 2")
+    report = tune(args.dataset, args.models, args.folds, args.factor, args.min_resources,
+                  args.scoring, args.jobs, not args.no_apply, progress=_print_progress)
+    print(json.dumps({"success": True, **report}, indent=2))
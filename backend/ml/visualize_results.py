@@ -1,152 +1,302 @@
+# backend/ml/visualize_results.py
+# Comparison charts for model_results.json.
+#
+#   python visualize_results.py [--background] [--dpi 300] [--force]
+#
+# Besides model_comparison_charts.png this writes model_chart_spec.json (the
+# numbers, labels and colours, for the frontend to draw itself) and
+# model_comparison_charts.svg (a small grouped bar chart); both take
+# milliseconds and need no matplotlib.
+#
+# The PNG is content-addressed: it is rendered once per hash of
+# (model_results.json, dpi, chart layout) into .cache/charts/<hash>.png and
+# then linked into place, so re-running on unchanged results skips matplotlib
+# entirely. --background hands a missing render to a detached process and
+# returns at once. Rendering always uses the non-interactive Agg backend;
+# set MATPLOTLIB_SHOW=1 to open a window as well.
 import os
-import matplotlib.pyplot as plt
-import pandas as pd
+import sys
 import json
-import numpy as np
-
-print("=" * 80)
-print("MODEL PERFORMANCE VISUALIZATION")
-print("=" * 80)
-
-# Load results
-with open("model_results.json", "r") as f:
-    results = json.load(f)
-
-df = pd.DataFrame(results)
-
-# Set up the plotting style
-plt.style.use('seaborn-v0_8-darkgrid')
-fig = plt.figure(figsize=(16, 10))
-
-# 1. Accuracy Comparison Bar Chart
-ax1 = plt.subplot(2, 3, 1)
-bars = ax1.bar(df['model'], df['accuracy'], color=['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6'])
-ax1.set_title('Model Accuracy Comparison', fontsize=14, fontweight='bold')
-ax1.set_ylabel('Accuracy (%)', fontsize=12)
-ax1.set_ylim(0, 100)
-ax1.grid(axis='y', alpha=0.3)
-
-# Add value labels on bars
-for bar in bars:
-    height = bar.get_height()
-    ax1.text(bar.get_x() + bar.get_width()/2., height,
-             f'{height}%',
-             ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-plt.setp(ax1.xaxis.get_majorticklabels(), rotation=45, ha='right')
-
-# 2. Precision Comparison
-ax2 = plt.subplot(2, 3, 2)
-bars = ax2.bar(df['model'], df['precision'], color=['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6'])
-ax2.set_title('Model Precision Comparison', fontsize=14, fontweight='bold')
-ax2.set_ylabel('Precision (%)', fontsize=12)
-ax2.set_ylim(0, 100)
-ax2.grid(axis='y', alpha=0.3)
-
-for bar in bars:
-    height = bar.get_height()
-    ax2.text(bar.get_x() + bar.get_width()/2., height,
-             f'{height}%',
-             ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-plt.setp(ax2.xaxis.get_majorticklabels(), rotation=45, ha='right')
-
-# 3. Recall Comparison
-ax3 = plt.subplot(2, 3, 3)
-bars = ax3.bar(df['model'], df['recall'], color=['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6'])
-ax3.set_title('Model Recall Comparison', fontsize=14, fontweight='bold')
-ax3.set_ylabel('Recall (%)', fontsize=12)
-ax3.set_ylim(0, 100)
-ax3.grid(axis='y', alpha=0.3)
-
-for bar in bars:
-    height = bar.get_height()
-    ax3.text(bar.get_x() + bar.get_width()/2., height,
-             f'{height}%',
-             ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-plt.setp(ax3.xaxis.get_majorticklabels(), rotation=45, ha='right')
-
-# 4. F1-Score Comparison
-ax4 = plt.subplot(2, 3, 4)
-bars = ax4.bar(df['model'], df['f1_score'], color=['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6'])
-ax4.set_title('Model F1-Score Comparison', fontsize=14, fontweight='bold')
-ax4.set_ylabel('F1-Score (%)', fontsize=12)
-ax4.set_ylim(0, 100)
-ax4.grid(axis='y', alpha=0.3)
-
-for bar in bars:
-    height = bar.get_height()
-    ax4.text(bar.get_x() + bar.get_width()/2., height,
-             f'{height}%',
-             ha='center', va='bottom', fontsize=10, fontweight='bold')
-
-plt.setp(ax4.xaxis.get_majorticklabels(), rotation=45, ha='right')
-
-# 5. Comprehensive Metrics Comparison (Grouped Bar Chart)
-ax5 = plt.subplot(2, 3, 5)
-x = np.arange(len(df['model']))
-width = 0.2
-
-ax5.bar(x - 1.5*width, df['accuracy'], width, label='Accuracy', color='#3498db')
-ax5.bar(x - 0.5*width, df['precision'], width, label='Precision', color='#2ecc71')
-ax5.bar(x + 0.5*width, df['recall'], width, label='Recall', color='#e74c3c')
-ax5.bar(x + 1.5*width, df['f1_score'], width, label='F1-Score', color='#f39c12')
-
-ax5.set_title('All Metrics Comparison', fontsize=14, fontweight='bold')
-ax5.set_ylabel('Score (%)', fontsize=12)
-ax5.set_xlabel('Models', fontsize=12)
-ax5.set_xticks(x)
-ax5.set_xticklabels(df['model'], rotation=45, ha='right')
-ax5.legend(loc='upper left')
-ax5.set_ylim(0, 100)
-ax5.grid(axis='y', alpha=0.3)
-
-# 6. Model Performance Radar Chart
-ax6 = plt.subplot(2, 3, 6, projection='polar')
-
-categories = ['Accuracy', 'Precision', 'Recall', 'F1-Score']
-N = len(categories)
-
-# Calculate angles for each metric
-angles = [n / float(N) * 2 * np.pi for n in range(N)]
-angles += angles[:1]  # Complete the circle
-
-# Create subplot for each model
-colors = ['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6']
-for idx, row in df.iterrows():
-    values = [
-        row['accuracy'],
-        row['precision'],
-        row['recall'],
-        row['f1_score']
+import hashlib
+import subprocess
+from pathlib import Path
+
+ML_DIR = Path(__file__).parent
+RESULTS_PATH = ML_DIR / "model_results.json"
+PNG_PATH = ML_DIR / "model_comparison_charts.png"
+SVG_PATH = ML_DIR / "model_comparison_charts.svg"
+SPEC_PATH = ML_DIR / "model_chart_spec.json"
+CHART_CACHE_DIR = ML_DIR / ".cache" / "charts"
+# bump when the chart layout changes so cached renders are redrawn
+CHART_VERSION = 1
+
+COLORS = ['#3498db', '#2ecc71', '#e74c3c', '#f39c12', '#9b59b6']
+METRICS = [("accuracy", "Accuracy"), ("precision", "Precision"), ("recall", "Recall"), ("f1_score", "F1-Score")]
+
+
+def chart_hash(results, dpi):
+    # canonical JSON, so a pipeline handing the results over in memory gets the same hash as the file;
+    # only the charted values count, so fresh timings in "profile" do not force a re-render
+    charted = [{key: r[key] for key in ["model"] + [k for k, _ in METRICS]} for r in results]
+    blob = json.dumps([CHART_VERSION, dpi, charted], sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _atomic_write(path, text):
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _publish(src, dst):
+    # hard link where possible: the cached render is never rewritten, so sharing the inode is safe
+    if dst.exists() and os.path.samefile(src, dst):
+        return
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    try:
+        os.link(src, tmp)
+    except OSError:
+        import shutil
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+# ---------------------------------------------------------------
+# spec and SVG (no matplotlib)
+# ---------------------------------------------------------------
+
+def chart_spec(results, digest):
+    return {
+        "source_sha256": digest,
+        "title": "Machine Learning Model Performance Comparison",
+        "subtitle": "Student Performance Prediction",
+        "unit": "%",
+        "y_range": [0, 100],
+        "models": [r["model"] for r in results],
+        "colors": {r["model"]: COLORS[i % len(COLORS)] for i, r in enumerate(results)},
+        "metrics": [{"key": key, "label": label, "color": COLORS[i]} for i, (key, label) in enumerate(METRICS)],
+        "values": {key: [r[key] for r in results] for key, _ in METRICS},
+        "png": PNG_PATH.name,
+    }
+
+
+def _esc(text):
+    return str(text).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def render_svg(spec, width=720, height=360):
+    left, right, top, bottom = 48, 16, 40, 64
+    plot_w, plot_h = width - left - right, height - top - bottom
+    models, metrics = spec["models"], spec["metrics"]
+    group_w = plot_w / max(1, len(models))
+    bar_w = group_w * 0.8 / len(metrics)
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="11">',
+        f'<text x="{width / 2}" y="20" text-anchor="middle" font-size="14" font-weight="bold">'
+        f'{_esc(spec["title"])}</text>',
     ]
-    values += values[:1]  # Complete the circle
-    
-    ax6.plot(angles, values, 'o-', linewidth=2, label=row['model'], color=colors[idx])
-    ax6.fill(angles, values, alpha=0.1, color=colors[idx])
-
-ax6.set_xticks(angles[:-1])
-ax6.set_xticklabels(categories)
-ax6.set_ylim(0, 100)
-ax6.set_title('Performance Radar Chart', fontsize=14, fontweight='bold', pad=20)
-ax6.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))
-
-# Add overall title
-fig.suptitle('Machine Learning Model Performance Comparison\nStudent Performance Prediction', 
-             fontsize=16, fontweight='bold', y=0.995)
-
-# Adjust layout
-plt.tight_layout()
-
-# Save the figure
-output_file = 'model_comparison_charts.png'
-plt.savefig(output_file, dpi=300, bbox_inches='tight')
-print(f"\n[OK] Visualization saved to: {output_file}")
-
-if os.environ.get("DISPLAY") or os.environ.get("MATPLOTLIB_SHOW") == "1":
-    plt.show()
-
-print("\n" + "=" * 80)
-print("VISUALIZATION COMPLETE")
-print("=" * 80)
+    for tick in range(0, 101, 20):
+        y = top + plot_h * (1 - tick / 100)
+        parts.append(f'<line x1="{left}" x2="{width - right}" y1="{y:.1f}" y2="{y:.1f}" stroke="#ddd"/>')
+        parts.append(f'<text x="{left - 6}" y="{y + 4:.1f}" text-anchor="end">{tick}</text>')
+    for i, model in enumerate(models):
+        x0 = left + i * group_w + group_w * 0.1
+        for j, metric in enumerate(metrics):
+            value = spec["values"][metric["key"]][i]
+            h = plot_h * max(0.0, min(value, 100)) / 100
+            parts.append(f'<rect x="{x0 + j * bar_w:.1f}" y="{top + plot_h - h:.1f}" width="{bar_w:.1f}" '
+                         f'height="{h:.1f}" fill="{metric["color"]}"><title>{_esc(model)} '
+                         f'{_esc(metric["label"])}: {value}%</title></rect>')
+        parts.append(f'<text x="{left + (i + 0.5) * group_w:.1f}" y="{top + plot_h + 16}" '
+                     f'text-anchor="middle">{_esc(model)}</text>')
+    legend_x = left
+    for metric in metrics:
+        parts.append(f'<rect x="{legend_x}" y="{height - 20}" width="10" height="10" fill="{metric["color"]}"/>')
+        parts.append(f'<text x="{legend_x + 14}" y="{height - 11}">{_esc(metric["label"])}</text>')
+        legend_x += 90
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+# ---------------------------------------------------------------
+# PNG (matplotlib)
+# ---------------------------------------------------------------
+
+def render_png(results, output_file, dpi=300):
+    import matplotlib
+    if os.environ.get("MATPLOTLIB_SHOW") != "1":
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import numpy as np
+    import pandas as pd
+
+    df = pd.DataFrame(results)
+
+    # Set up the plotting style
+    plt.style.use('seaborn-v0_8-darkgrid')
+    fig = plt.figure(figsize=(16, 10))
+
+    # 1-4. Accuracy, Precision, Recall and F1-Score comparison bar charts
+    for position, (key, label) in enumerate(METRICS, start=1):
+        ax = plt.subplot(2, 3, position)
+        bars = ax.bar(df['model'], df[key], color=COLORS)
+        ax.set_title(f'Model {label} Comparison', fontsize=14, fontweight='bold')
+        ax.set_ylabel(f'{label} (%)', fontsize=12)
+        ax.set_ylim(0, 100)
+        ax.grid(axis='y', alpha=0.3)
+
+        # Add value labels on bars
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height,
+                    f'{height}%',
+                    ha='center', va='bottom', fontsize=10, fontweight='bold')
+
+        plt.setp(ax.xaxis.get_majorticklabels(), rotation=45, ha='right')
+
+    # 5. Comprehensive Metrics Comparison (Grouped Bar Chart)
+    ax5 = plt.subplot(2, 3, 5)
+    x = np.arange(len(df['model']))
+    width = 0.2
+
+    for offset, (key, label), color in zip((-1.5, -0.5, 0.5, 1.5), METRICS, COLORS):
+        ax5.bar(x + offset*width, df[key], width, label=label, color=color)
+
+    ax5.set_title('All Metrics Comparison', fontsize=14, fontweight='bold')
+    ax5.set_ylabel('Score (%)', fontsize=12)
+    ax5.set_xlabel('Models', fontsize=12)
+    ax5.set_xticks(x)
+    ax5.set_xticklabels(df['model'], rotation=45, ha='right')
+    ax5.legend(loc='upper left')
+    ax5.set_ylim(0, 100)
+    ax5.grid(axis='y', alpha=0.3)
+
+    # 6. Model Performance Radar Chart
+    ax6 = plt.subplot(2, 3, 6, projection='polar')
+
+    categories = [label for _, label in METRICS]
+    N = len(categories)
+
+    # Calculate angles for each metric
+    angles = [n / float(N) * 2 * np.pi for n in range(N)]
+    angles += angles[:1]  # Complete the circle
+
+    for idx, row in df.iterrows():
+        values = [row[key] for key, _ in METRICS]
+        values += values[:1]  # Complete the circle
+
+        ax6.plot(angles, values, 'o-', linewidth=2, label=row['model'], color=COLORS[idx % len(COLORS)])
+        ax6.fill(angles, values, alpha=0.1, color=COLORS[idx % len(COLORS)])
+
+    ax6.set_xticks(angles[:-1])
+    ax6.set_xticklabels(categories)
+    ax6.set_ylim(0, 100)
+    ax6.set_title('Performance Radar Chart', fontsize=14, fontweight='bold', pad=20)
+    ax6.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))
+
+    # Add overall title
+    fig.suptitle('Machine Learning Model Performance Comparison\nStudent Performance Prediction',
+                 fontsize=16, fontweight='bold', y=0.995)
+
+    # Adjust layout
+    plt.tight_layout()
+
+    plt.savefig(output_file, dpi=dpi, bbox_inches='tight', format='png')
+
+    if os.environ.get("MATPLOTLIB_SHOW") == "1":
+        plt.show()
+    plt.close(fig)
+
+
+def ensure_png(results, digest, dpi):
+    """Render the PNG for digest unless it is cached, then put it in place; True if rendered"""
+    cached = CHART_CACHE_DIR / f"{digest}.png"
+    rendered = False
+    if not cached.exists():
+        CHART_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        # one renderer per hash; a second one waits and then finds the cached file
+        with open(CHART_CACHE_DIR / f"{digest}.lock", "w") as lock:
+            try:
+                import fcntl
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            except ImportError:
+                pass
+            if not cached.exists():
+                tmp = cached.with_name(f".{cached.name}.{os.getpid()}.tmp")
+                render_png(results, tmp, dpi)
+                os.replace(tmp, cached)
+                rendered = True
+    _publish(cached, PNG_PATH)
+    return rendered
+
+
+def spawn_background(dpi):
+    args = [sys.executable, str(Path(__file__).resolve()), "--png-only", "--dpi", str(dpi)]
+    kwargs = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL,
+              "cwd": str(ML_DIR)}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    return subprocess.Popen(args, **kwargs).pid
+
+
+def visualize(results, dpi=300, background=False):
+    """Write the spec and SVG and put the PNG in place; returns how the PNG was produced"""
+    digest = chart_hash(results, dpi)
+    spec = chart_spec(results, digest)
+    _atomic_write(SPEC_PATH, json.dumps(spec, indent=2))
+    _atomic_write(SVG_PATH, render_svg(spec))
+
+    cached = CHART_CACHE_DIR / f"{digest}.png"
+    if cached.exists():
+        _publish(cached, PNG_PATH)
+        png = "cached"
+    elif background:
+        spawn_background(dpi)
+        png = "background"
+    else:
+        ensure_png(results, digest, dpi)
+        png = "rendered"
+    return {"sha256": digest, "png": png}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Model comparison charts")
+    parser.add_argument("--background", action="store_true", help="render a missing PNG in a detached process")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--force", action="store_true", help="re-render even if a cached PNG exists")
+    parser.add_argument("--png-only", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    results = json.loads(RESULTS_PATH.read_text())
+    digest = chart_hash(results, args.dpi)
+    if args.force:
+        (CHART_CACHE_DIR / f"{digest}.png").unlink(missing_ok=True)
+
+    if args.png_only:
+        ensure_png(results, digest, args.dpi)
+        return
+
+    print("=" * 80)
+    print("MODEL PERFORMANCE VISUALIZATION")
+    print("=" * 80)
+
+    outcome = visualize(results, args.dpi, args.background)
+    print(f"\n[OK] Chart spec saved to: {SPEC_PATH.name} ({SVG_PATH.name})")
+    if outcome["png"] == "cached":
+        print(f"[OK] Results unchanged, reused cached chart: {PNG_PATH.name}")
+    elif outcome["png"] == "background":
+        print(f"[..] Rendering {PNG_PATH.name} in the background")
+    else:
+        print(f"[OK] Visualization saved to: {PNG_PATH.name}")
+
+    print("\n" + "=" * 80)
+    print("VISUALIZATION COMPLETE")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
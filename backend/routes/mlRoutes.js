@@ -53,27 +53,28 @@ router.post("/train", auth, async (req, res) => {
     
     console.log("🚀 Starting ML model training...");
 
-    // Step 1: Generate training data
-    console.log("📊 Step 1: Generating training data...");
-    await runPythonScript(path.join(mlDir, "data_generator.py"), [], mlDir);
-
-    // Step 2: Train all models (KNN, Naive Bayes, Decision Tree, SVM, Neural Network)
-    console.log("🧠 Step 2: Training all ML models...");
-    await runPythonScript(path.join(mlDir, "train_models.py"), [], mlDir);
-
-    // Step 3: Generate visualization charts
-    console.log("📈 Step 3: Generating visualization charts...");
-    await runPythonScript(path.join(mlDir, "visualize_results.py"), [], mlDir);
+    // Data generation, training of all 5 models and the charts run as one
+    // pipeline process; stages whose inputs are unchanged are skipped
+    // (the chart PNG, if not cached yet, renders in the background)
+    const output = await runPythonScript(path.join(mlDir, "pipeline.py"), ["--background-charts"], mlDir);
+    const pipeline = JSON.parse(output);
+    pipeline.stages.forEach(s => console.log(`   ${s.stage}: ${s.status} in ${s.seconds}s`));
 
     // Read results
     const resultsPath = path.join(mlDir, "model_results.json");
     const chartPath = path.join(mlDir, "model_comparison_charts.png");
+    const chartSpecPath = path.join(mlDir, "model_chart_spec.json");
     
     let results = [];
     if (fs.existsSync(resultsPath)) {
       results = JSON.parse(fs.readFileSync(resultsPath, "utf-8"));
     }
 
+    let chartSpec = null;
+    if (fs.existsSync(chartSpecPath)) {
+      chartSpec = JSON.parse(fs.readFileSync(chartSpecPath, "utf-8"));
+    }
+
     console.log("✅ Training completed successfully!");
 
     res.json({
@@ -81,6 +82,9 @@ router.post("/train", auth, async (req, res) => {
       message: "All ML models trained successfully",
       results: results,
       chartGenerated: fs.existsSync(chartPath),
+      chartSpec: chartSpec,
+      pipeline: pipeline.stages,
+      serving: pipeline.serving,
       models: results.map(r => r.model)
     });
 
@@ -115,6 +119,27 @@ router.get("/results", auth, (req, res) => {
   }
 });
 
+// ==============================
+// GET /api/ml/serving
+// Model chosen for predictions (accuracy within the latency/memory budget),
+// its fallback chain and every model's inference profile
+// ==============================
+router.get("/serving", auth, (req, res) => {
+  try {
+    const manifestPath = path.join(__dirname, "..", "ml", "serving_manifest.json");
+
+    if (!fs.existsSync(manifestPath)) {
+      return res.json({ serving: "KNN", chain: ["KNN"], note: "No serving manifest yet; train the models first" });
+    }
+
+    res.json(JSON.parse(fs.readFileSync(manifestPath, "utf-8")));
+
+  } catch (err) {
+    console.error("❌ Error reading serving manifest:", err);
+    res.status(500).json({ error: "Failed to read serving manifest" });
+  }
+});
+
 // ==============================
 // GET /api/ml/chart
 // Serve visualization chart image
@@ -135,6 +160,55 @@ router.get("/chart", auth, (req, res) => {
   }
 });
 
+// ==============================
+// GET /api/ml/chart-spec
+// Chart data for the frontend to draw (?format=svg for a ready-made SVG)
+// ==============================
+router.get("/chart-spec", auth, (req, res) => {
+  try {
+    const mlDir = path.join(__dirname, "..", "ml");
+    const wantSvg = req.query.format === "svg";
+    const specPath = path.join(mlDir, wantSvg ? "model_comparison_charts.svg" : "model_chart_spec.json");
+
+    if (!fs.existsSync(specPath)) {
+      return res.status(404).json({ error: "Chart not found. Please train models first." });
+    }
+
+    if (wantSvg) {
+      res.type("image/svg+xml");
+      return res.sendFile(specPath);
+    }
+    res.json(JSON.parse(fs.readFileSync(specPath, "utf-8")));
+
+  } catch (err) {
+    console.error("❌ Error serving chart spec:", err);
+    res.status(500).json({ error: "Failed to serve chart spec" });
+  }
+});
+
+// ==============================
+// GET /api/ml/metrics
+// Prometheus text metrics written by the Python ML scripts
+// (requests run with timings enabled, see ml/instrumentation.py)
+// ==============================
+router.get("/metrics", auth, (req, res) => {
+  try {
+    const metricsPath = process.env.ML_METRICS_PATH ||
+      path.join(__dirname, "..", "ml", ".cache", "metrics", "ml.prom");
+
+    res.type("text/plain; version=0.0.4");
+    if (!fs.existsSync(metricsPath)) {
+      return res.send("");
+    }
+
+    res.send(fs.readFileSync(metricsPath, "utf-8"));
+
+  } catch (err) {
+    console.error("❌ Error reading ML metrics:", err);
+    res.status(500).json({ error: "Failed to read metrics" });
+  }
+});
+
 // ==============================
 // POST /api/ml/predict-performance
 // Predict student performance using KNN model